@@ -0,0 +1,139 @@
+import argparse
+import sys
+import time
+from ChessGame import play_move
+from ChessPosition import START_FEN, board_from_fen, board_to_fen, move_to_text, move_from_text
+from ChessEngine import Searcher, get_search_moves, is_in_check, moves_to_mate
+from ChessTactics import get_legal_captures
+from ChessArchive import GameArchiveReader
+
+# Share of a ply's time that is kept in reserve, since a depth that has started is only stopped at the deadline
+TIME_RESERVE = 0.1
+
+
+# The analysis of one position: the best lines found (SearchResults, best first), the move that was played there (if
+# it comes from a recorded game), and how long the analysis took.
+class PlyAnalysis:
+    def __init__(self, ply, fen, played_move, lines, elapsed):
+        self._ply = ply
+        self._fen = fen
+        self._played_move = played_move
+        self._lines = lines
+        self._elapsed = elapsed
+
+    # Number of moves played before this position (0 for the starting position)
+    def get_ply(self):
+        return self._ply
+
+    def get_fen(self):
+        return self._fen
+
+    def get_played_move(self):
+        return self._played_move
+
+    def get_lines(self):
+        return self._lines
+
+    def get_elapsed(self):
+        return self._elapsed
+
+
+# Estimates how much thought a position needs, so the time budget can be shared out: positions with more moves, more
+# captures to look at, or a king in check get more time. A position with one move (or none) needs next to none.
+def get_complexity(board, is_white_turn, move_count):
+    move_total = len(get_search_moves(board, is_white_turn, move_count))
+    if move_total <= 1:
+        return move_total * 0.1
+    capture_total = len(get_legal_captures(board, is_white_turn, move_count))
+    return move_total + 2 * capture_total + (10 if is_in_check(board, is_white_turn, move_count) else 0)
+
+
+# Analyses a sequence of positions: a starting position (FEN) and the moves played from it. Finds the best line_count
+# lines of every position before each move (and the final one), sharing total_time seconds between them according to
+# how complex each one is. Time a position doesn't use is passed on to the ones after it. Each position is searched
+# one depth deeper at a time until its share runs out (or max_depth is reached). A PlyAnalysis is yielded as soon as
+# each position is done, so results can be shown while the rest of the game is being analysed.
+# total_time only covers the searches: the clock starts once the game has been replayed and every position's
+# complexity is known, so a long game doesn't lose part of its budget before the first search.
+def analyse_game(moves, line_count=3, total_time=60.0, fen=START_FEN, max_depth=None, searcher=None):
+    searcher = searcher if searcher is not None else Searcher()
+
+    # Replay the game first, to know every position and how complex it is
+    board, is_white_turn, move_count, halfmove_clock = board_from_fen(fen)
+    positions = []
+    for move in moves + [None]:
+        positions.append((board_to_fen(board, is_white_turn, move_count), move,
+                          get_complexity(board, is_white_turn, move_count)))
+        if move is not None:
+            play_move(board, move[0], move[1], move_count, move[2])
+            is_white_turn = not is_white_turn
+            move_count += 1
+
+    deadline = time.monotonic() + total_time
+    remaining_complexity = sum(complexity for position_fen, move, complexity in positions)
+    for ply, (position_fen, played_move, complexity) in enumerate(positions):
+
+        # This position's share of the time that is left
+        time_left = max(deadline - time.monotonic(), 0)
+        share = time_left * complexity / remaining_complexity if remaining_complexity > 0 else 0
+        remaining_complexity -= complexity
+
+        start_time = time.monotonic()
+        board, is_white_turn, move_count, halfmove_clock = board_from_fen(position_fen)
+        lines = searcher.analyse(board, is_white_turn, move_count, line_count, max_depth,
+                                 start_time + share * (1 - TIME_RESERVE))
+        yield PlyAnalysis(ply, position_fen, played_move, lines, time.monotonic() - start_time)
+
+
+# Formats a score from the point of view of the side to move, i.e. "+0.35" or "mate 3"
+def format_score(score):
+    mate = moves_to_mate(score)
+    if mate is not None:
+        return f"mate {mate}"
+    return f"{score / 100:+.2f}"
+
+
+# Prints the analysis of a position: the move played (and whether it was among the best lines), then each line
+def print_ply_analysis(analysis, output=sys.stdout):
+    lines = analysis.get_lines()
+    played_move = analysis.get_played_move()
+    depth = lines[0].get_depth() if lines else 0
+
+    heading = f"Ply {analysis.get_ply()}"
+    if played_move is not None:
+        best_moves = [line.get_best_move() for line in lines]
+        rank = f"line {best_moves.index(played_move) + 1}" if played_move in best_moves else "not among the best lines"
+        heading += f", played {move_to_text(played_move)} ({rank})"
+    output.write(f"{heading}, depth {depth}, {analysis.get_elapsed():.1f}s\n")
+
+    if not lines:
+        output.write("    no legal moves\n")
+    for number, line in enumerate(lines, start=1):
+        moves = " ".join(move_to_text(move) for move in line.get_principal_variation())
+        output.write(f"    {number}. {format_score(line.get_score()):>8}  {moves}\n")
+    output.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the best lines for a position or for every ply of a game.")
+    parser.add_argument("archive", nargs="?", help="game archive to read the game from")
+    parser.add_argument("--game", type=int, default=0, help="number of the game in the archive")
+    parser.add_argument("--fen", default=START_FEN, help="position to analyse (or to start the moves from)")
+    parser.add_argument("--moves", default="", help="moves played from the position, i.e. \"e2e4 e7e5\"")
+    parser.add_argument("--lines", type=int, default=3, help="number of best lines to show for each position")
+    parser.add_argument("--time", type=float, default=30.0, help="total time in seconds, shared by all positions")
+    parser.add_argument("--depth", type=int, help="stop each position at this depth")
+    args = parser.parse_args()
+
+    if args.archive is not None:
+        with GameArchiveReader(args.archive) as reader:
+            moves = reader.read_game(args.game).get_moves()
+    else:
+        moves = [move_from_text(text) for text in args.moves.split()]
+
+    for analysis in analyse_game(moves, args.lines, args.time, args.fen, args.depth):
+        print_ply_analysis(analysis)
+
+
+if __name__ == "__main__":
+    main()
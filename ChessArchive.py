@@ -0,0 +1,188 @@
+import os
+import struct
+import sys
+from array import array
+from ChessPosition import encode_move, decode_move
+
+# Binary game archive format. All numbers are little-endian.
+#
+#   File header:  magic b"CHSA", format version (2 bytes), 2 reserved bytes
+#   Games:        one after another, each made of
+#                   result code (1 byte), 1 reserved byte, number of moves (2 bytes), metadata length (2 bytes),
+#                   the metadata (UTF-8 "key<tab>value" lines), then every move packed into 2 bytes (see encode_move)
+#   Index:        the file offset of every game (8 bytes each), so any game can be read without reading the ones
+#                 before it
+#   Footer:       file offset of the index (8 bytes), number of games (4 bytes), magic b"CHSI"
+#
+# Since the index is written last, games can be streamed into the file one at a time, and new games can be appended
+# later by overwriting the old index.
+ARCHIVE_MAGIC = b"CHSA"
+INDEX_MAGIC = b"CHSI"
+ARCHIVE_VERSION = 1
+
+file_header_format = struct.Struct("<4sHH")
+game_header_format = struct.Struct("<BBHH")
+footer_format = struct.Struct("<QI4s")
+
+# Result codes used in the game headers
+result_codes = {
+    "*": 0,
+    "1-0": 1,
+    "0-1": 2,
+    "1/2-1/2": 3
+}
+results = {code: result for result, code in result_codes.items()}
+
+
+# Arrays are stored in the machine's byte order, so they need to be swapped on big-endian machines
+def _to_little_endian(numbers):
+    if sys.byteorder == "big":
+        numbers.byteswap()
+    return numbers
+
+
+# Converts a dictionary of metadata (i.e. {"White": "Andrew", "Date": "2023.01.01"}) into bytes
+def encode_metadata(metadata):
+    return "".join(f"{key}\t{value}\n" for key, value in metadata.items()).encode("utf-8")
+
+
+# Converts bytes created by encode_metadata back into a dictionary
+def decode_metadata(data):
+    metadata = {}
+    for line in data.decode("utf-8").splitlines():
+        key, value = line.split("\t", 1)
+        metadata[key] = value
+    return metadata
+
+
+# A game read from an archive. Moves are (origin, destination, promotion_type) tuples, as used by play_move.
+class ArchivedGame:
+    def __init__(self, moves, result, metadata):
+        self._moves = moves
+        self._result = result
+        self._metadata = metadata
+
+    def get_moves(self):
+        return self._moves
+
+    def get_result(self):
+        return self._result
+
+    def get_metadata(self):
+        return self._metadata
+
+
+# Writes games to an archive file one at a time. If append is True and the file already exists, new games are added
+# after the ones already in it. The index is written when the writer is closed, so it should be used in a with block.
+class GameArchiveWriter:
+    def __init__(self, path, append=False):
+        self._offsets = array("Q")  # File offset of every game written so far
+
+        # Continue an existing archive by reading its index, then writing new games over it
+        if append and os.path.exists(path):
+            reader = GameArchiveReader(path)
+            self._offsets.extend(reader.get_offsets())
+            index_offset = reader.get_index_offset()
+            reader.close()
+
+            self._file = open(path, "r+b")
+            self._file.seek(index_offset)
+            self._file.truncate()
+
+        # Otherwise start a new archive
+        else:
+            self._file = open(path, "wb")
+            self._file.write(file_header_format.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0))
+
+    # Writes one game. moves is a list of (origin, destination, promotion_type) tuples, result is one of the keys of
+    # result_codes, and metadata is an optional dictionary of strings. Returns the number of the game in the archive.
+    def write_game(self, moves, result="*", metadata=None):
+        encoded_metadata = encode_metadata(metadata or {})
+        encoded_moves = _to_little_endian(array("H", (encode_move(*move) for move in moves)))
+
+        self._offsets.append(self._file.tell())
+        self._file.write(game_header_format.pack(result_codes[result], 0, len(encoded_moves), len(encoded_metadata)))
+        self._file.write(encoded_metadata)
+        self._file.write(encoded_moves.tobytes())
+
+        return len(self._offsets) - 1
+
+    # Writes the index and footer, then closes the file
+    def close(self):
+        index_offset = self._file.tell()
+        self._file.write(_to_little_endian(array("Q", self._offsets)).tobytes())
+        self._file.write(footer_format.pack(index_offset, len(self._offsets), INDEX_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Reads games from an archive file. Any game can be read directly by its number (using the index), or every game can
+# be streamed in order by iterating over the reader.
+class GameArchiveReader:
+    def __init__(self, path):
+        self._file = open(path, "rb")
+
+        # Check the file header
+        magic, version, reserved = file_header_format.unpack(self._file.read(file_header_format.size))
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(f"{path} is not a game archive.")
+        if version != ARCHIVE_VERSION:
+            raise ValueError(f"{path} uses archive version {version}, but only version {ARCHIVE_VERSION} is supported.")
+
+        # Read the footer, then the index it points to
+        self._file.seek(-footer_format.size, os.SEEK_END)
+        self._index_offset, game_count, magic = footer_format.unpack(self._file.read(footer_format.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} has no index. Was the archive writer closed?")
+
+        self._file.seek(self._index_offset)
+        self._offsets = array("Q")
+        self._offsets.frombytes(self._file.read(game_count * self._offsets.itemsize))
+        _to_little_endian(self._offsets)
+
+    def get_offsets(self):
+        return self._offsets
+
+    def get_index_offset(self):
+        return self._index_offset
+
+    def __len__(self):
+        return len(self._offsets)
+
+    # Reads the game at the reader's current file position
+    def _read_next_game(self):
+        result_code, reserved, move_count, metadata_length = game_header_format.unpack(
+            self._file.read(game_header_format.size))
+        metadata = decode_metadata(self._file.read(metadata_length))
+
+        encoded_moves = array("H")
+        encoded_moves.frombytes(self._file.read(move_count * encoded_moves.itemsize))
+        _to_little_endian(encoded_moves)
+
+        return ArchivedGame([decode_move(move) for move in encoded_moves], results[result_code], metadata)
+
+    # Reads game number game_number (counting from 0) without reading any of the games before it
+    def read_game(self, game_number):
+        self._file.seek(self._offsets[game_number])
+        return self._read_next_game()
+
+    # Streams every game in order. Games are stored back to back, so only the first one needs a seek
+    def __iter__(self):
+        if self._offsets:
+            self._file.seek(self._offsets[0])
+        for game_number in range(len(self._offsets)):
+            yield self._read_next_game()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,253 @@
+import argparse
+import heapq
+import mmap
+import os
+import struct
+from ChessGame import create_board, play_move, get_legal_moves
+from ChessPosition import PositionHistory, encode_move, decode_move, move_to_text, move_from_text
+from ChessArchive import GameArchiveReader, result_codes, results
+
+# Position index file format. All numbers are little-endian.
+#
+#   Header:   magic b"CHPI", format version (2 bytes), 2 reserved bytes, number of games indexed (4 bytes),
+#             number of records (8 bytes)
+#   Records:  one for every position of every game, sorted by position hash. Each holds the position hash (8 bytes),
+#             the game number in the archive (4 bytes), the ply at which the position occurred (2 bytes) and the move
+#             played from it (2 bytes, packed by encode_move, or 0 if the game ended there)
+#   Results:  the result code of every game (1 byte each, see result_codes in ChessArchive.py)
+#
+# Since the records are sorted, every game reaching a position can be found with a binary search.
+INDEX_MAGIC = b"CHPI"
+INDEX_VERSION = 1
+
+header_format = struct.Struct("<4sHHIQ")
+record_format = struct.Struct("<QIHH")
+hash_format = struct.Struct("<Q")
+
+# Marks a record for the final position of a game, where no move was played
+NO_MOVE = 0
+
+
+# Replays a game from the archive and returns a (hash, game number, ply, move) record for every position in it
+def get_game_records(game, game_number):
+    board = create_board()
+    history = PositionHistory(board)
+    records = []
+    move_count = 1
+
+    for ply, (origin, destination, promotion_type) in enumerate(game.get_moves()):
+        records.append((history.get_current_hash(), game_number, ply, encode_move(origin, destination, promotion_type)))
+        play_move(board, origin, destination, move_count, promotion_type, history)
+        move_count += 1
+
+    # The final position is also reached, even though no move was played from it
+    records.append((history.get_current_hash(), game_number, len(game.get_moves()), NO_MOVE))
+    return records
+
+
+# Builds (or brings up to date) the position index for an archive. If the index already exists, only games added to the
+# archive since it was built are replayed, and their records are merged into the existing ones.
+# Returns the number of games that were added to the index.
+def build_position_index(archive_path, index_path):
+
+    # Find out how much of the archive is already indexed
+    game_results = bytearray()
+    old_index = None
+    if os.path.exists(index_path):
+        old_index = PositionIndex(index_path)
+        game_results.extend(old_index.get_game_results())
+
+    # Replay every game that isn't indexed yet
+    new_records = []
+    with GameArchiveReader(archive_path) as reader:
+        for game_number in range(len(game_results), len(reader)):
+            game = reader.read_game(game_number)
+            new_records.extend(get_game_records(game, game_number))
+            game_results.append(result_codes[game.get_result()])
+    new_records.sort()
+
+    games_added = len(game_results) - (old_index.get_game_count() if old_index is not None else 0)
+    if games_added == 0:
+        if old_index is not None:
+            old_index.close()
+        return 0
+
+    # Merge the old records with the new ones (both are already sorted) into a new file, then replace the old one
+    old_records = old_index.iter_records() if old_index is not None else iter(())
+    record_count = (old_index.get_record_count() if old_index is not None else 0) + len(new_records)
+    temporary_path = index_path + ".tmp"
+
+    with open(temporary_path, "wb") as index_file:
+        index_file.write(header_format.pack(INDEX_MAGIC, INDEX_VERSION, 0, len(game_results), record_count))
+        for record in heapq.merge(old_records, new_records):
+            index_file.write(record_format.pack(*record))
+        index_file.write(game_results)
+
+    if old_index is not None:
+        old_index.close()
+    os.replace(temporary_path, index_path)
+
+    return games_added
+
+
+# Statistics for one move played from a position: how many games played it, and how those games ended
+class MoveStatistics:
+    def __init__(self, move):
+        self._move = move
+        self._games = 0
+        self._results = {result: 0 for result in result_codes}
+
+    def add_game(self, result):
+        self._games += 1
+        self._results[result] += 1
+
+    # The move as an (origin, destination, promotion_type) tuple
+    def get_move(self):
+        return decode_move(self._move)
+
+    def get_games(self):
+        return self._games
+
+    # Number of games that ended with the given result ("1-0", "0-1", "1/2-1/2" or "*")
+    def get_result_count(self, result):
+        return self._results[result]
+
+
+# Answers queries on a position index file. The file is memory-mapped, so only the parts a query touches are read.
+class PositionIndex:
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, reserved, self._game_count, self._record_count = header_format.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a position index.")
+        if version != INDEX_VERSION:
+            raise ValueError(f"{path} uses index version {version}, but only version {INDEX_VERSION} is supported.")
+
+        self._results_offset = header_format.size + self._record_count * record_format.size
+
+    def get_game_count(self):
+        return self._game_count
+
+    def get_record_count(self):
+        return self._record_count
+
+    # Returns the result code of every indexed game, in order
+    def get_game_results(self):
+        return self._map[self._results_offset:self._results_offset + self._game_count]
+
+    # Returns the record at the given position in the sorted list
+    def get_record(self, record_number):
+        return record_format.unpack_from(self._map, header_format.size + record_number * record_format.size)
+
+    # Streams every record in sorted order, a block at a time so that large indexes aren't copied into memory at once
+    def iter_records(self, block_size=4096):
+        for first_record in range(0, self._record_count, block_size):
+            start = header_format.size + first_record * record_format.size
+            end = min(start + block_size * record_format.size, self._results_offset)
+            yield from record_format.iter_unpack(self._map[start:end])
+
+    # Binary search for the first record with the given hash (or where it would be if there is none)
+    def _find_first_record(self, position_hash):
+        low = 0
+        high = self._record_count
+        while low < high:
+            middle = (low + high) // 2
+            if hash_format.unpack_from(self._map, header_format.size + middle * record_format.size)[0] < position_hash:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Finds every occurrence of the position. Returns a list of (game number, ply, encoded move) tuples
+    def find_position(self, position_hash):
+        occurrences = []
+        record_number = self._find_first_record(position_hash)
+
+        while record_number < self._record_count:
+            record_hash, game_number, ply, move = self.get_record(record_number)
+            if record_hash != position_hash:
+                break
+            occurrences.append((game_number, ply, move))
+            record_number += 1
+
+        return occurrences
+
+    # Returns the numbers of every game that reached the position
+    def find_games(self, position_hash):
+        return sorted({game_number for game_number, ply, move in self.find_position(position_hash)})
+
+    # Returns a MoveStatistics for every move played from the position, most played first. A game that reached the
+    # position more than once is only counted once for each move played from it.
+    def get_move_statistics(self, position_hash):
+        statistics = {}
+        game_results = self.get_game_results()
+        counted = set()  # (move, game number) pairs already counted
+
+        for game_number, ply, move in self.find_position(position_hash):
+            if move == NO_MOVE or (move, game_number) in counted:
+                continue
+            counted.add((move, game_number))
+            if move not in statistics:
+                statistics[move] = MoveStatistics(move)
+            statistics[move].add_game(results[game_results[game_number]])
+
+        return sorted(statistics.values(), key=lambda move_statistics: move_statistics.get_games(), reverse=True)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Command line interface. "build" indexes an archive, and "query" plays the given moves from the starting position
+# (written like "e2e4 e7e5") and prints the games that reached the resulting position and the moves played from it.
+def main():
+    parser = argparse.ArgumentParser(description="Find games that reach a position.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build or update the index for an archive")
+    build_parser.add_argument("archive")
+    build_parser.add_argument("index")
+
+    query_parser = subparsers.add_parser("query", help="look up the position reached after some moves")
+    query_parser.add_argument("index")
+    query_parser.add_argument("moves", nargs="*", help="moves from the starting position, like e2e4 or e7e8q")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        games_added = build_position_index(args.archive, args.index)
+        print(f"Indexed {games_added} new game(s).")
+        return
+
+    # Play the moves to reach the position being looked up
+    board = create_board()
+    history = PositionHistory(board)
+    for move_count, move in enumerate(args.moves, start=1):
+        try:
+            origin, destination, promotion_type = move_from_text(move)
+        except (IndexError, KeyError):
+            parser.error(f"{move} is not a move. Moves are written like e2e4, or e7e8q for a promotion.")
+        if not any(piece.get_position() == origin and legal_destination == destination
+                   for piece, legal_destination in get_legal_moves(board, move_count % 2 == 1, move_count)):
+            parser.error(f"{move} is not a legal move in the position reached by the moves before it.")
+        play_move(board, origin, destination, move_count, promotion_type, history)
+
+    with PositionIndex(args.index) as index:
+        games = index.find_games(history.get_current_hash())
+        print(f"{len(games)} game(s) reached this position.")
+        for move_statistics in index.get_move_statistics(history.get_current_hash()):
+            print(f"{move_to_text(move_statistics.get_move())}: {move_statistics.get_games()} game(s), "
+                  f"+{move_statistics.get_result_count('1-0')} ={move_statistics.get_result_count('1/2-1/2')} "
+                  f"-{move_statistics.get_result_count('0-1')}")
+
+
+if __name__ == "__main__":
+    main()
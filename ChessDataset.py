@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import numpy as np
+from ChessGame import create_board, play_move
+from ChessPosition import (piece_type_index, square_index, castling_right_remains, get_en_passant_rank,
+                           rook_home_squares)
+from ChessArchive import GameArchiveReader
+
+# Every position is stored as one fixed-size record:
+#   planes:        one 64-bit bitboard for each (color, piece type), white pieces first, in piece_types order. Bit n
+#                  is set if such a piece stands on square n (see square_index)
+#   side_to_move:  1 if white is to move, 0 if black
+#   castling:      one bit for each castling right, in rook_home_squares order
+#   en_passant:    the rank (0-7) on which an en passant capture is possible, or -1
+#   result:        result of the game from white's point of view: 1 (win), 0 (draw), -1 (loss), or -2 (unfinished)
+#   game, ply:     where the position came from (game number in the archive, and move number within the game)
+position_dtype = np.dtype([
+    ("planes", "<u8", (12,)),
+    ("side_to_move", "u1"),
+    ("castling", "u1"),
+    ("en_passant", "i1"),
+    ("result", "i1"),
+    ("game", "<u4"),
+    ("ply", "<u2"),
+])
+
+# Game results as stored in the result field
+result_values = {"1-0": 1, "1/2-1/2": 0, "0-1": -1, "*": -2}
+
+MANIFEST_NAME = "manifest.json"
+
+
+# Returns the file name of shard number shard_number
+def shard_name(shard_number):
+    return f"shard-{shard_number:05d}.npy"
+
+
+# Fills in a position record (a row of an array with position_dtype) from the board
+def encode_position(record, board, is_white_turn, move_count):
+    planes = [0] * 12
+    for piece in board:
+        if not piece.is_captured():
+            plane = (0 if piece.is_white() else 6) + piece_type_index(piece)
+            planes[plane] |= 1 << square_index(piece.get_position())
+
+    castling = 0
+    for corner, rook_square in enumerate(rook_home_squares):
+        if castling_right_remains(board, rook_square):
+            castling |= 1 << corner
+
+    en_passant_rank = get_en_passant_rank(board, move_count)
+
+    record["planes"] = planes
+    record["side_to_move"] = 1 if is_white_turn else 0
+    record["castling"] = castling
+    record["en_passant"] = -1 if en_passant_rank is None else en_passant_rank
+
+
+# Replays the games of an archive and writes every position into preallocated .npy shards of shard_size positions,
+# which are written through np.memmap so only the shard being filled is mapped at any time. A manifest file records
+# how far the export has got; every checkpoint_games games the shard is flushed and the manifest updated, so an
+# interrupted export continues from the last checkpoint when it is run again. Returns the number of positions written.
+def export_dataset(archive_path, output_directory, shard_size=100000, checkpoint_games=100):
+    os.makedirs(output_directory, exist_ok=True)
+    manifest_path = os.path.join(output_directory, MANIFEST_NAME)
+
+    # Continue an earlier export if there is one
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["shard_size"] != shard_size:
+            raise ValueError(f"{output_directory} was exported with a shard size of {manifest['shard_size']}.")
+    else:
+        manifest = {"shard_size": shard_size, "games_done": 0, "shard_counts": []}
+
+    shard_counts = manifest["shard_counts"]
+    shard = None            # The memory-mapped shard being filled
+    position_number = 0     # Where the next position goes in that shard
+
+    # Opens the last shard for writing, or creates a new one if it is full (or there are none yet)
+    def open_shard():
+        if not shard_counts or shard_counts[-1] == shard_size:
+            shard_counts.append(0)
+            return np.lib.format.open_memmap(os.path.join(output_directory, shard_name(len(shard_counts) - 1)),
+                                             mode="w+", dtype=position_dtype, shape=(shard_size,))
+        return np.lib.format.open_memmap(os.path.join(output_directory, shard_name(len(shard_counts) - 1)), mode="r+")
+
+    # Flushes the shard and records the progress made so far. The manifest is replaced in one step, so it is never
+    # left half-written
+    def save_checkpoint(games_done):
+        shard.flush()
+        shard_counts[-1] = position_number
+        manifest["games_done"] = games_done
+        with open(manifest_path + ".tmp", "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    shard = open_shard()
+    position_number = shard_counts[-1]
+    positions_written = 0
+
+    with GameArchiveReader(archive_path) as reader:
+        for game_number in range(manifest["games_done"], len(reader)):
+            game = reader.read_game(game_number)
+            result = result_values[game.get_result()]
+
+            # Replay the game, writing each position before its move is played (and the final position)
+            board = create_board()
+            moves = game.get_moves()
+            is_white_turn = True
+
+            for ply in range(len(moves) + 1):
+
+                # Move on to a new shard when this one is full. The manifest is only saved between games, so if the
+                # export is interrupted before the next checkpoint, this game is written again from its start
+                if position_number == shard_size:
+                    shard.flush()
+                    shard_counts[-1] = shard_size
+                    shard = open_shard()
+                    position_number = 0
+
+                record = shard[position_number]
+                encode_position(record, board, is_white_turn, ply + 1)
+                record["result"] = result
+                record["game"] = game_number
+                record["ply"] = ply
+                position_number += 1
+                positions_written += 1
+
+                if ply < len(moves):
+                    origin, destination, promotion_type = moves[ply]
+                    play_move(board, origin, destination, ply + 1, promotion_type)
+                    is_white_turn = not is_white_turn
+
+            if (game_number + 1) % checkpoint_games == 0:
+                save_checkpoint(game_number + 1)
+
+        save_checkpoint(len(reader))
+
+    return positions_written
+
+
+# Reads an exported dataset. Batches are slices of the memory-mapped shards, so no data is copied until it is used.
+# A batch never spans two shards, so the last batch of each shard may be smaller than batch_size.
+def iter_batches(dataset_directory, batch_size=1024):
+    with open(os.path.join(dataset_directory, MANIFEST_NAME)) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    for shard_number, shard_count in enumerate(manifest["shard_counts"]):
+        shard = np.load(os.path.join(dataset_directory, shard_name(shard_number)), mmap_mode="r")
+        for start in range(0, shard_count, batch_size):
+            yield shard[start:min(start + batch_size, shard_count)]
+
+
+# Unpacks the bitboards of a batch into a (positions, 12, 8, 8) array of 0s and 1s, indexed [plane, file, rank]
+def unpack_planes(batch):
+    bits = np.unpackbits(batch["planes"].astype("<u8").view(np.uint8), bitorder="little")
+    return bits.reshape(len(batch), 12, 8, 8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the positions of archived games as NumPy training data.")
+    parser.add_argument("archive")
+    parser.add_argument("output_directory")
+    parser.add_argument("--shard-size", type=int, default=100000, help="positions per shard file")
+    parser.add_argument("--checkpoint-games", type=int, default=100, help="games between progress checkpoints")
+    args = parser.parse_args()
+
+    positions_written = export_dataset(args.archive, args.output_directory, args.shard_size, args.checkpoint_games)
+    print(f"Wrote {positions_written} position(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+import threading
+import time
+from ChessPieces import Pawn, Bishop, Knight, Rook, Queen, King
+from ChessGame import MAX_FILE, get_legal_moves, play_move, piece_threatening_king
+from ChessPosition import (position_hash, pawn_hash, pawn_hash_after_move, get_pieces_by_square, save_board_state,
+                           restore_board_state)
+from ChessTactics import (piece_values, get_piece_value, get_piece_at, mvv_lva_score, get_legal_captures,
+                          is_losing_capture)
+from ChessPawns import PawnCache, evaluate_pawns
+
+# Scores are in hundredths of a pawn, from the point of view of the side to move. A checkmate scores MATE_SCORE minus
+# the number of moves needed to deliver it, so quicker mates score higher.
+MATE_SCORE = 100000
+INFINITY = 1000000
+
+# Bound types stored in the transposition table
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# How many captures deep the quiescence search may go past the end of the normal search
+MAX_QUIESCENCE_DEPTH = 4
+
+# The types a pawn can be promoted to, in the order they are searched
+promotion_types = [Queen, Knight, Rook, Bishop]
+
+
+# Raised inside the search when it has to stop (time ran out or it was told to stop). Caught by Searcher.search.
+class SearchStopped(Exception):
+    pass
+
+
+# A small bonus for each piece depending on where it stands: knights and bishops prefer the center, and pawns are worth
+# more the further they have advanced.
+def positional_bonus(piece):
+    position = piece.get_position()
+    distance_from_center = max(abs(2 * position[0] - 7), abs(2 * position[1] - 7)) // 2  # 0 (center) to 3 (edge)
+
+    if isinstance(piece, Pawn):
+        rows_advanced = position[1] - 1 if piece.is_white() else MAX_FILE - 2 - position[1]
+        return rows_advanced * 8 + (6 if position[0] in [3, 4] else 0)
+    if isinstance(piece, Knight) or isinstance(piece, Bishop):
+        return (3 - distance_from_center) * 10
+    if isinstance(piece, Queen):
+        return (3 - distance_from_center) * 3
+    return 0
+
+
+# Scores the position from the point of view of the side to move, using the material on the board and the position of
+# each piece. If a pawn cache is given, the pawn structure and the pawns sheltering each king are scored as well (the
+# pawn hash can be passed in if it is already known, i.e. from the search, otherwise it is calculated).
+def evaluate(board, is_white_turn, pawn_cache=None, pawn_key=None):
+    score = 0
+    for piece in board:
+        if piece.is_captured():
+            continue
+        value = positional_bonus(piece) + (0 if isinstance(piece, King) else get_piece_value(piece))
+        score += value if piece.is_white() else -value
+    if pawn_cache is not None:
+        score += evaluate_pawns(board, pawn_cache, pawn_key)
+    return score if is_white_turn else -score
+
+
+# Determines if the king of the side to move is in check
+def is_in_check(board, is_white_turn, move_count):
+    king = next((piece for piece in board if isinstance(piece, King) and piece.is_white() == is_white_turn))
+    return piece_threatening_king(board, king, move_count) is not None
+
+
+# Lists every legal move as (origin, destination, promotion_type) tuples. A pawn reaching the end of the board gets one
+# move for each type it can be promoted to.
+def get_search_moves(board, is_white_turn, move_count):
+    moves = []
+    for piece, destination in get_legal_moves(board, is_white_turn, move_count):
+        origin = piece.get_position()
+        if isinstance(piece, Pawn) and destination[1] in [0, MAX_FILE - 1]:
+            moves.extend((origin, destination, promotion_type) for promotion_type in promotion_types)
+        else:
+            moves.append((origin, destination, None))
+    return moves
+
+
+# Sorts moves so that the ones most likely to be best are searched first: the best move found for this position
+# earlier, then captures (most valuable victim first), then promotions, then everything else.
+def order_moves(board, moves, best_move=None):
+    def move_priority(move):
+        origin, destination, promotion_type = move
+        if move == best_move:
+            return INFINITY
+        piece = get_piece_at(board, origin)
+        if get_piece_at(board, destination) is not None or (isinstance(piece, Pawn) and origin[0] != destination[0]):
+            return mvv_lva_score(board, piece, destination)
+        if promotion_type is not None:
+            return piece_values[promotion_type]
+        return 0
+    return sorted(moves, key=move_priority, reverse=True)
+
+
+# Converts a mate score into the number of moves (not plies) until mate, or returns None for a normal score.
+# Positive if the side to move is giving mate, negative if it is being mated.
+def moves_to_mate(score):
+    if abs(score) < MATE_SCORE - 1000:
+        return None
+    plies = MATE_SCORE - abs(score)
+    return (plies + 1) // 2 if score > 0 else -((plies + 1) // 2)
+
+
+# The result of a search: the best line found (principal variation, a list of moves starting with the best move), its
+# score, the depth that was completed, and how many positions were searched.
+class SearchResult:
+    def __init__(self, principal_variation, score, depth, nodes, elapsed):
+        self._principal_variation = principal_variation
+        self._score = score
+        self._depth = depth
+        self._nodes = nodes
+        self._elapsed = elapsed
+
+    def get_best_move(self):
+        return self._principal_variation[0] if self._principal_variation else None
+
+    def get_principal_variation(self):
+        return self._principal_variation
+
+    def get_score(self):
+        return self._score
+
+    def get_depth(self):
+        return self._depth
+
+    def get_nodes(self):
+        return self._nodes
+
+    def get_elapsed(self):
+        return self._elapsed
+
+
+# Alpha-beta search with iterative deepening, a transposition table and a quiescence search over captures (captures
+# that lose material according to the static exchange evaluation are skipped). The transposition table is kept between
+# searches, so thinking done earlier (i.e. while pondering) speeds up later searches of related positions.
+# The search can be stopped from another thread with stop(), and its deadline can be changed while it is running.
+class Searcher:
+    def __init__(self, max_table_size=200000, pawn_cache_size=4096):
+        self._table = {}  # Maps position hashes to (depth, score, bound type, best move)
+        self._max_table_size = max_table_size
+        self._pawn_cache = PawnCache(pawn_cache_size)
+        self._stop_event = threading.Event()
+        self._deadline = None
+        self._max_nodes = None
+        self._nodes = 0
+
+    # Forgets everything learned in previous searches (i.e. when a new game starts)
+    def clear(self):
+        self._table.clear()
+
+    # The cache of pawn structure evaluations, kept across searches (its hit rate shows whether it is big enough)
+    def get_pawn_cache(self):
+        return self._pawn_cache
+
+    # Asks a running search to stop as soon as possible. It will return the best move found so far
+    def stop(self):
+        self._stop_event.set()
+
+    # Changes when the running search has to stop (a time.monotonic() value, or None for no time limit)
+    def set_deadline(self, deadline):
+        self._deadline = deadline
+
+    # Searches the position until max_depth is reached, the deadline passes, max_nodes positions have been searched, or
+    # stop() is called. After each completed depth, info_callback (if given) is called with the SearchResult so far.
+    # Returns the SearchResult of the deepest completed depth. The board is left unchanged.
+    # A caller that may need to stop the search before it has even started can pass in its own stop_event, and set it.
+    def search(self, board, is_white_turn, move_count, max_depth=None, deadline=None, max_nodes=None,
+               info_callback=None, stop_event=None):
+        self._stop_event = stop_event if stop_event is not None else threading.Event()
+        self._deadline = deadline
+        self._max_nodes = max_nodes
+        self._nodes = 0
+        start_time = time.monotonic()
+
+        # Without any legal moves there is nothing to search
+        root_moves = get_search_moves(board, is_white_turn, move_count)
+        if not root_moves:
+            score = -MATE_SCORE if is_in_check(board, is_white_turn, move_count) else 0
+            return SearchResult([], score, 0, 0, 0.0)
+
+        # Until the first depth is completed, fall back on the first legal move
+        result = SearchResult([order_moves(board, root_moves)[0]], 0, 0, 0, 0.0)
+        depth = 0
+
+        while max_depth is None or depth < max_depth:
+            depth += 1
+            try:
+                score = self._negamax(board, is_white_turn, move_count, depth, -INFINITY, INFINITY, 0,
+                                      pawn_hash(board))
+            except SearchStopped:
+                break
+
+            result = SearchResult(self._get_principal_variation(board, is_white_turn, move_count, depth), score,
+                                  depth, self._nodes, time.monotonic() - start_time)
+            if info_callback is not None:
+                info_callback(result)
+
+            # A forced mate has been found, searching deeper won't change anything
+            if moves_to_mate(score) is not None and abs(score) >= MATE_SCORE - depth:
+                break
+
+        return result
+
+    # Finds the best line_count moves of the position (multi-PV), each with its score and principal variation. Like
+    # search(), it searches one depth deeper at a time until max_depth, the deadline, max_nodes or a stop. At each depth
+    # the best move is found first, then the best of the remaining moves, and so on, with the lines of the previous
+    # depth searched first. Depth 1 is always completed (the deadline only applies after it), so there is always
+    # something to show. After each completed depth, info_callback (if given) is called with the list of lines.
+    # Returns the lines (SearchResults, best first) of the deepest completed depth. The board is left unchanged.
+    def analyse(self, board, is_white_turn, move_count, line_count, max_depth=None, deadline=None, max_nodes=None,
+                info_callback=None, stop_event=None):
+        self._stop_event = stop_event if stop_event is not None else threading.Event()
+        self._deadline = None
+        self._max_nodes = max_nodes
+        self._nodes = 0
+        start_time = time.monotonic()
+
+        root_moves = order_moves(board, get_search_moves(board, is_white_turn, move_count))
+        lines = []
+        depth = 0
+
+        while root_moves and (max_depth is None or depth < max_depth):
+            depth += 1
+
+            # Search the moves of the previous depth's lines first, in the order they were found
+            previous_moves = [line.get_best_move() for line in lines]
+            remaining_moves = previous_moves + [move for move in root_moves if move not in previous_moves]
+
+            depth_lines = []
+            try:
+                while remaining_moves and len(depth_lines) < line_count:
+                    score, move = self._search_root(board, remaining_moves, is_white_turn, move_count, depth)
+                    remaining_moves.remove(move)
+
+                    # The rest of the line comes from the transposition table, starting from the position after move
+                    board_state = save_board_state(board)
+                    play_move(board, move[0], move[1], move_count, move[2])
+                    principal_variation = [move] + self._get_principal_variation(board, not is_white_turn,
+                                                                                 move_count + 1, depth - 1)
+                    restore_board_state(board, board_state)
+
+                    depth_lines.append(SearchResult(principal_variation, score, depth, self._nodes,
+                                                    time.monotonic() - start_time))
+            except SearchStopped:
+                break
+
+            lines = depth_lines
+            self._deadline = deadline
+            if info_callback is not None:
+                info_callback(lines)
+
+        return lines
+
+    # Searches the given root moves with a full window, and returns (score, move) for the best of them. Nothing is
+    # stored for the root itself, since the moves left out (by analyse) would make the result wrong for the position.
+    def _search_root(self, board, moves, is_white_turn, move_count, depth):
+        best_score = -INFINITY
+        best_move = None
+        pawn_key = pawn_hash(board)
+        pieces_by_square = get_pieces_by_square(board)
+        for move in moves:
+            score = self._search_move(board, move, is_white_turn, move_count, depth, best_score, INFINITY, 0, pawn_key,
+                                      pieces_by_square)
+            if score > best_score:
+                best_score = score
+                best_move = move
+        return best_score, best_move
+
+    # Raises SearchStopped if the search has to end
+    def _check_limits(self):
+        if (self._stop_event.is_set() or (self._deadline is not None and time.monotonic() >= self._deadline)
+                or (self._max_nodes is not None and self._nodes >= self._max_nodes)):
+            raise SearchStopped()
+
+    # Stores a search result in the transposition table, emptying it first if it is full
+    def _store(self, key, depth, score, bound_type, best_move):
+        if len(self._table) >= self._max_table_size:
+            self._table.clear()
+        self._table[key] = (depth, score, bound_type, best_move)
+
+    # Plays the move on the board, searches the resulting position, and takes the move back. pawn_key is the pawn hash
+    # of the position before the move (see pawn_hash), which is updated from the pieces the move involves (looked up in
+    # pieces_by_square, built once for all the moves of the position) and passed down to the evaluation
+    def _search_move(self, board, move, is_white_turn, move_count, depth, alpha, beta, ply, pawn_key,
+                     pieces_by_square):
+        next_pawn_key = pawn_hash_after_move(pieces_by_square, pawn_key, move[0], move[1])
+        board_state = save_board_state(board)
+        try:
+            play_move(board, move[0], move[1], move_count, move[2])
+            return -self._negamax(board, not is_white_turn, move_count + 1, depth - 1, -beta, -alpha, ply + 1,
+                                  next_pawn_key)
+        finally:
+            restore_board_state(board, board_state)
+
+    def _negamax(self, board, is_white_turn, move_count, depth, alpha, beta, ply, pawn_key):
+        self._check_limits()
+        self._nodes += 1
+
+        # At the end of the normal search, only look at captures
+        if depth <= 0:
+            return self._quiescence(board, is_white_turn, move_count, alpha, beta, 0, pawn_key)
+
+        # See if this position has already been searched deeply enough (the root is always searched)
+        key = position_hash(board, is_white_turn, move_count)
+        entry = self._table.get(key)
+        best_move = entry[3] if entry is not None else None
+        if entry is not None and ply > 0 and entry[0] >= depth:
+            stored_depth, stored_score, bound_type, stored_move = entry
+            if (bound_type == EXACT or (bound_type == LOWER_BOUND and stored_score >= beta)
+                    or (bound_type == UPPER_BOUND and stored_score <= alpha)):
+                return stored_score
+
+        # Checkmate or stalemate
+        moves = get_search_moves(board, is_white_turn, move_count)
+        if not moves:
+            return -MATE_SCORE + ply if is_in_check(board, is_white_turn, move_count) else 0
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        pieces_by_square = get_pieces_by_square(board)
+        for move in order_moves(board, moves, best_move):
+            score = self._search_move(board, move, is_white_turn, move_count, depth, alpha, beta, ply, pawn_key,
+                                      pieces_by_square)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        # Remember the result for later
+        if best_score <= original_alpha:
+            bound_type = UPPER_BOUND
+        elif best_score >= beta:
+            bound_type = LOWER_BOUND
+        else:
+            bound_type = EXACT
+        self._store(key, depth, best_score, bound_type, best_move)
+
+        return best_score
+
+    # Searches captures only, until the position is quiet, so that the evaluation isn't fooled by a piece that is about
+    # to be recaptured. The side to move may also "stand pat" and not capture at all.
+    def _quiescence(self, board, is_white_turn, move_count, alpha, beta, quiescence_depth, pawn_key):
+        self._check_limits()
+        self._nodes += 1
+
+        stand_pat = evaluate(board, is_white_turn, self._pawn_cache, pawn_key)
+        if stand_pat >= beta or quiescence_depth >= MAX_QUIESCENCE_DEPTH:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        captures = [(piece.get_position(), destination, None)
+                    for piece, destination in get_legal_captures(board, is_white_turn, move_count)
+                    if not is_losing_capture(board, piece, destination)]
+        pieces_by_square = get_pieces_by_square(board) if captures else None
+        for move in order_moves(board, captures):
+            next_pawn_key = pawn_hash_after_move(pieces_by_square, pawn_key, move[0], move[1])
+            board_state = save_board_state(board)
+            try:
+                play_move(board, move[0], move[1], move_count)
+                score = -self._quiescence(board, not is_white_turn, move_count + 1, -beta, -alpha,
+                                          quiescence_depth + 1, next_pawn_key)
+            finally:
+                restore_board_state(board, board_state)
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+
+        return alpha
+
+    # Follows the best moves stored in the transposition table to build the principal variation
+    def _get_principal_variation(self, board, is_white_turn, move_count, max_length):
+        principal_variation = []
+        board_state = save_board_state(board)
+        seen = set()
+
+        while len(principal_variation) < max_length:
+            key = position_hash(board, is_white_turn, move_count)
+            entry = self._table.get(key)
+            if entry is None or entry[3] is None or key in seen:
+                break
+            seen.add(key)
+            move = entry[3]
+            principal_variation.append(move)
+            play_move(board, move[0], move[1], move_count, move[2])
+            is_white_turn = not is_white_turn
+            move_count += 1
+
+        restore_board_state(board, board_state)
+        return principal_variation
@@ -0,0 +1,267 @@
+import argparse
+import contextlib
+import importlib
+import io
+import multiprocessing
+import random
+import time
+import ChessGame
+from ChessPieces import Pawn, King
+from ChessPosition import MAX_RANK, MAX_FILE, save_board_state, restore_board_state, board_to_fen, move_to_text
+
+# The rules functions a candidate implementation can replace. A candidate is a module defining any of them, with the
+# same arguments as in ChessGame.py. Functions it doesn't define are taken from ChessGame.py.
+# A candidate may also define is_documented_correction(probe, reference_result, candidate_result), returning True
+# for differences that are intended (i.e. a bug fixed on purpose), so they aren't reported.
+RULES_FUNCTIONS = ["move_is_invalid", "castle_is_invalid", "pawn_captures_properly", "is_game_over"]
+
+# The implementation the candidate is compared with
+REFERENCE_FUNCTIONS = {name: getattr(ChessGame, name) for name in RULES_FUNCTIONS}
+
+# How many random moves are tried with move_is_invalid in each position
+MOVE_PROBES_PER_POSITION = 12
+
+
+# Loads the rules functions of a candidate module (given by name, i.e. "FastRules"). Returns a dictionary mapping
+# each function's name to the function, and the candidate's is_documented_correction (or None).
+def load_candidate(module_name):
+    module = importlib.import_module(module_name)
+    functions = {name: getattr(module, name, getattr(ChessGame, name)) for name in RULES_FUNCTIONS}
+    return functions, getattr(module, "is_documented_correction", None)
+
+
+# Returns the piece on the square, or None if the square is empty
+def find_piece(board, square):
+    return next((piece for piece in board if piece.get_position() == list(square) and not piece.is_captured()), None)
+
+
+# Picks the checks to run on a position. Each probe is a tuple that starts with the function's name, followed by the
+# squares it is called with, so a probe can be tried again on another board (i.e. while shrinking a move list).
+# Moves are tried from the pieces of both players, to squares they can reach by their movement rules and to random
+# squares (some of them off the board). Every king is tried castling both ways, every pawn capturing both ways, and the
+# side to move is checked for the end of the game.
+def generate_probes(board, is_white_turn, rng):
+    pieces = [piece for piece in board if not piece.is_captured()]
+    probes = []
+
+    for probe_number in range(MOVE_PROBES_PER_POSITION):
+        piece = rng.choice(pieces)
+        origin = tuple(piece.get_position())
+        reachable = [(rank, file) for rank in range(MAX_RANK) for file in range(MAX_FILE)
+                     if piece.is_legal_move([rank, file])]
+        if reachable and probe_number % 2 == 0:
+            destination = rng.choice(reachable)
+        else:
+            destination = (rng.randint(-1, MAX_RANK), rng.randint(-1, MAX_FILE))
+        probes.append(("move_is_invalid", origin, destination))
+
+    for piece in pieces:
+        rank, file = piece.get_position()
+        if isinstance(piece, King):
+            for destination_rank in [rank - 2, rank + 2]:
+                if 0 <= destination_rank < MAX_RANK:
+                    probes.append(("castle_is_invalid", (rank, file), (destination_rank, file)))
+        elif isinstance(piece, Pawn):
+            direction = 1 if piece.is_white() else -1
+            for destination_rank in [rank - 1, rank + 1]:
+                if 0 <= destination_rank < MAX_RANK and 0 <= file + direction < MAX_FILE:
+                    probes.append(("pawn_captures_properly", (rank, file), (destination_rank, file + direction)))
+
+    probes.append(("is_game_over", is_white_turn))
+    return probes
+
+
+# Runs a probe with one implementation of the rules. Returns the function's result together with anything it printed
+# and whether it left the board unchanged, or None if the probe doesn't apply to the board (i.e. its piece is missing).
+def run_probe(functions, probe, board, is_white_turn, move_count):
+    board_state = save_board_state(board)
+    output = io.StringIO()
+
+    with contextlib.redirect_stdout(output):
+        match probe:
+            case ("move_is_invalid", origin, destination):
+                piece = find_piece(board, origin)
+                if piece is None:
+                    return None
+                result = functions["move_is_invalid"](board, piece, list(destination), is_white_turn, move_count)
+            case ("castle_is_invalid", origin, destination):
+                king = find_piece(board, origin)
+                if not isinstance(king, King):
+                    return None
+                result = functions["castle_is_invalid"](board, king, list(destination), move_count)
+            case ("pawn_captures_properly", origin, destination):
+                pawn = find_piece(board, origin)
+                if not isinstance(pawn, Pawn):
+                    return None
+                result = functions["pawn_captures_properly"](board, pawn, list(destination), move_count)
+            case ("is_game_over", is_white_king):
+                king = next(piece for piece in board if isinstance(piece, King) and piece.is_white() == is_white_king)
+                threatening_piece = ChessGame.piece_threatening_king(board, king, move_count)
+                result = functions["is_game_over"](board, king, threatening_piece, move_count)
+
+    # A function that doesn't put the board back as it found it is reported too
+    board_unchanged = save_board_state(board) == board_state
+    if not board_unchanged:
+        restore_board_state(board, board_state)
+    return result, output.getvalue(), board_unchanged
+
+
+# Runs a probe with both implementations. Returns (reference result, candidate result) if they disagree (and the
+# difference isn't a documented correction), otherwise None.
+def compare_probe(candidate, probe, board, is_white_turn, move_count):
+    functions, is_documented_correction = candidate
+    reference_result = run_probe(REFERENCE_FUNCTIONS, probe, board, is_white_turn, move_count)
+    candidate_result = run_probe(functions, probe, board, is_white_turn, move_count)
+    if reference_result == candidate_result:
+        return None
+    if is_documented_correction is not None and is_documented_correction(probe, reference_result, candidate_result):
+        return None
+    return reference_result, candidate_result
+
+
+# Replays a move list from the starting position, checking every move with the reference rules. Returns
+# (board, is_white_turn, move_count) after the last move, or None if any move is illegal.
+def replay_moves(moves):
+    board = ChessGame.create_board()
+    is_white_turn = True
+    move_count = 1
+    for origin, destination, promotion_type in moves:
+        piece = find_piece(board, origin)
+        if piece is None or ChessGame.move_is_invalid(board, piece, list(destination), is_white_turn, move_count):
+            return None
+        ChessGame.play_move(board, list(origin), list(destination), move_count, promotion_type)
+        is_white_turn = not is_white_turn
+        move_count += 1
+    return board, is_white_turn, move_count
+
+
+# Checks if the probe still shows a disagreement after playing the move list
+def reproduces(candidate, moves, probe):
+    position = replay_moves(moves)
+    if position is None:
+        return False
+    board, is_white_turn, move_count = position
+    if probe[0] == "is_game_over":
+        probe = ("is_game_over", is_white_turn)
+    return compare_probe(candidate, probe, board, is_white_turn, move_count) is not None
+
+
+# Shrinks a move list that leads to a disagreement, by removing runs of moves as long as the remaining moves are still
+# legal and still lead to the disagreement. Every run length is tried, from the whole list down to single moves, since
+# removing an odd number of moves from anywhere but the end swaps the colors of the moves after it, and so is rarely
+# legal (i.e. a white move and black's reply have to be removed together). Returns the shortest list found.
+def shrink_moves(candidate, moves, probe):
+    run_length = len(moves)
+    while run_length >= 1:
+        start = 0
+        while start + run_length <= len(moves):
+            shorter_moves = moves[:start] + moves[start + run_length:]
+            if reproduces(candidate, shorter_moves, probe):
+                moves = shorter_moves
+            else:
+                start += 1
+        run_length = min(run_length - 1, len(moves))
+    return moves
+
+
+# Plays one random game (chosen by its seed) and runs the probes on every position reached. Stops at the first
+# disagreement, which is shrunk to a minimal move list. Returns (positions checked, probes run, disagreement), where
+# disagreement is (seed, moves, probe, reference result, candidate result), or None.
+def fuzz_game(candidate, seed, max_plies):
+    rng = random.Random(seed)
+    moves, result = ChessGame.play_random_game(rng, max_plies)
+
+    board = ChessGame.create_board()
+    is_white_turn = True
+    move_count = 1
+    positions = 0
+    probes_run = 0
+
+    for ply in range(len(moves) + 1):
+        positions += 1
+        for probe in generate_probes(board, is_white_turn, rng):
+            probes_run += 1
+            difference = compare_probe(candidate, probe, board, is_white_turn, move_count)
+            if difference is not None:
+                moves = shrink_moves(candidate, moves[:ply], probe)
+                board, is_white_turn, move_count = replay_moves(moves)
+                if probe[0] == "is_game_over":
+                    probe = ("is_game_over", is_white_turn)
+                difference = compare_probe(candidate, probe, board, is_white_turn, move_count)
+                return positions, probes_run, (seed, moves, probe) + difference
+
+        if ply < len(moves):
+            origin, destination, promotion_type = moves[ply]
+            ChessGame.play_move(board, origin, destination, move_count, promotion_type)
+            is_white_turn = not is_white_turn
+            move_count += 1
+
+    return positions, probes_run, None
+
+
+# Worker for fuzz: plays the games of one shard (a range of seeds)
+def fuzz_shard(shard):
+    candidate_name, first_seed, game_count, max_plies = shard
+    candidate = load_candidate(candidate_name)
+    positions = 0
+    probes_run = 0
+    disagreements = []
+    for seed in range(first_seed, first_seed + game_count):
+        game_positions, game_probes, disagreement = fuzz_game(candidate, seed, max_plies)
+        positions += game_positions
+        probes_run += game_probes
+        if disagreement is not None:
+            disagreements.append(disagreement)
+    return positions, probes_run, disagreements
+
+
+# Compares the candidate's rules with the reference rules on a number of random games (seeds first_seed onwards), split
+# into shards that run on separate processes. Prints every disagreement with the shortest move list that reproduces it,
+# and how many positions were checked per second. Returns the list of disagreements.
+def fuzz(candidate_name, games, first_seed=0, processes=None, shard_size=10, max_plies=120):
+    shards = [(candidate_name, seed, min(shard_size, first_seed + games - seed), max_plies)
+              for seed in range(first_seed, first_seed + games, shard_size)]
+
+    start_time = time.perf_counter()
+    if processes == 1:
+        results = [fuzz_shard(shard) for shard in shards]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(fuzz_shard, shards, chunksize=1)
+    elapsed = time.perf_counter() - start_time
+
+    positions = sum(result[0] for result in results)
+    probes_run = sum(result[1] for result in results)
+    disagreements = [disagreement for result in results for disagreement in result[2]]
+
+    for seed, moves, probe, reference_result, candidate_result in disagreements:
+        position = replay_moves(moves)
+        print(f"Game {seed}: {probe[0]}{probe[1:]} disagrees after {len(moves)} move(s): "
+              f"{' '.join(move_to_text(move) for move in moves) or '(starting position)'}")
+        print(f"    FEN:       {board_to_fen(*position)}")
+        print(f"    reference: {reference_result}")
+        print(f"    candidate: {candidate_result}")
+
+    positions_per_second = positions / elapsed if elapsed > 0 else 0
+    print(f"\n{games} game(s), {positions} positions, {probes_run} checks in {elapsed:.2f}s "
+          f"({positions_per_second:.0f} positions/s), {len(disagreements)} disagreement(s)")
+    return disagreements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a candidate implementation of the rules with ChessGame.py "
+                                                 "on random games.")
+    parser.add_argument("candidate", help="name of the module with the candidate rules functions")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--processes", type=int, help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--shard-size", type=int, default=10, help="games per shard")
+    parser.add_argument("--max-plies", type=int, default=120, help="length limit of each game")
+    args = parser.parse_args()
+
+    disagreements = fuzz(args.candidate, args.games, args.seed, args.processes, args.shard_size, args.max_plies)
+    raise SystemExit(1 if disagreements else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
+import threading
+import time
+from collections import OrderedDict
 from ChessPieces import Pawn, Bishop, Knight, Rook, Queen, King
+from ChessPosition import (PositionHistory, position_hash, POSITION_SIZE, pack_position, unpack_position,
+                           save_board_state, restore_board_state)
 
 # Constants that represent board dimensions
 MAX_RANK = 8
@@ -25,8 +30,14 @@ error_messages = {
     16: "Cannot castle, your king will be in check!"
 }
 
+# Ways the game can end (see get_game_over_status)
+STALEMATE = "stalemate"
+CHECKMATE = "checkmate"
 
-def main():
+
+# Runs the game. If a journal (see ChessJournal) is given, every move is recorded in it as game number game_number, and
+# if that game was left unfinished (i.e. the program was closed or crashed), it is picked up where it was left off.
+def main(journal=None, game_number=0):
 
     is_white_turn = True  # To keep track of whose turn it is
     turn_number = 0  # To keep track of the turn number
@@ -34,9 +45,148 @@ def main():
     threatening_piece = None  # To warn player if they are in check.
     # Set to none initially because there is no piece threatening the king yet
 
+    # The variation tree needs ChessGame itself, so it is only imported once ChessGame has loaded
+    from ChessVariations import VariationTree
+
     # Instantiate the board
+    board = create_board()
+
+    # Keep a record of every position reached so that draws by repetition and the fifty-move rule can be detected
+    history = PositionHistory(board)
+
+    # Keep every move in a variation tree, so moves can be taken back
+    variations = VariationTree(board)
+
+    # Remember the legal moves of recent positions, so that re-prompts and hints don't need to validate moves again.
+    # The cache is large enough to also hold the opponent's positions that are validated ahead of time
+    move_cache = LegalMoveCache(max_positions=128)
+
+    # Work out the moves and their results in the background while the player is thinking
+    analysis = BackgroundAnalysis(move_cache)
+
+    # Replay the unfinished game from the journal, if there is one, so the history and the takebacks are as they were.
+    # Otherwise start recording a new game
+    if journal is not None and game_number in journal.get_games():
+        for origin, destination, promotion_type in journal.get_games()[game_number].get_moves():
+            play_move(board, origin, destination, move_count, promotion_type, history)
+            variations.record_move(origin, destination, promotion_type)
+            is_white_turn = not is_white_turn
+            move_count += 1
+        turn_number = (move_count + 1) // 2 - (1 if is_white_turn else 0)  # The turn number goes up again below
+        king = next((piece for piece in board if isinstance(piece, King) and piece.is_white() == is_white_turn))
+        threatening_piece = piece_threatening_king(board, king, move_count - 1)
+    elif journal is not None:
+        journal.start_game(game_number)
+
+    # Print welcome message
+    print_welcome_message()
+
+    # Begin playing. Iterate until a winner has been determined. The background analysis is stopped however the game
+    # ends, including when the input is closed or the player presses Ctrl-C
+    try:
+        while True:
+
+            # If it is white's turn, one turn has passed. Increment turn counter
+            if is_white_turn:
+                turn_number += 1
+
+            # Display board
+            print_board(board)
+
+            # If player is in check, print warning
+            if threatening_piece is not None:
+                print("CHECK!")
+
+            # Print turn number
+            print(f"Turn number {turn_number}. ", end='')
+
+            # Get user input for move, analysing the position while waiting for it
+            analysis.start(board, is_white_turn, move_count)
+            can_undo = variations.get_current_node() != 0
+            selected_piece, destination = get_move(board, is_white_turn, move_count, move_cache, can_undo)
+
+            # Validate the move
+            while selected_piece is not None and (err_code := move_cache.get_error_code(board, selected_piece,
+                                                                                        destination, is_white_turn,
+                                                                                        move_count)):
+
+                # If it is invalid, print appropriate error message and re-prompt user for a new move
+                print(f"Invalid move: {error_messages[err_code]}")
+                selected_piece, destination = get_move(board, is_white_turn, move_count, move_cache, can_undo)
+
+            # The player has made their move, so the background analysis is no longer needed
+            analysis.stop()
+
+            # If the player asked to take back the last move, go back to the position before it. The turn goes back to
+            # the player who made that move
+            if selected_piece is None:
+                variations.undo()
+                history.take_back(board)
+                if journal is not None:
+                    journal.record_take_back(game_number)
+                is_white_turn = not is_white_turn
+                move_count -= 1
+                turn_number = (move_count + 1) // 2 - (1 if is_white_turn else 0)  # The turn number goes up again below
+                king = next((piece for piece in board if isinstance(piece, King) and piece.is_white() == is_white_turn))
+                threatening_piece = piece_threatening_king(board, king, move_count - 1)
+                continue
+
+            # Execute the move
+            origin = selected_piece.get_position()
+            execute_move(board, selected_piece, destination, move_count, history)
+
+            # See if the player moved a pawn
+            promotion_type = None
+            if isinstance(selected_piece, Pawn):
+
+                # If so, check if it has reached the last file, and if it has, promote it
+                promoted_piece = promote_pawn(board, selected_piece, history)
+                if promoted_piece is not selected_piece:
+                    promotion_type = type(promoted_piece)
+
+            # Add the move to the variation tree, and to the journal (which returns once the move is safely on disk)
+            variations.record_move(origin, destination, promotion_type)
+            if journal is not None:
+                journal.record_move(game_number, origin, destination, promotion_type)
+
+            # Find the opposing king
+            opposing_king = next((piece for piece in board if isinstance(piece, King)
+                                  and piece.is_white() != is_white_turn))
+
+            # See if the opponent is in check so that they can be alerted next turn, and check for the end of the game.
+            # Both are usually known already from the background analysis
+            threatening_piece, status = analysis.get_end_status(board, opposing_king, move_count)
+            if status is not None:
+
+                # End the game if there is a winner/stalemate
+                print_game_over(board, opposing_king, status)
+                if journal is not None:
+                    result = "1/2-1/2" if status == STALEMATE else "1-0" if is_white_turn else "0-1"
+                    journal.end_game(game_number, result)
+                input("(Press Enter to exit) ")
+                return
+
+            # Check for a draw by threefold repetition or the fifty-move rule
+            if is_draw_by_rule(board, history):
+                if journal is not None:
+                    journal.end_game(game_number, "1/2-1/2")
+                input("(Press Enter to exit) ")
+                return
+
+            # If there is no winner, the next player gets a turn.
+            is_white_turn = not is_white_turn
+
+            # Increment move counter (for en passant captures)
+            move_count += 1
+
+    finally:
+        analysis.stop()
+
+# Creates the board with every piece on its starting square. Returns the list of pieces.
+def create_board():
+
     # Instantiate all pieces. Both colors get eight pawns, two bishops, two knights, two rooks, one queen, and one king.
-    board = [
+    return [
         # White pieces
         Pawn(True, [0, 1]),
         Pawn(True, [1, 1]),
@@ -84,99 +234,28 @@ def main():
         King(False, [4, 7]),
     ]
 
-    # Print welcome message
-    print_welcome_message()
-
-    # Begin playing. Iterate until a winner has been determined
-    while True:
-
-        # If it is white's turn, one turn has passed. Increment turn counter
-        if is_white_turn:
-            turn_number += 1
-
-        # Display board
-        print_board(board)
-
-        # If player is in check, print warning
-        if threatening_piece is not None:
-            print("CHECK!")
-
-        # Print turn number
-        print(f"Turn number {turn_number}. ", end='')
-
-        # Get user input for move
-        selected_piece, destination = get_move(board, is_white_turn)
-
-        # Validate the move
-        while err_code := move_is_invalid(board, selected_piece, destination, is_white_turn, move_count):
-
-            # If it is invalid, print appropriate error message and re-prompt user for a new move
-            print(f"Invalid move: {error_messages[err_code]}")
-            selected_piece, destination = get_move(board, is_white_turn)
-
-        # Execute the move
-        execute_move(board, selected_piece, destination, move_count)
-
-        # See if the player moved a pawn
-        if isinstance(selected_piece, Pawn):
-
-            # If so, check if it has reached the last file, and if it has, promote it
-            promote_pawn(board, selected_piece)
-
-        # Find the opposing king
-        opposing_king = next((piece for piece in board if isinstance(piece, King)
-                              and piece.is_white() != is_white_turn))
-
-        # See if the opponent is in check so that they can be alerted next turn
-        threatening_piece = piece_threatening_king(board, opposing_king, move_count)
-
-        # Check for the end of the game
-        if is_game_over(board, opposing_king, threatening_piece, move_count):
-
-            # End the game if there is a winner/stalemate
-            input("(Press Enter to exit) ")
-            return
-
-        # If there is no winner, the next player gets a turn.
-        is_white_turn = not is_white_turn
-
-        # Increment move counter (for en passant captures)
-        move_count += 1
-
 
 # Prints the welcome message. User hits enter to continue after reading.
 def print_welcome_message():
-    print("   ________                  ")
-    print("  / ____/ /_  ___  __________ ")
-    print(" / /   / __ \\/ _ \\/ ___/ ___/")
-    print("/ /___/ / / /  __/__  |__  / ")
-    print("\\____/_/ /_/\\___/____/____/")
-    print("      -Coded by Andrew Dagger\n")
-    print("APPEARANCE:\n")
-    print("\tThis game was intended to be played in a dark theme. If your terminal window is \n\tlight "
-          "themed, the colors are all opposite.\n")
-    print("\tOn Windows, white pawns render as off-center, purple emojis. So, \n\tI have decided to replace them with "
-          "diamonds. Get it together, Microsoft.\n")
-    print("USAGE:\n")
-    print("\tTo move a piece, type the square in which it is located, followed by the \n\tsquare you wish to move it"
-          " to. For example, If white wants to move its \n\tpawn located at a2 up two squares "
-          "to a4, they would type \"a2 a4\".\n")
-    print("\tTo castle the king, move the king two spaces in the direction you wish to castle. \n\tThe rook will be "
-          "moved automatically. For example, If white wants \n\tto castle on the queen (left) side, they would type"
-          " \"e1 c1\". If it is a valid move, \n\tthe king will be moved to c1 and the leftmost rook to d1.\n")
-    print("\tAt the beginning of your turn, you may type \"rules\" to \n\treview the movement rules for each piece, "
-          "or \"usage\" to \n\tremind yourself how to move pieces.\n")
+    from ChessHelp import WELCOME_TEXT  # Imported here, so the help texts are only loaded when shown
+    print(WELCOME_TEXT, end="")
     input("Ready? press enter.")
 
 
 # Prints the board and a list of pieces that are captured
 def print_board(board):
+    print(format_board(board), end='')
+
+
+# Builds the text printed by print_board: the board and a list of pieces that are captured
+def format_board(board):
+    text = []  # To hold the pieces of text as they are built up
     empty = None  # For checking if a piece is in a square
 
     # Iterate over every rank and file
-    print()
+    text.append("\n")
     for file in range(MAX_FILE - 1, -1, -1):
-        print(file + 1, end=' ')
+        text.append(f"{file + 1} ")
         for rank in range(MAX_RANK):
 
             # Iterate over every piece
@@ -185,7 +264,7 @@ def print_board(board):
                 # If a piece is at the given rank and file, print it
                 empty = True
                 if piece.get_position() == [rank, file] and not piece.is_captured():
-                    print(f"{piece} ", end='')
+                    text.append(f"{piece} ")
                     empty = False
                     break
 
@@ -194,29 +273,33 @@ def print_board(board):
 
                 # Black squares are even
                 if (file + rank) % 2 == 0:
-                    print("\u25a1\u2003", end='')
+                    text.append("\u25a1\u2003")
 
                 # White are odd
                 else:
-                    print("\u25a0\u2003", end='')
-        print()
+                    text.append("\u25a0\u2003")
+        text.append("\n")
 
     # Print files
     # print("  \u200aᴬ\u200b\u200aᴮ\u2000 ᶜ \u2000ᴰ \u2000ᴱ \u2000ᶠ  ᴳ \u200a\u200aᴴ")  # for pycharm
-    print("  a b c d e f g h")
+    text.append("  a b c d e f g h\n")
 
     # Print captured pieces
-    print("\nCaptured pieces: ")
+    text.append("\nCaptured pieces: \n")
     for piece in board:
         if piece.is_captured():
-            print(f"{piece} ", end='')
-    print("\n")
+            text.append(f"{piece} ")
+    text.append("\n\n")
+
+    return "".join(text)
 
 
 # Prompts the user for a move and checks the format of the input. Ensures that two squares were selected, that
 # they are within bounds, and that a piece was selected.
 # Re-prompts user until they give valid input. Returns a reference to selected piece, and destination square coordinates
-def get_move(board, is_white_turn):
+# If a legal move cache is given, the board is redrawn from it, and the user can ask for the legal moves of a piece.
+# If can_undo is True, the user can type "undo" to take back the last move, in which case (None, None) is returned.
+def get_move(board, is_white_turn, move_count=None, move_cache=None, can_undo=False):
 
     selected_piece = None  # To hold the piece chosen by the user
 
@@ -234,11 +317,23 @@ def get_move(board, is_white_turn):
         # See if user is requesting help
         if move == ["rules"]:
             print_movement_rules()
-            print_board(board)
+            print_cached_board(board, is_white_turn, move_count, move_cache)
             continue
         if move == ["usage"]:
             print_usage()
-            print_board(board)
+            print_cached_board(board, is_white_turn, move_count, move_cache)
+            continue
+
+        # See if user wants to take back the last move. Returns (None, None) if there is one to take back
+        if move == ["undo"]:
+            if can_undo:
+                return None, None
+            print("There is no move to take back.")
+            continue
+
+        # See if user is asking for the legal moves of a piece (i.e. "moves e2")
+        if len(move) == 2 and move[0] == "moves" and move_cache is not None:
+            print_legal_moves(board, move[1], is_white_turn, move_count, move_cache)
             continue
 
         # Ensure user selected two squares
@@ -270,57 +365,40 @@ def get_move(board, is_white_turn):
         return selected_piece, destination
 
 
+# Redraws the board, using the copy stored in the legal move cache if there is one
+def print_cached_board(board, is_white_turn, move_count, move_cache):
+    if move_cache is None:
+        print_board(board)
+    else:
+        print(move_cache.get_position_moves(board, is_white_turn, move_count).get_board_text(), end='')
+
+
+# Prints every square the piece on the given square (i.e. "e2") can legally move to. The moves come from the legal move
+# cache, so asking again (or trying one of them) doesn't need any further validation.
+def print_legal_moves(board, square, is_white_turn, move_count, move_cache):
+    origin = [ord(square[0]) - 97, ord(square[1]) - 49] if len(square) == 2 else None
+    destinations = move_cache.get_position_moves(board, is_white_turn, move_count).get_legal_destinations(origin)
+
+    # Print the destinations, marking those that promote a pawn
+    if destinations:
+        print(f"Legal moves for {square}: " + " ".join(
+            chr(destination[0] + 97) + chr(destination[1] + 49) + (" (promotion)" if promotes else "")
+            for destination, promotes in destinations))
+    else:
+        print(f"There are no legal moves for {square}.")
+
+
 # Prints information regarding the movement rules for each piece,
 # as well as how castling and capturing en passant works.
 def print_movement_rules():
-    print("MOVEMENT RULES:\n")
-    print("\tPawns (\u2659) generally move one space vertically towards the opponents side, \n\twith some exceptions: "
-          "Pawns cannot capture moving vertically, but they \n\tcan move one space forwards diagonally to capture a "
-          "piece. They have the \n\toption to move two spaces vertically only on their first turn.\n")
-    print("\tRooks (\u2656) can move vertically or horizontally any number of spaces. "
-          "\n\tThey may also castle with the king if neither piece has moved yet.\n")
-    print("\tBishops (\u2657) can move diagonally any amount of spaces.\n")
-    print("\tKnights (\u2658) move in an \'L\' shaped pattern. More specifically, they can \n\tmove either up/down one"
-          " and left/right two, or up/down two and right/left one. \n\tAlso, knights can hop over "
-          "pieces, meaning their path is never blocked.\n")
-    print("\tQueens (\u2655) can vertically, horizontally, or diagonally any number of spaces.\n")
-    print("\tKings (\u2654) can move one space in any direction. They may also castle with any rook if \n\tneither"
-          " piece has moved yet. If an opposing player \n\tis one move away from capturing your king, that means"
-          " your king is in \"check\". \n\tYou must remove the check on your next turn (by moving the king out of "
-          "\n\tthe way or capturing/blocking the threatening piece), and any move that \n\tdoesn't do "
-          "so is considered illegal. Also, any move \n\tthat puts your own king in check is illegal as well.\n")
-    print("SPECIAL MOVES:\n")
-    print("\tEn passant rule: When a pawn moves two spaces on its first turn, it is vulnerable \n\tto being captured"
-          " en passant. This special type of capture occurs \n\tif an opposing player moves their pawn diagonally"
-          " one space BEHIND the player's \n\tpawn, as if it had only moved one square. En passant captures must meet"
-          " the following criteria: \n\n\t1.) A pawn can only be captured en passant if it has moved two squares on its"
-          " first turn. \n\t2.) The opponent can only use a pawn to perform an en passant capture. \n\t3.) The opponent"
-          " must perform the en passant capture on the turn immediately after \n\twhite's pawn moved, and no later."
-          " \n\t4.) The opponent must move their pawn diagonally one space behind the pawn to capture it. \n\n\tHere "
-          "is an example on how an en passant could be performed: \n\n\t1.) White moves its pawn at a2 to a4. \n\t2.) "
-          "Black has a pawn on b4. On the turn immediately after white \n\tmoved its pawn, black moves its pawn to a3. "
-          "\n\t3.) White's pawn has been captured en passant.\n")
-    print("\tCastling: A king and a rook can castle if neither have moved yet. To castle, \n\tthe king moves two"
-          " spaces towards the rook it is castling with, \n\tand the rook moves to the square behind the king. "
-          "Castling must follow these rules: \n\n\t1.) It must be the first time either piece has been moved. \n\t2). "
-          "The path between the king and the rook cannot be obstructed. \n\t3.) You cannot castle out of, through, or "
-          "into check. \n\tFor example, say your king is castling from e1 to c1. For the castle to work, \n\tyour king "
-          "cannot currently be in check, and squares d1 and c1 \n\tmust not be threatened by an opponent's piece."
-          " \n\n\tHere is an example on how a castle can be performed: \n\n\t1.) White wants to castle its king at e1 "
-          "with its rook at a1. \n\t2.) No piece is in between the king and the rook. \n\tThe king is not moving out "
-          "of, through, or into check. \n\t3.) White moves its king two spaces to c1, and the rook \n\tto the "
-          "space behind where the king moved (d1).\n")
+    from ChessHelp import MOVEMENT_RULES_TEXT
+    print(MOVEMENT_RULES_TEXT, end="")
 
 
 # Prints information regarding how to give proper input.
 def print_usage():
-    print("\nUSAGE:\n")
-    print("\tTo move a piece, type the square in which it is located, followed by the \n\tsquare you wish to move it"
-          " to. For example, If white wants to move its \n\tpawn located at a2 up two squares "
-          "to a4, they would type \"a2 a4\".\n")
-    print("\tTo castle the king, move the king two spaces in the direction you wish to castle. \n\tThe rook will be "
-          "moved automatically. For example, If white wants \n\tto castle on the queen (left) side, they would type"
-          " \"e1 c1\". If it is a valid move, \n\tthe king will be moved to c1 and the leftmost rook to d1.\n")
+    from ChessHelp import USAGE_TEXT
+    print(USAGE_TEXT, end="")
 
 
 # This function checks to see if the proposed move is invalid. If it is invalid, an int representing an error code is
@@ -465,7 +543,7 @@ def path_unblocked(board, piece, destination):
     # pawn_captures_properly function will handle it
     if isinstance(piece, Pawn) and origin[0] == destination[0]:
         for chess_piece in board:
-            if chess_piece.get_position() == destination:
+            if chess_piece.get_position() == destination and not chess_piece.is_captured():
                 return False
 
     # If move passes every check, move is valid
@@ -530,7 +608,8 @@ def pawn_captures_properly(board, pawn, destination, move_count):
 
     # Ensure destination contains piece of opposite color, and if it does, return True
     for chess_piece in board:
-        if chess_piece.get_position() == destination and chess_piece.is_white() != pawn.is_white():
+        if (chess_piece.get_position() == destination and chess_piece.is_white() != pawn.is_white()
+                and not chess_piece.is_captured()):
             return True
 
     # If it doesn't, we can assume based on the previous checks that the square is empty. In this case, an en passant
@@ -539,7 +618,8 @@ def pawn_captures_properly(board, pawn, destination, move_count):
     # two on the previous turn (making it capturable en passant). If all checks pass, a valid en passant capture is
     # taking place. return True.
     for chess_piece in board:
-        if chess_piece.get_position() == [destination[0], origin[1]] and isinstance(chess_piece, Pawn):
+        if (chess_piece.get_position() == [destination[0], origin[1]] and isinstance(chess_piece, Pawn)
+                and not chess_piece.is_captured()):
             if chess_piece.get_move_when_capturable_en_passant() == move_count:
                 return True
 
@@ -577,7 +657,7 @@ def move_leaves_king_in_check(board, piece, destination, move_count):
     piece.set_position(original_position)
     if temporarily_captured_piece is not None:
         temporarily_captured_piece.un_capture()
-    if isinstance(piece, Pawn) and piece.get_move_when_capturable_en_passant() == move_count:
+    if isinstance(piece, Pawn) and piece.get_move_when_capturable_en_passant() == move_count + 1:
         piece.set_move_when_capturable_en_passant(0)
     if reset_first_move:
         piece.set_has_moved(False)
@@ -590,7 +670,8 @@ def move_leaves_king_in_check(board, piece, destination, move_count):
 # captures, including en passant captures. If a pawn moves 2 forward on its first move, makes a note of the turn in
 # which it is capturable en passant. Returns a reference to the piece captured so that the move_leaves_king_in_check
 # function can undo the move (if a capture took place, else it returns None).
-def execute_move(board, piece, destination, move_count):
+# If a position history is given, the move is recorded in it (moves that are only being tested are not recorded).
+def execute_move(board, piece, destination, move_count, history=None):
 
     origin = piece.get_position()   # To hold the square in which the piece is moving from
     captured_piece = None   # To hold piece that is captured, if any
@@ -599,6 +680,10 @@ def execute_move(board, piece, destination, move_count):
     if isinstance(piece, King) and abs(origin[0] - destination[0]) == 2:
         execute_castle(board, piece, destination)
 
+        # Record the new position. Castling is not a capture or pawn move, so the halfmove clock keeps counting
+        if history is not None:
+            history.record_move(board, not piece.is_white(), move_count + 1, False)
+
         # Nothing else needs to happen. Return None since no pieces can be captured in a castle.
         return None
 
@@ -621,7 +706,8 @@ def execute_move(board, piece, destination, move_count):
 
             # Find the pawn that is being captured en passant, and capture it
             for chess_piece in board:
-                if chess_piece.get_position() == [destination[0], origin[1]]:
+                if (chess_piece.get_position() == [destination[0], origin[1]] and isinstance(chess_piece, Pawn)
+                        and not chess_piece.is_captured()):
                     captured_piece = chess_piece
                     captured_piece.capture()
                     break
@@ -637,6 +723,18 @@ def execute_move(board, piece, destination, move_count):
     # Move piece
     piece.set_position(destination)
 
+    # Keep the pawn hash up to date: a captured pawn leaves the board, and a moving pawn changes squares
+    if history is not None:
+        if isinstance(captured_piece, Pawn):
+            history.update_pawn_hash(captured_piece, captured_piece.get_position(), None)
+        if isinstance(piece, Pawn):
+            history.update_pawn_hash(piece, origin, destination)
+
+    # Record the new position. Captures and pawn moves reset the halfmove clock, since they can never be undone
+    if history is not None:
+        history.record_move(board, not piece.is_white(), move_count + 1,
+                            captured_piece is not None or isinstance(piece, Pawn))
+
     # Return the piece that was captured (if any) so that the move_leaves_king_in_check
     return captured_piece
 
@@ -669,6 +767,355 @@ def execute_castle(board, king, destination):
     rook.set_has_moved(True)
 
 
+# Finds every legal move for the player whose turn it is. Returns a list of (piece, destination) pairs.
+# Squares the piece can't reach according to its movement rules are skipped before the (much slower) full validation.
+def get_legal_moves(board, is_white_turn, move_count):
+
+    legal_moves = []  # To hold every legal move found
+
+    for chess_piece in board:
+        if chess_piece.is_captured() or chess_piece.is_white() != is_white_turn:
+            continue
+
+        # Try every square on the board
+        for rank in range(MAX_RANK):
+            for file in range(MAX_FILE):
+                destination = [rank, file]
+                if (chess_piece.is_legal_move(destination)
+                        and not move_is_invalid(board, chess_piece, destination, is_white_turn, move_count)):
+                    legal_moves.append((chess_piece, destination))
+
+    return legal_moves
+
+
+# Legality data for one position: the error code (see error_messages) of every move the player to move could try
+# with one of their pieces, and the board as drawn by print_board. If a stop event is given, it is checked before each
+# piece, and once it is set the remaining pieces are skipped, leaving the moves incomplete (see is_complete).
+class PositionMoves:
+    def __init__(self, board, is_white_turn, move_count, stop_event=None):
+        self._error_codes = {}  # Maps (origin, destination) square tuples to error codes (0 for legal moves)
+        self._promotions = set()  # Legal moves that promote a pawn
+        self._board_text = format_board(board)
+        self._complete = False
+
+        for chess_piece in board:
+            if stop_event is not None and stop_event.is_set():
+                return
+            if chess_piece.is_captured() or chess_piece.is_white() != is_white_turn:
+                continue
+            origin = tuple(chess_piece.get_position())
+
+            # Validate every square on the board
+            for rank in range(MAX_RANK):
+                for file in range(MAX_FILE):
+                    error_code = move_is_invalid(board, chess_piece, [rank, file], is_white_turn, move_count)
+                    self._error_codes[(origin, (rank, file))] = error_code
+                    if not error_code and isinstance(chess_piece, Pawn) and file in [0, MAX_FILE - 1]:
+                        self._promotions.add((origin, (rank, file)))
+        self._complete = True
+
+    # Returns the error code of the move, or None if it wasn't validated (i.e. it starts from an opposing piece or ends
+    # off the board)
+    def get_error_code(self, origin, destination):
+        return self._error_codes.get((tuple(origin), tuple(destination)))
+
+    # Returns a list of (origin, destination) square tuples for every legal move
+    def get_legal_moves(self):
+        return [move for move, error_code in self._error_codes.items() if not error_code]
+
+    # Returns a list of (destination, promotes) pairs for every legal move of the piece on the origin square
+    def get_legal_destinations(self, origin):
+        origin = tuple(origin) if origin is not None else None
+        return [(list(destination), (origin, destination) in self._promotions)
+                for (move_origin, destination), error_code in self._error_codes.items()
+                if move_origin == origin and not error_code]
+
+    def get_board_text(self):
+        return self._board_text
+
+    # Returns False if the validation was stopped before every piece was done
+    def is_complete(self):
+        return self._complete
+
+
+# Identifies a position for looking up its PositionMoves. Besides the position's hash, whether each king has moved is
+# part of the key, since it decides which error a castling attempt gets even when castling is impossible either way.
+# The flags are keyed by color (white's, then black's), so the order of the pieces in the board list doesn't matter.
+def position_moves_key(board, is_white_turn, move_count):
+    king_moved = {piece.is_white(): piece.has_previously_moved() for piece in board if isinstance(piece, King)}
+    return position_hash(board, is_white_turn, move_count), king_moved.get(True), king_moved.get(False)
+
+
+# Keeps the PositionMoves of the most recently seen positions, so a position's moves are only validated once no matter
+# how many times the player is prompted. Positions are looked up with position_moves_key.
+# When the cache is full, the position that was used the longest time ago is forgotten.
+# The cache can be filled in from another thread (see BackgroundAnalysis), so it is only changed while holding a lock.
+# A position that is being validated by that thread is waited for rather than validated a second time.
+class LegalMoveCache:
+    def __init__(self, max_positions=16):
+        self._positions = OrderedDict()
+        self._max_positions = max_positions
+        self._pending = {}  # Maps the keys of positions being validated by precompute to an event set once they're done
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    # Returns the PositionMoves of the position, validating every move if it isn't in the cache yet
+    def get_position_moves(self, board, is_white_turn, move_count):
+        key = position_moves_key(board, is_white_turn, move_count)
+
+        # Use the cached moves if there are any, marking the position as the most recently used
+        with self._lock:
+            if key in self._positions:
+                self._hits += 1
+                self._positions.move_to_end(key)
+                return self._positions[key]
+            pending = self._pending.get(key)
+
+        # If the position is being validated in the background, wait for it. If that was stopped before it was done,
+        # the moves are validated here after all
+        if pending is not None:
+            pending.wait()
+            with self._lock:
+                if key in self._positions:
+                    self._hits += 1
+                    self._positions.move_to_end(key)
+                    return self._positions[key]
+
+        with self._lock:
+            self._misses += 1
+
+        # Otherwise validate the moves (without holding the lock, since it takes a while)
+        position_moves = PositionMoves(board, is_white_turn, move_count)
+        self._store(key, position_moves)
+        return position_moves
+
+    # Marks a position as about to be validated by precompute (unless it is cached already), so get_position_moves
+    # waits for it from now on, even if the thread calling precompute hasn't got to it yet
+    def claim(self, board, is_white_turn, move_count):
+        key = position_moves_key(board, is_white_turn, move_count)
+        with self._lock:
+            if key not in self._positions:
+                self._pending.setdefault(key, threading.Event())
+
+    # Validates the moves of a position ahead of time, unless they are cached already. Doesn't count as a hit or miss.
+    # Returns the position's PositionMoves, or None if the stop event was set before every piece was done (in which
+    # case nothing is cached).
+    def precompute(self, board, is_white_turn, move_count, stop_event=None):
+        key = position_moves_key(board, is_white_turn, move_count)
+        with self._lock:
+            if key in self._positions:
+                return self._positions[key]
+            done = self._pending.setdefault(key, threading.Event())
+
+        try:
+            position_moves = PositionMoves(board, is_white_turn, move_count, stop_event)
+            if position_moves.is_complete():
+                self._store(key, position_moves)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            done.set()
+        return position_moves if position_moves.is_complete() else None
+
+    # Adds a position's moves to the cache, forgetting the oldest position if there are too many
+    def _store(self, key, position_moves):
+        with self._lock:
+            self._positions[key] = position_moves
+            if len(self._positions) > self._max_positions:
+                self._positions.popitem(last=False)
+
+    # Same as move_is_invalid, but answered from the cache whenever possible
+    def get_error_code(self, board, piece, destination, is_white_turn, move_count):
+        error_code = self.get_position_moves(board, is_white_turn, move_count).get_error_code(piece.get_position(),
+                                                                                             destination)
+        if error_code is None:
+            error_code = move_is_invalid(board, piece, destination, is_white_turn, move_count)
+        return error_code
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+
+# Uses the time the game spends waiting for the player to type in a move. While the prompt waits, a background thread
+# works on a copy of the position: it validates every move of the player to move (so the move they submit is a cache
+# hit), then plays each legal move to see if it gives check or ends the game (so the checks after the move is made are
+# cache hits too), and finally validates the opponent's moves in each of those positions (so their next move is a hit).
+# Pawns are assumed to promote to a queen. The thread is stopped before the submitted move is played, so it never
+# competes with the game loop for time, and it checks for being stopped after every piece or move, so stopping never
+# waits long. If the move is submitted while the thread is still validating the player's moves, the game waits for it
+# to finish (see LegalMoveCache). Anything else it didn't get to is simply worked out when needed.
+class BackgroundAnalysis:
+    def __init__(self, move_cache, max_positions=128):
+        self._move_cache = move_cache
+        self._end_statuses = OrderedDict()  # Maps position_moves_key to (threatening square or None, game over status)
+        self._max_positions = max_positions
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+        self._hits = 0
+        self._misses = 0
+
+    # Starts analysing the position on a background thread (stopping any analysis that is still running)
+    def start(self, board, is_white_turn, move_count):
+        self.stop()
+
+        # The thread works on its own copy of the board, since the game keeps using the real one (i.e. for "moves e2")
+        packed_position = bytearray(POSITION_SIZE)
+        pack_position(packed_position, 0, board, is_white_turn, move_count)
+
+        # The position is claimed before the thread starts, so the game never validates it at the same time
+        self._move_cache.claim(board, is_white_turn, move_count)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._analyse, args=(bytes(packed_position), self._stop_event),
+                                        daemon=True)
+        self._thread.start()
+
+    # Stops the background thread, waiting for it to notice (at most one piece or move later)
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    # Finds the piece giving check to the king (if any) and whether the game is over (see get_game_over_status),
+    # after the opponent of the king has made their move. Returns (threatening piece or None, status).
+    def get_end_status(self, board, king, move_count):
+        key = position_moves_key(board, king.is_white(), move_count + 1)
+        with self._lock:
+            end_status = self._end_statuses.get(key)
+
+        # Use the precomputed result if there is one, finding the threatening piece on the real board
+        if end_status is not None:
+            self._hits += 1
+            threatening_square, status = end_status
+            threatening_piece = None
+            if threatening_square is not None:
+                threatening_piece = next((piece for piece in board if piece.get_position() == list(threatening_square)
+                                          and not piece.is_captured()))
+            return threatening_piece, status
+
+        self._misses += 1
+        threatening_piece = piece_threatening_king(board, king, move_count)
+        return threatening_piece, get_game_over_status(board, king, threatening_piece, move_count)
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+    # Runs on the background thread. Checks for the stop event between steps, so stopping never waits long.
+    def _analyse(self, packed_position, stop_event):
+        board, is_white_turn, move_count = unpack_position(packed_position, 0)
+
+        # The moves of the player to move
+        position_moves = self._move_cache.precompute(board, is_white_turn, move_count, stop_event)
+        if position_moves is None:
+            return
+        time.sleep(0)  # Hands the interpreter back to the game straight away, in case it is waiting for these moves
+
+        # Play each of them, and see if it gives check or ends the game. Positions where the game goes on are kept
+        # (packed) so the opponent's moves can be validated afterwards
+        reply_positions = []
+        for origin, destination in position_moves.get_legal_moves():
+            if stop_event.is_set():
+                return
+            board_state = save_board_state(board)
+            play_move(board, list(origin), list(destination), move_count)
+
+            opposing_king = next((piece for piece in board if isinstance(piece, King)
+                                  and piece.is_white() != is_white_turn))
+            threatening_piece = piece_threatening_king(board, opposing_king, move_count)
+            status = get_game_over_status(board, opposing_king, threatening_piece, move_count)
+            threatening_square = tuple(threatening_piece.get_position()) if threatening_piece is not None else None
+            self._store(position_moves_key(board, not is_white_turn, move_count + 1), (threatening_square, status))
+
+            if status is None:
+                packed_reply = bytearray(POSITION_SIZE)
+                pack_position(packed_reply, 0, board, not is_white_turn, move_count + 1)
+                reply_positions.append(packed_reply)
+            restore_board_state(board, board_state)
+
+        # The opponent's moves in each position they could face
+        for packed_reply in reply_positions:
+            if stop_event.is_set():
+                return
+            reply_board, reply_is_white_turn, reply_move_count = unpack_position(packed_reply, 0)
+            self._move_cache.precompute(reply_board, reply_is_white_turn, reply_move_count, stop_event)
+
+    # Records a position's end status, forgetting the oldest one if there are too many
+    def _store(self, key, end_status):
+        with self._lock:
+            self._end_statuses[key] = end_status
+            if len(self._end_statuses) > self._max_positions:
+                self._end_statuses.popitem(last=False)
+
+
+# Plays a move without asking the user for anything, i.e. when replaying a recorded game. Finds the piece on the origin
+# square, executes the move, and promotes the piece to promotion_type if it is a pawn reaching the end of the board
+# (a queen if no type is given). Assumes the move is valid. Returns the piece that ends up on the destination square.
+def play_move(board, origin, destination, move_count, promotion_type=None, history=None):
+
+    # Find the piece being moved
+    piece = next((chess_piece for chess_piece in board if chess_piece.get_position() == origin
+                  and not chess_piece.is_captured()))
+
+    # Execute the move, and promote the piece if it is a pawn that reached the end
+    execute_move(board, piece, destination, move_count, history)
+    if isinstance(piece, Pawn):
+        piece = promote_pawn(board, piece, history, Queen if promotion_type is None else promotion_type)
+
+    return piece
+
+
+# Plays a game in which both sides pick random legal moves (promoting to a random piece). Used to produce games for
+# testing and benchmarking. rng is a random.Random instance, so the same seed always plays the same game.
+# Returns the moves as a list of (origin, destination, promotion_type) tuples, and the result ("1-0" if white won,
+# "0-1" if black won, "1/2-1/2" for a draw, or "*" if the game was cut off after max_plies moves).
+def play_random_game(rng, max_plies=200):
+
+    board = create_board()
+    history = PositionHistory(board)
+    moves = []  # To hold every move played
+    is_white_turn = True
+    move_count = 1
+
+    while len(moves) < max_plies:
+
+        # If there are no legal moves, the game is over. It is checkmate if the king is in check, stalemate if not
+        legal_moves = get_legal_moves(board, is_white_turn, move_count)
+        if not legal_moves:
+            king = next((piece for piece in board if isinstance(piece, King) and piece.is_white() == is_white_turn))
+            if piece_threatening_king(board, king, move_count) is None:
+                return moves, "1/2-1/2"
+            return moves, "0-1" if is_white_turn else "1-0"
+
+        # Pick a random move. Promotions are only known after the move is made, so a type is picked for every pawn move
+        piece, destination = rng.choice(legal_moves)
+        origin = piece.get_position()
+        promotion_type = rng.choice([Queen, Rook, Knight, Bishop]) if isinstance(piece, Pawn) else None
+        play_move(board, origin, destination, move_count, promotion_type, history)
+
+        # Only record the promotion type if a promotion actually happened
+        if promotion_type is not None and destination[1] not in [0, MAX_FILE - 1]:
+            promotion_type = None
+        moves.append((origin, destination, promotion_type))
+
+        # Check for draws by repetition or the fifty-move rule
+        if history.is_threefold_repetition() or history.is_fifty_move_draw():
+            return moves, "1/2-1/2"
+
+        is_white_turn = not is_white_turn
+        move_count += 1
+
+    return moves, "*"
+
+
 # Determines if the king of the current player is in check. Accepts king's position and returns a reference to the
 # first piece found that is threatening the king. If no piece is threatening the king, returns None
 def piece_threatening_king(board, king, move_count):
@@ -676,9 +1123,10 @@ def piece_threatening_king(board, king, move_count):
     # Iterate over every piece
     for chess_piece in board:
 
-        # Determine if any moves from opposite color can capture king, and if so, return the threatening piece
-        if (not move_is_invalid(board, chess_piece, king.get_position(), not king.is_white(), move_count)
-                and not chess_piece.is_captured()):
+        # Determine if any moves from opposite color can capture king, and if so, return the threatening piece.
+        # Captured pieces are skipped first, since they are no longer on the board
+        if (not chess_piece.is_captured()
+                and not move_is_invalid(board, chess_piece, king.get_position(), not king.is_white(), move_count)):
             return chess_piece
 
     # If no piece is threatening the king, return None
@@ -687,8 +1135,10 @@ def piece_threatening_king(board, king, move_count):
 
 # Function takes a reference to a pawn object. If the pawn has reached the end of the board, returns a reference to a
 # new piece object with the same origin (thereby promoting it). If not, returns the pawn passed as an argument.
-# User chooses the type of piece they wish to promote the pawn to (cannot be a pawn).
-def promote_pawn(board, pawn):
+# User chooses the type of piece they wish to promote the pawn to (cannot be a pawn), unless a promotion_type is given
+# (i.e. when replaying a recorded game), in which case the pawn is promoted to that type without asking.
+# If a position history is given, the latest position in it is updated to include the new piece.
+def promote_pawn(board, pawn, history=None, promotion_type=None):
 
     is_white = pawn.is_white()  # Holds color of pawn
     position = pawn.get_position()    # Holds current position of pawn
@@ -703,37 +1153,53 @@ def promote_pawn(board, pawn):
     board.remove(pawn)
 
     # Prompt user for the type of piece they wish to promote their pawn to
-    print("Time to promote your pawn!")
+    if promotion_type is None:
+        print("Time to promote your pawn!")
 
-    while True:
+    while promotion_type is None:
         selected_type = input("Enter the type of piece you wish to promote your "
                               "pawn to (Queen, Rook, Knight, or Bishop): ").strip().lower()
 
-        # Find the type of piece the user selected and create a new one of that kind.
-        # Loop until the user gives valid input
+        # Find the type of piece the user selected. Loop until the user gives valid input
         match selected_type:
             case "queen":
-                board.append(Queen(is_white, position))
-                return
+                promotion_type = Queen
             case "rook":
-                board.append(Rook(is_white, position))
-                return
+                promotion_type = Rook
             case "knight":
-                board.append(Knight(is_white, position))
-                return
+                promotion_type = Knight
             case "bishop":
-                board.append(Bishop(is_white, position))
-                return
+                promotion_type = Bishop
             case _:
                 print("Invalid input, try again.")
 
+    # Create a new piece of the selected type
+    promoted_piece = promotion_type(is_white, position)
+    board.append(promoted_piece)
+
+    # The pawn has been replaced, so the recorded position (and the pawn hash) need to be updated
+    if history is not None:
+        history.update_pawn_hash(pawn, position, None)
+        history.update_current_position(board)
+
+    return promoted_piece
+
 
-# Determines if the end of the game has been reached.
+# Determines if the end of the game has been reached. If the game ends, the results are printed to the user and the
+# function returns True. If the game isn't over, returns False.
+def is_game_over(board, king, threatening_piece, move_count):
+    status = get_game_over_status(board, king, threatening_piece, move_count)
+    if status is not None:
+        print_game_over(board, king, status)
+    return status is not None
+
+
+# Works out whether the game has ended, without printing anything (so it can also be used on a background thread).
 # The game ends in stalemate if the king cannot move out of its current position, isn't in check, and is the last piece.
 # The game ends in victory for a player if the opponent's king is in check and cannot get out of it by either moving the
-# king, capturing the threatening piece, or blocking off the threatening piece. If the game ends, the results are
-# printed to the user and the function returns True. If the game isn't over, returns False.
-def is_game_over(board, king, threatening_piece, move_count):
+# king, capturing the threatening piece, or blocking off the threatening piece. Returns STALEMATE or CHECKMATE if the
+# game is over, otherwise None.
+def get_game_over_status(board, king, threatening_piece, move_count):
 
     king_position = king.get_position()     # To hold position of king
 
@@ -761,6 +1227,8 @@ def is_game_over(board, king, threatening_piece, move_count):
 
         # If king is in check, see if capturing the threatening piece removes the check
         for chess_piece in board:
+            if chess_piece.is_captured():
+                continue
             error = move_is_invalid(board, chess_piece, threatening_piece.get_position(), king.is_white(), move_count)
             if not error:
 
@@ -775,7 +1243,8 @@ def is_game_over(board, king, threatening_piece, move_count):
         # See if any piece can move into the path and remove the check
         for square in path:
             for chess_piece in board:
-                if not move_is_invalid(board, chess_piece, square, king.is_white(), move_count):
+                if not chess_piece.is_captured() and not move_is_invalid(board, chess_piece, square, king.is_white(),
+                                                                         move_count):
 
                     # If it can, change blocking_removes_check to True, and break
                     blocking_removes_check = True
@@ -787,9 +1256,9 @@ def is_game_over(board, king, threatening_piece, move_count):
     # Determine if the king is last piece on the board of its color
     pieces_of_king_color = 0  # To hold amount of pieces that are the color of the given king (including king)
 
-    # Count pieces of same color as king
+    # Count uncaptured pieces of same color as king
     for piece in board:
-        if piece.is_white() == king.is_white():
+        if piece.is_white() == king.is_white() and not piece.is_captured():
             pieces_of_king_color += 1
 
     # If king is last remaining, king_is_last_piece = True
@@ -797,18 +1266,42 @@ def is_game_over(board, king, threatening_piece, move_count):
         king_is_last_piece = True
 
     # If the king is not in check, cannot move, and is the last piece, game ends in a stalemate.
-    # Print board one last time, print ending message, return True
     if not in_check and king_cannot_move and king_is_last_piece:
-        print_board(board)
-        print("GAME OVER! Oh no, looks like we have a stalemate! Nobody wins.")
-        return True
+        return STALEMATE
 
     # If the king is in check and no move can remove the check, game ends in victory for opponent.
-    # Print board one last time, print victory message, and return True
     if in_check and king_cannot_move and not capturing_removes_check and not blocking_removes_check:
-        print_board(board)
+        return CHECKMATE
+
+    # Keep playing
+    return None
+
+
+# Prints the board one last time, and the ending message for a game that ended with the given status
+def print_game_over(board, king, status):
+    print_board(board)
+    if status == STALEMATE:
+        print("GAME OVER! Oh no, looks like we have a stalemate! Nobody wins.")
+    else:
         winner = "Black" if king.is_white() else "White"
         print(f"CHECKMATE!!! {winner} has won the game, congratulations!")
+
+
+# Determines if the game has ended in a draw, either because the same position has occurred three times (with the same
+# player to move), or because fifty moves have been made by each player without a capture or a pawn move. If the game
+# is drawn, the result is printed to the user and the function returns True. If not, returns False.
+def is_draw_by_rule(board, history):
+
+    # Check for threefold repetition
+    if history.is_threefold_repetition():
+        print_board(board)
+        print("GAME OVER! The same position has occurred three times. The game is a draw.")
+        return True
+
+    # Check for the fifty-move rule
+    if history.is_fifty_move_draw():
+        print_board(board)
+        print("GAME OVER! Fifty moves have passed without a capture or a pawn move. The game is a draw.")
         return True
 
     # Keep playing
@@ -816,4 +1309,17 @@ def is_game_over(board, king, threatening_piece, move_count):
 
 
 if __name__ == "__main__":
-    main()
+
+    # Only imported when run as a program, to keep importing ChessGame quick
+    import argparse
+    parser = argparse.ArgumentParser(description="Play chess in the terminal.")
+    parser.add_argument("--journal", help="file to record the game in, so it can be picked up again if the program is "
+                                          "closed or crashes")
+    args = parser.parse_args()
+
+    if args.journal is None:
+        main()
+    else:
+        from ChessJournal import MoveJournal
+        with MoveJournal(args.journal) as journal:
+            main(journal)
@@ -0,0 +1,85 @@
+# The help texts of the game. They are only imported when one of them is printed, so the game starts without loading
+# them.
+
+# Shown when the game starts
+WELCOME_TEXT = (
+    "   ________                  \n"
+    "  / ____/ /_  ___  __________ \n"
+    " / /   / __ \\/ _ \\/ ___/ ___/\n"
+    "/ /___/ / / /  __/__  |__  / \n"
+    "\\____/_/ /_/\\___/____/____/\n"
+    "      -Coded by Andrew Dagger\n\n"
+    "APPEARANCE:\n\n"
+    "\tThis game was intended to be played in a dark theme. If your terminal window is \n\tlight "
+    "themed, the colors are all opposite.\n\n"
+    "\tOn Windows, white pawns render as off-center, purple emojis. So, \n\tI have decided to replace them with "
+    "diamonds. Get it together, Microsoft.\n\n"
+    "USAGE:\n\n"
+    "\tTo move a piece, type the square in which it is located, followed by the \n\tsquare you wish to move it"
+    " to. For example, If white wants to move its \n\tpawn located at a2 up two squares "
+    "to a4, they would type \"a2 a4\".\n\n"
+    "\tTo castle the king, move the king two spaces in the direction you wish to castle. \n\tThe rook will be "
+    "moved automatically. For example, If white wants \n\tto castle on the queen (left) side, they would type"
+    " \"e1 c1\". If it is a valid move, \n\tthe king will be moved to c1 and the leftmost rook to d1.\n\n"
+    "\tAt the beginning of your turn, you may type \"rules\" to \n\treview the movement rules for each piece, "
+    "or \"usage\" to \n\tremind yourself how to move pieces.\n\n"
+    "\tTo see every legal move for a piece, type \"moves\" followed by its square. \n\tFor example, "
+    "\"moves e2\".\n\n"
+    "\tTo take back the last move, type \"undo\".\n\n"
+)
+
+# Shown when a player types "rules": the movement rules for each piece, and how castling and capturing en passant
+# work
+MOVEMENT_RULES_TEXT = (
+    "MOVEMENT RULES:\n\n"
+    "\tPawns (\u2659) generally move one space vertically towards the opponents side, \n\twith some exceptions: "
+    "Pawns cannot capture moving vertically, but they \n\tcan move one space forwards diagonally to capture a "
+    "piece. They have the \n\toption to move two spaces vertically only on their first turn.\n\n"
+    "\tRooks (\u2656) can move vertically or horizontally any number of spaces. "
+    "\n\tThey may also castle with the king if neither piece has moved yet.\n\n"
+    "\tBishops (\u2657) can move diagonally any amount of spaces.\n\n"
+    "\tKnights (\u2658) move in an \'L\' shaped pattern. More specifically, they can \n\tmove either up/down one"
+    " and left/right two, or up/down two and right/left one. \n\tAlso, knights can hop over "
+    "pieces, meaning their path is never blocked.\n\n"
+    "\tQueens (\u2655) can vertically, horizontally, or diagonally any number of spaces.\n\n"
+    "\tKings (\u2654) can move one space in any direction. They may also castle with any rook if \n\tneither"
+    " piece has moved yet. If an opposing player \n\tis one move away from capturing your king, that means"
+    " your king is in \"check\". \n\tYou must remove the check on your next turn (by moving the king out of "
+    "\n\tthe way or capturing/blocking the threatening piece), and any move that \n\tdoesn't do "
+    "so is considered illegal. Also, any move \n\tthat puts your own king in check is illegal as well.\n\n"
+    "SPECIAL MOVES:\n\n"
+    "\tEn passant rule: When a pawn moves two spaces on its first turn, it is vulnerable \n\tto being captured"
+    " en passant. This special type of capture occurs \n\tif an opposing player moves their pawn diagonally"
+    " one space BEHIND the player's \n\tpawn, as if it had only moved one square. En passant captures must meet"
+    " the following criteria: \n\n\t1.) A pawn can only be captured en passant if it has moved two squares on its"
+    " first turn. \n\t2.) The opponent can only use a pawn to perform an en passant capture. \n\t3.) The opponent"
+    " must perform the en passant capture on the turn immediately after \n\twhite's pawn moved, and no later."
+    " \n\t4.) The opponent must move their pawn diagonally one space behind the pawn to capture it. \n\n\tHere "
+    "is an example on how an en passant could be performed: \n\n\t1.) White moves its pawn at a2 to a4. \n\t2.) "
+    "Black has a pawn on b4. On the turn immediately after white \n\tmoved its pawn, black moves its pawn to a3. "
+    "\n\t3.) White's pawn has been captured en passant.\n\n"
+    "\tCastling: A king and a rook can castle if neither have moved yet. To castle, \n\tthe king moves two"
+    " spaces towards the rook it is castling with, \n\tand the rook moves to the square behind the king. "
+    "Castling must follow these rules: \n\n\t1.) It must be the first time either piece has been moved. \n\t2). "
+    "The path between the king and the rook cannot be obstructed. \n\t3.) You cannot castle out of, through, or "
+    "into check. \n\tFor example, say your king is castling from e1 to c1. For the castle to work, \n\tyour king "
+    "cannot currently be in check, and squares d1 and c1 \n\tmust not be threatened by an opponent's piece."
+    " \n\n\tHere is an example on how a castle can be performed: \n\n\t1.) White wants to castle its king at e1 "
+    "with its rook at a1. \n\t2.) No piece is in between the king and the rook. \n\tThe king is not moving out "
+    "of, through, or into check. \n\t3.) White moves its king two spaces to c1, and the rook \n\tto the "
+    "space behind where the king moved (d1).\n\n"
+)
+
+# Shown when a player types "usage": how to give proper input
+USAGE_TEXT = (
+    "\nUSAGE:\n\n"
+    "\tTo move a piece, type the square in which it is located, followed by the \n\tsquare you wish to move it"
+    " to. For example, If white wants to move its \n\tpawn located at a2 up two squares "
+    "to a4, they would type \"a2 a4\".\n\n"
+    "\tTo castle the king, move the king two spaces in the direction you wish to castle. \n\tThe rook will be "
+    "moved automatically. For example, If white wants \n\tto castle on the queen (left) side, they would type"
+    " \"e1 c1\". If it is a valid move, \n\tthe king will be moved to c1 and the leftmost rook to d1.\n\n"
+    "\tTo see every legal move for a piece, type \"moves\" followed by its square. \n\tFor example, "
+    "\"moves e2\".\n\n"
+    "\tTo take back the last move, type \"undo\".\n\n"
+)
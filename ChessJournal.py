@@ -0,0 +1,445 @@
+import argparse
+import os
+import struct
+import threading
+from binascii import crc32
+from ChessGame import create_board, play_move, move_is_invalid, error_messages
+from ChessPosition import (POSITION_SIZE, pack_position, unpack_position, encode_move, decode_move, board_to_fen,
+                           move_to_text)
+from ChessArchive import result_codes
+
+# Crash-safe move journal. Every change to a game (a game starting, a move, a move taken back, a game ending) is
+# appended to the journal file as a fixed-size record, and is on disk before the call that recorded it returns. Any
+# number of games can share one journal. All numbers are little-endian.
+#
+#   Journal file:   magic b"CHSJ", format version (2 bytes), 2 reserved bytes, generation (4 bytes), then the records
+#   Record:         game number (4 bytes), number of moves in the game once the record is applied (2 bytes),
+#                   record kind (1 byte), 1 reserved byte, value (2 bytes: the move packed by encode_move, including
+#                   the promotion type, or a result code), 2 reserved bytes, CRC-32 of the first 12 bytes (4 bytes)
+#
+# A record cut short or damaged by a crash fails its CRC, and it and anything after it are ignored (and cut off the
+# file when the journal is next opened for writing).
+#
+# So that recovery never has to replay more than a bounded number of records, every so often a snapshot of every
+# unfinished game is written to a separate file (the journal path plus ".snapshot"), and the journal is started again
+# empty with the next generation number. Records in a journal of an older generation than the snapshot are already in
+# the snapshot, so they are ignored if a crash happened in between.
+#
+#   Snapshot file:  magic b"CHSN", format version (2 bytes), 2 reserved bytes, generation (4 bytes), number of games
+#                   (4 bytes), CRC-32 of everything after the header (4 bytes), then for each game:
+#                   game number (4 bytes), number of moves (2 bytes), the position (see pack_position), then every
+#                   move packed into 2 bytes (so moves can be taken back past the snapshot)
+JOURNAL_MAGIC = b"CHSJ"
+SNAPSHOT_MAGIC = b"CHSN"
+JOURNAL_VERSION = 1
+
+journal_header_format = struct.Struct("<4sHHI")
+record_format = struct.Struct("<IHBBH2x")
+record_checksum_format = struct.Struct("<I")
+RECORD_SIZE = record_format.size + record_checksum_format.size
+snapshot_header_format = struct.Struct("<4sHHIII")
+snapshot_game_format = struct.Struct("<IH")
+
+# Record kinds
+GAME_STARTED = 1
+MOVE_PLAYED = 2
+MOVE_TAKEN_BACK = 3
+GAME_ENDED = 4
+
+
+# The state of an unfinished game, as kept by the journal: its board and every move played in it
+class JournalGame:
+    def __init__(self, game_number, board=None, is_white_turn=True, move_count=1, moves=None):
+        self._game_number = game_number
+        self._board = board if board is not None else create_board()
+        self._is_white_turn = is_white_turn
+        self._move_count = move_count
+        self._moves = moves if moves is not None else []
+
+    def get_game_number(self):
+        return self._game_number
+
+    def get_board(self):
+        return self._board
+
+    def is_white_turn(self):
+        return self._is_white_turn
+
+    # Number of the move about to be played
+    def get_move_count(self):
+        return self._move_count
+
+    # Every move played in the game, as (origin, destination, promotion_type) tuples
+    def get_moves(self):
+        return self._moves
+
+    # Plays a move. If validate is True, the move is checked with the rules first, and ValueError is raised (with the
+    # message from error_messages) if it is invalid.
+    def play(self, origin, destination, promotion_type=None, validate=False):
+        origin, destination = list(origin), list(destination)
+        if validate:
+            piece = next((piece for piece in self._board if piece.get_position() == origin
+                          and not piece.is_captured()), None)
+            error_code = 2 if piece is None else move_is_invalid(self._board, piece, destination, self._is_white_turn,
+                                                                 self._move_count)
+            if error_code:
+                raise ValueError(error_messages[error_code])
+
+        play_move(self._board, origin, destination, self._move_count, promotion_type)
+        self._moves.append((origin, destination, promotion_type))
+        self._is_white_turn = not self._is_white_turn
+        self._move_count += 1
+
+    # Takes back the last move, by replaying the others from the starting position. Moves are rarely taken back, so
+    # this keeps the common case (playing a move) cheap. If the game without its last move has already been replayed
+    # (see replay_game), its position is taken over instead of replaying the moves again.
+    def take_back(self, replayed_game=None):
+        if not self._moves:
+            raise ValueError("There is no move to take back.")
+        if replayed_game is None:
+            replayed_game = replay_game(self._game_number, self._moves[:-1])
+        self._board = replayed_game.get_board()
+        self._is_white_turn = replayed_game.is_white_turn()
+        self._move_count = replayed_game.get_move_count()
+        self._moves = replayed_game.get_moves()
+
+
+# Plays the moves from the starting position. Returns the resulting JournalGame.
+def replay_game(game_number, moves):
+    game = JournalGame(game_number)
+    for origin, destination, promotion_type in moves:
+        game.play(origin, destination, promotion_type)
+    return game
+
+
+# Packs a record, with its checksum
+def pack_record(game_number, ply, kind, value):
+    record = record_format.pack(game_number, ply, kind, 0, value)
+    return record + record_checksum_format.pack(crc32(record))
+
+
+# Applies a record to the games (a dictionary mapping game numbers to JournalGames). Moves are checked with the rules
+# if validate is True. Raises ValueError if the record doesn't fit the games, i.e. a move for a game that isn't known.
+def apply_record(games, game_number, ply, kind, value, validate=False):
+    game = games.get(game_number)
+    if kind == GAME_STARTED:
+        if game is not None:
+            raise ValueError(f"Game {game_number} was started twice.")
+        games[game_number] = JournalGame(game_number)
+        return
+    if game is None:
+        raise ValueError(f"Game {game_number} was never started.")
+
+    if kind == MOVE_PLAYED:
+        move = decode_move(value)
+        try:
+            game.play(*move, validate=validate)
+        except ValueError as error:
+            raise ValueError(f"Move {len(game.get_moves()) + 1} of game {game_number} ({move_to_text(move)}) "
+                             f"is invalid: {error}")
+    elif kind == MOVE_TAKEN_BACK:
+        game.take_back()
+    elif kind == GAME_ENDED:
+        del games[game_number]
+        return
+    else:
+        raise ValueError(f"Unknown record kind {kind} for game {game_number}.")
+
+    if len(game.get_moves()) != ply:
+        raise ValueError(f"Game {game_number} has {len(game.get_moves())} moves, but the journal says {ply}.")
+
+
+# Reads a snapshot file. Returns (generation, games), where games is a dictionary mapping game numbers to JournalGames,
+# or (0, {}) if there is no snapshot yet.
+def read_snapshot(path):
+    if not os.path.exists(path):
+        return 0, {}
+    with open(path, "rb") as snapshot_file:
+        data = snapshot_file.read()
+
+    if len(data) < snapshot_header_format.size:
+        raise ValueError(f"{path} is not a journal snapshot.")
+    magic, version, reserved, generation, game_count, checksum = snapshot_header_format.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a journal snapshot.")
+    if version != JOURNAL_VERSION:
+        raise ValueError(f"{path} uses journal version {version}, but only version {JOURNAL_VERSION} is supported.")
+    if checksum != crc32(data[snapshot_header_format.size:]):
+        raise ValueError(f"{path} is damaged.")
+
+    games = {}
+    offset = snapshot_header_format.size
+    for game_index in range(game_count):
+        game_number, move_total = snapshot_game_format.unpack_from(data, offset)
+        offset += snapshot_game_format.size
+        board, is_white_turn, move_count = unpack_position(data, offset)
+        offset += POSITION_SIZE
+        moves = [decode_move(encoded_move) for encoded_move in struct.unpack_from(f"<{move_total}H", data, offset)]
+        offset += 2 * move_total
+        games[game_number] = JournalGame(game_number, board, is_white_turn, move_count, [
+            (list(origin), list(destination), promotion_type) for origin, destination, promotion_type in moves])
+    return generation, games
+
+
+# Writes a snapshot of the games to a file. The file is written under a temporary name and then renamed, so a crash
+# leaves either the old snapshot or the new one.
+def write_snapshot(path, generation, games):
+    body = bytearray()
+    for game in games.values():
+        position = bytearray(POSITION_SIZE)
+        pack_position(position, 0, game.get_board(), game.is_white_turn(), game.get_move_count())
+        moves = game.get_moves()
+        body += snapshot_game_format.pack(game.get_game_number(), len(moves))
+        body += position
+        body += struct.pack(f"<{len(moves)}H", *(encode_move(*move) for move in moves))
+
+    header = snapshot_header_format.pack(SNAPSHOT_MAGIC, JOURNAL_VERSION, 0, generation, len(games), crc32(body))
+    write_durably(path, header + body)
+
+
+# Writes a whole file under a temporary name, flushes it to disk and renames it over path
+def write_durably(path, data):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as temporary_file:
+        temporary_file.write(data)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, path)
+
+    # Make the rename itself durable (directories can't be opened on Windows, where it is durable already)
+    if os.name == "posix":
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+# Recovers the unfinished games from a journal and its snapshot: the snapshot is loaded, then the journal's records are
+# replayed on top of it, checking every move with the rules. Returns (games, generation, end), where games maps game
+# numbers to JournalGames, and end is the file offset just after the last intact record of the journal (or None if the
+# journal is missing or older than the snapshot, so it has to be started again).
+def recover_games(path):
+    generation, games = read_snapshot(f"{path}.snapshot")
+    if not os.path.exists(path):
+        return games, generation, None
+
+    with open(path, "rb") as journal_file:
+        data = journal_file.read()
+    if len(data) < journal_header_format.size:
+        return games, generation, None  # The crash happened while the journal was being created
+    magic, version, reserved, journal_generation = journal_header_format.unpack_from(data, 0)
+    if magic != JOURNAL_MAGIC:
+        raise ValueError(f"{path} is not a move journal.")
+    if version != JOURNAL_VERSION:
+        raise ValueError(f"{path} uses journal version {version}, but only version {JOURNAL_VERSION} is supported.")
+    if journal_generation < generation:
+        return games, generation, None  # Everything in it is in the snapshot already
+    if journal_generation > generation:
+        raise ValueError(f"{path} continues from a snapshot that is missing.")
+
+    end = journal_header_format.size
+    while end + RECORD_SIZE <= len(data):
+        record = data[end:end + record_format.size]
+        checksum, = record_checksum_format.unpack_from(data, end + record_format.size)
+        if checksum != crc32(record):
+            break
+        game_number, ply, kind, reserved, value = record_format.unpack(record)
+        apply_record(games, game_number, ply, kind, value, validate=True)
+        end += RECORD_SIZE
+    return games, generation, end
+
+
+# Appends changes to games to a journal file, so unfinished games can be recovered after a crash. Opening a journal
+# recovers the games already in it (see get_games), and new records are added after them.
+# Records are written by a background thread. Every call that records something waits until its record is on disk,
+# and all records that arrive while one write is being flushed to disk are written and flushed together in the next
+# one (group commit), so many games recording moves at the same time share the cost of each flush.
+# Every snapshot_interval records, a snapshot is taken and the journal is started again, which bounds recovery time.
+class MoveJournal:
+    def __init__(self, path, snapshot_interval=1000):
+        self._path = path
+        self._snapshot_interval = snapshot_interval
+        self._games, self._generation, end = recover_games(path)
+
+        # Continue the journal after its last intact record, or start it again if it can't be continued
+        if end is None:
+            self._start_journal()
+        else:
+            self._file = open(path, "r+b")
+            self._file.truncate(end)
+            self._file.seek(end)
+
+        self._pending = bytearray()  # Records waiting to be written
+        self._recorded = 0  # Number of records handed to the journal
+        self._durable = 0  # Number of those that are on disk
+        self._records_since_snapshot = 0
+        self._flush_count = 0
+        self._error = None  # Set if writing fails, so every later call fails too
+        self._is_closing = False
+        self._condition = threading.Condition()
+        self._writer = threading.Thread(target=self._write_records, daemon=True)
+        self._writer.start()
+
+    def get_path(self):
+        return self._path
+
+    # The unfinished games, as a dictionary mapping game numbers to JournalGames. These are the journal's own copies,
+    # kept up to date as records are added, so they shouldn't be changed.
+    def get_games(self):
+        return self._games
+
+    # Number of records written so far
+    def get_record_count(self):
+        return self._durable
+
+    # Number of times the journal has been flushed to disk (each flush writes one or more records)
+    def get_flush_count(self):
+        return self._flush_count
+
+    # Starts recording a new game, numbered game_number (which must not be used by an unfinished game)
+    def start_game(self, game_number):
+        self._record(game_number, GAME_STARTED, 0)
+
+    # Records a move played in a game. promotion_type is the piece type a pawn was promoted to, if it was. The move is
+    # checked with the rules first, as it will be when the game is recovered, and ValueError is raised (with nothing
+    # written) if it is invalid.
+    def record_move(self, game_number, origin, destination, promotion_type=None):
+        self._record(game_number, MOVE_PLAYED, encode_move(origin, destination, promotion_type))
+
+    # Records that the last move of a game was taken back
+    def record_take_back(self, game_number):
+        self._record(game_number, MOVE_TAKEN_BACK, 0)
+
+    # Records the end of a game, with its result (one of the keys of result_codes). It is no longer recovered.
+    def end_game(self, game_number, result="*"):
+        self._record(game_number, GAME_ENDED, result_codes[result])
+
+    # Waits until everything recorded so far is on disk, then stops the writer and closes the file
+    def close(self):
+        with self._condition:
+            self._is_closing = True
+            self._condition.notify_all()
+        self._writer.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Applies a record to the journal's copy of the games, hands it to the writer, and waits until it is on disk. Moves
+    # are validated just as recover_games validates them, so a record that would make recovery fail is never written.
+    def _record(self, game_number, kind, value):
+
+        # Taking a move back replays the rest of the game, which is done before taking the lock, so the writer and the
+        # other games aren't held up meanwhile
+        moves = None
+        replayed_game = None
+        if kind == MOVE_TAKEN_BACK:
+            with self._condition:
+                game = self._games.get(game_number)
+                moves = list(game.get_moves()) if game is not None else None
+            if moves:
+                replayed_game = replay_game(game_number, moves[:-1])
+
+        with self._condition:
+            if self._error is not None:
+                raise OSError(f"The journal can't be written: {self._error}")
+            if self._is_closing:
+                raise ValueError("The journal is closed.")
+            game = self._games.get(game_number)
+            ply = 0 if game is None else len(game.get_moves()) + {MOVE_PLAYED: 1, MOVE_TAKEN_BACK: -1}.get(kind, 0)
+
+            # The replayed game is only used if no move of the game was recorded while it was being replayed
+            if replayed_game is not None and game is not None and game.get_moves() == moves:
+                game.take_back(replayed_game)
+            else:
+                apply_record(self._games, game_number, ply, kind, value, validate=True)
+
+            self._pending += pack_record(game_number, ply, kind, value)
+            self._recorded += 1
+            record_number = self._recorded
+            self._condition.notify_all()
+
+            while self._durable < record_number and self._error is None:
+                self._condition.wait()
+            if self._durable < record_number:
+                raise OSError(f"The journal can't be written: {self._error}")
+
+    # Runs on the writer thread: writes whatever records are waiting, flushes them to disk, and wakes up the calls
+    # that recorded them. Records arriving during a flush wait for the next one, so they are written together.
+    def _write_records(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._is_closing:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                records, self._pending = self._pending, bytearray()
+                record_number = self._recorded
+
+            try:
+                self._file.write(records)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as error:
+                with self._condition:
+                    self._error = error
+                    self._condition.notify_all()
+                return
+
+            with self._condition:
+                self._durable = record_number
+                self._flush_count += 1
+                self._records_since_snapshot += len(records) // RECORD_SIZE
+                if self._records_since_snapshot >= self._snapshot_interval:
+
+                    # A snapshot that can't be written fails the journal just like a write of the records, so the
+                    # calls waiting for their records are woken up instead of waiting forever
+                    try:
+                        self._take_snapshot()
+                    except OSError as error:
+                        self._error = error
+                        self._condition.notify_all()
+                        return
+                self._condition.notify_all()
+
+    # Writes a snapshot of every unfinished game and starts the journal again. Called by the writer with the condition
+    # held, so no records are added meanwhile. Any records that arrived during the last flush are written first, since
+    # the games already include them.
+    def _take_snapshot(self):
+        self._file.write(self._pending)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = bytearray()
+        self._durable = self._recorded
+
+        self._generation += 1
+        write_snapshot(f"{self._path}.snapshot", self._generation, self._games)
+        self._file.close()
+        self._start_journal()
+        self._records_since_snapshot = 0
+
+    # Starts an empty journal of the current generation, replacing the journal file
+    def _start_journal(self):
+        write_durably(self._path, journal_header_format.pack(JOURNAL_MAGIC, JOURNAL_VERSION, 0, self._generation))
+        self._file = open(self._path, "r+b")
+        self._file.seek(0, os.SEEK_END)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the unfinished games in a move journal.")
+    parser.add_argument("journal", help="journal file")
+    args = parser.parse_args()
+
+    games, generation, end = recover_games(args.journal)
+    print(f"{len(games)} unfinished game(s)")
+    for game_number, game in sorted(games.items()):
+        print(f"Game {game_number}: {len(game.get_moves())} move(s), "
+              f"{board_to_fen(game.get_board(), game.is_white_turn(), game.get_move_count())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import random
+from ChessPieces import Pawn, King
+from ChessGame import create_board, play_move, play_random_game
+from ChessPosition import MAX_RANK, MAX_FILE, PositionHistory, square_index, pawn_hash
+from ChessArchive import GameArchiveReader
+
+# Pawn structure scores, in hundredths of a pawn
+DOUBLED_PAWN_PENALTY = 15    # For every pawn behind another pawn of the same color on the same rank
+ISOLATED_PAWN_PENALTY = 12   # For a pawn with no pawns of the same color on the neighbouring ranks
+SHIELD_PAWN_BONUS = 10       # For a pawn directly in front of (or next to the front of) its own king on the home row
+
+# Bonus for a passed pawn (one no opposing pawn can stop), by how many rows it has advanced from its starting row
+passed_pawn_bonus = [0, 5, 10, 20, 35, 60, 100, 0]
+
+
+# Works out the parts of the pawn evaluation that depend only on where the pawns stand. Returns (score, white pawns,
+# black pawns), where score is from white's point of view and the pawns are bitmasks with bit square_index set for
+# each square holding a pawn of that color.
+def evaluate_pawn_structure(board):
+    pawn_squares = [[], []]  # [rank, file] of every white pawn, then every black pawn
+    for piece in board:
+        if isinstance(piece, Pawn) and not piece.is_captured():
+            pawn_squares[0 if piece.is_white() else 1].append(piece.get_position())
+
+    score = 0
+    for color, direction in [(0, 1), (1, -1)]:
+        own_pawns = pawn_squares[color]
+        opposing_pawns = pawn_squares[1 - color]
+        own_ranks = [position[0] for position in own_pawns]
+        color_score = 0
+
+        for rank in set(own_ranks):
+            color_score -= DOUBLED_PAWN_PENALTY * (own_ranks.count(rank) - 1)
+
+        for rank, file in own_pawns:
+            if rank - 1 not in own_ranks and rank + 1 not in own_ranks:
+                color_score -= ISOLATED_PAWN_PENALTY
+
+            # A pawn is passed if no opposing pawn stands ahead of it on its own or a neighbouring rank
+            if not any(abs(opposing_rank - rank) <= 1 and (opposing_file - file) * direction > 0
+                       for opposing_rank, opposing_file in opposing_pawns):
+                rows_advanced = file - 1 if direction == 1 else MAX_FILE - 2 - file
+                color_score += passed_pawn_bonus[rows_advanced]
+
+        score += color_score if color == 0 else -color_score
+
+    white_pawns = sum(1 << square_index(position) for position in pawn_squares[0])
+    black_pawns = sum(1 << square_index(position) for position in pawn_squares[1])
+    return score, white_pawns, black_pawns
+
+
+# Scores the pawns sheltering a king that is still on its home row: a bonus for each pawn of its color on the king's
+# rank or a neighbouring rank, one row in front of the king (or half as much two rows in front). Uses the pawn bitmask
+# from evaluate_pawn_structure, so it is cheap enough to work out every time instead of caching it.
+def get_pawn_shield_score(king, own_pawns):
+    rank, file = king.get_position()
+    home_file, direction = (0, 1) if king.is_white() else (MAX_FILE - 1, -1)
+    if file != home_file:
+        return 0
+
+    score = 0
+    for shield_rank in range(max(rank - 1, 0), min(rank + 2, MAX_RANK)):
+        if own_pawns >> square_index([shield_rank, file + direction]) & 1:
+            score += SHIELD_PAWN_BONUS
+        elif own_pawns >> square_index([shield_rank, file + 2 * direction]) & 1:
+            score += SHIELD_PAWN_BONUS // 2
+    return score
+
+
+# A fixed-size table of pawn structure evaluations, indexed by the low bits of the pawn hash. Pawn structures change
+# far less often than the rest of the position, so most evaluations find their pawns already scored. A new entry
+# simply replaces whatever was stored in its slot. Counts hits and misses, to help choose a size.
+class PawnCache:
+    def __init__(self, size=4096):
+        if size <= 0 or size & (size - 1):
+            raise ValueError(f"Pawn cache size must be a power of two, not {size}.")
+        self._keys = [None] * size
+        self._entries = [None] * size
+        self._mask = size - 1
+        self._hits = 0
+        self._misses = 0
+
+    def get_size(self):
+        return len(self._keys)
+
+    # Returns the stored evaluate_pawn_structure result for the pawn hash, or None if it isn't stored
+    def get(self, pawn_key):
+        slot = pawn_key & self._mask
+        if self._keys[slot] == pawn_key:
+            self._hits += 1
+            return self._entries[slot]
+        self._misses += 1
+        return None
+
+    def store(self, pawn_key, entry):
+        slot = pawn_key & self._mask
+        self._keys[slot] = pawn_key
+        self._entries[slot] = entry
+
+    def clear(self):
+        self._keys = [None] * len(self._keys)
+        self._entries = [None] * len(self._entries)
+        self._hits = 0
+        self._misses = 0
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+    # Fraction of lookups that found their entry (0 if there were none)
+    def get_hit_rate(self):
+        lookups = self._hits + self._misses
+        return self._hits / lookups if lookups else 0.0
+
+
+# Scores the pawns (structure and king shelter) from white's point of view, using the cache for the structure. The pawn
+# hash can be passed in if it is already known (i.e. from PositionHistory.get_pawn_hash), otherwise it is calculated.
+def evaluate_pawns(board, pawn_cache, pawn_key=None):
+    if pawn_key is None:
+        pawn_key = pawn_hash(board)
+
+    entry = pawn_cache.get(pawn_key)
+    if entry is None:
+        entry = evaluate_pawn_structure(board)
+        pawn_cache.store(pawn_key, entry)
+    score, white_pawns, black_pawns = entry
+
+    for piece in board:
+        if isinstance(piece, King) and not piece.is_captured():
+            if piece.is_white():
+                score += get_pawn_shield_score(piece, white_pawns)
+            else:
+                score -= get_pawn_shield_score(piece, black_pawns)
+    return score
+
+
+# Replays games and evaluates the pawns of every position with caches of each size, to show how the hit rate depends
+# on the size. The pawn hash is kept up to date move by move by the position history. Returns a list of
+# (size, hits, misses) tuples.
+def measure_hit_rates(games, sizes):
+    caches = [PawnCache(size) for size in sizes]
+
+    for moves in games:
+        board = create_board()
+        history = PositionHistory(board)
+        for move_count, move in enumerate(moves + [None], start=1):
+            for pawn_cache in caches:
+                evaluate_pawns(board, pawn_cache, history.get_pawn_hash())
+            if move is not None:
+                origin, destination, promotion_type = move
+                play_move(board, origin, destination, move_count, promotion_type, history)
+
+    return [(pawn_cache.get_size(), pawn_cache.get_hits(), pawn_cache.get_misses()) for pawn_cache in caches]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure pawn cache hit rates on a mix of games.")
+    parser.add_argument("archive", nargs="?", help="game archive to replay (default: random games)")
+    parser.add_argument("--games", type=int, default=50, help="number of games to replay")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256, 1024, 4096],
+                        help="cache sizes to try (powers of two)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the random games")
+    args = parser.parse_args()
+
+    # Games are replayed in the order they were played, so the caches see them as they would in a real session
+    if args.archive is not None:
+        with GameArchiveReader(args.archive) as reader:
+            games = [reader.read_game(number).get_moves() for number in range(min(args.games, len(reader)))]
+    else:
+        rng = random.Random(args.seed)
+        games = [play_random_game(rng)[0] for game_number in range(args.games)]
+
+    positions = sum(len(moves) + 1 for moves in games)
+    print(f"{len(games)} game(s), {positions} positions\n")
+    print(f"{'size':>8}{'hits':>10}{'misses':>10}{'hit rate':>10}")
+    for size, hits, misses in measure_hit_rates(games, args.sizes):
+        print(f"{size:>8}{hits:>10}{misses:>10}{hits / (hits + misses):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
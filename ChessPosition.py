@@ -0,0 +1,440 @@
+import struct
+from ChessPieces import Pawn, Bishop, Knight, Rook, Queen, King
+from ChessTables import load_tables
+
+# Constants that represent board dimensions
+MAX_RANK = 8
+MAX_FILE = 8
+
+# Order in which piece types are numbered when hashing (and anywhere else a piece type needs to fit in a small int)
+piece_types = [Pawn, Knight, Bishop, Rook, Queen, King]
+
+# Zobrist hashing keys. Every (color, piece type, square) combination gets its own random 64-bit number, and the hash
+# of a position is all the keys of the pieces on the board XORed together (plus keys for castling rights, en passant
+# and the side to move). The keys come from a seeded generator so that hashes are identical across runs and can be
+# stored on disk, and are read from the table cache (see ChessTables) rather than generated on every launch. They are
+# copied into lists, since hashing looks them up constantly and lists are the fastest to index.
+_zobrist_keys = iter(load_tables()["zobrist_keys"].tolist())
+piece_keys = [[[next(_zobrist_keys) for square in range(MAX_RANK * MAX_FILE)]
+               for piece_type in piece_types] for color in range(2)]
+castling_keys = [next(_zobrist_keys) for corner in range(4)]
+en_passant_keys = [next(_zobrist_keys) for rank in range(MAX_RANK)]
+black_to_move_key = next(_zobrist_keys)
+
+# Home squares of the rooks, in the same order as castling_keys (white queen side, white king side, black queen side,
+# black king side)
+rook_home_squares = [[0, 0], [7, 0], [0, 7], [7, 7]]
+
+
+# Converts a [rank, file] position into a single square number from 0 to 63
+def square_index(position):
+    return position[1] * MAX_RANK + position[0]
+
+
+# Returns the index of the piece's type in piece_types
+def piece_type_index(piece):
+    return piece_types.index(type(piece))
+
+
+# Returns the hashing key for the given piece standing on the given position
+def piece_key(piece, position):
+    return piece_keys[0 if piece.is_white() else 1][piece_type_index(piece)][square_index(position)]
+
+
+# Calculates the hash of the pawns alone (the same keys as position_hash, but only for pawns), so positions with the same
+# pawn structure share a hash no matter where the other pieces are
+def pawn_hash(board):
+    pawn_key = 0
+    for piece in board:
+        if isinstance(piece, Pawn) and not piece.is_captured():
+            pawn_key ^= piece_key(piece, piece.get_position())
+    return pawn_key
+
+
+# Maps the (rank, file) tuple of every occupied square to the piece on it, so the pieces a move involves can be
+# looked up without going over the board (see pawn_hash_after_move)
+def get_pieces_by_square(board):
+    return {tuple(piece.get_position()): piece for piece in board if not piece.is_captured()}
+
+
+# Works out the pawn hash after a move from the pawn hash before it, looking only at the pieces on the squares the move
+# involves (pieces_by_square comes from get_pieces_by_square): a moving pawn changes squares (or leaves the board if it
+# reaches the last file and is promoted), and a captured pawn leaves the board, including one captured en passant.
+# Must be called before the move is played. Assumes the move is valid.
+def pawn_hash_after_move(pieces_by_square, pawn_key, origin, destination):
+    moving_piece = pieces_by_square[tuple(origin)]
+    captured_piece = pieces_by_square.get(tuple(destination))
+    if isinstance(moving_piece, Pawn):
+        pawn_key ^= piece_key(moving_piece, origin)
+        if destination[1] not in [0, MAX_FILE - 1]:
+            pawn_key ^= piece_key(moving_piece, destination)
+
+        # A pawn moving diagonally to an empty square captures en passant
+        if captured_piece is None and origin[0] != destination[0]:
+            captured_piece = pieces_by_square.get((destination[0], origin[1]))
+
+    if isinstance(captured_piece, Pawn):
+        pawn_key ^= piece_key(captured_piece, captured_piece.get_position())
+    return pawn_key
+
+
+# Calculates the Zobrist hash of the position from scratch. is_white_turn is the side to move, and move_count is the
+# number of the move that is about to be played (used to tell whether a pawn can still be captured en passant).
+def position_hash(board, is_white_turn, move_count):
+
+    position_key = 0  # To hold the hash as it is built up
+
+    # Add every piece still on the board
+    for piece in board:
+        if not piece.is_captured():
+            position_key ^= piece_key(piece, piece.get_position())
+
+    # Add castling rights. A corner keeps its right while both its king and its rook are unmoved
+    for corner, rook_square in enumerate(rook_home_squares):
+        if castling_right_remains(board, rook_square):
+            position_key ^= castling_keys[corner]
+
+    # Add the en passant rank (if any)
+    en_passant_rank = get_en_passant_rank(board, move_count)
+    if en_passant_rank is not None:
+        position_key ^= en_passant_keys[en_passant_rank]
+
+    # Add the side to move
+    if not is_white_turn:
+        position_key ^= black_to_move_key
+
+    return position_key
+
+
+# Checks if the rook on the given home square and its king have both never moved (meaning castling may still be
+# possible on that side later in the game).
+def castling_right_remains(board, rook_square):
+    is_white = rook_square[1] == 0
+    rook_found = False
+    king_found = False
+
+    for piece in board:
+        if piece.is_captured() or piece.is_white() != is_white:
+            continue
+        if isinstance(piece, Rook) and piece.get_position() == rook_square and not piece.has_previously_moved():
+            rook_found = True
+        if isinstance(piece, King) and not piece.has_previously_moved():
+            king_found = True
+
+    return rook_found and king_found
+
+
+# Finds the rank of the pawn that can be captured en passant on the given move. A pawn only counts if an opposing pawn
+# is standing next to it, since otherwise the capture could never be played and the position is the same as one in
+# which the pawn moved one square at a time. Returns None if there is no such pawn.
+def get_en_passant_rank(board, move_count):
+    for pawn in board:
+        if (isinstance(pawn, Pawn) and not pawn.is_captured()
+                and pawn.get_move_when_capturable_en_passant() == move_count):
+            position = pawn.get_position()
+
+            # Look for an opposing pawn directly to the left or right
+            for chess_piece in board:
+                if (isinstance(chess_piece, Pawn) and not chess_piece.is_captured()
+                        and chess_piece.is_white() != pawn.is_white()
+                        and chess_piece.get_position()[1] == position[1]
+                        and abs(chess_piece.get_position()[0] - position[0]) == 1):
+                    return position[0]
+    return None
+
+
+# Keeps a record of every position reached in the game so that draws by threefold repetition and the fifty-move rule
+# can be detected. Positions are stored as hashes (see position_hash).
+# The halfmove clock counts the moves made since the last capture or pawn move. Since neither of those can be undone,
+# no position from before them can ever be repeated, so repetition checks only need to look back that far.
+class PositionHistory:
+    def __init__(self, board, is_white_turn=True, move_count=1):
+        self._hashes = [position_hash(board, is_white_turn, move_count)]
+        self._pawn_hash = pawn_hash(board)
+        self._halfmove_clock = 0
+        self._halfmove_clocks = [0]  # The halfmove clock of every position, so moves can be taken back
+        self._is_white_turn = is_white_turn
+        self._move_count = move_count
+
+    def get_hashes(self):
+        return self._hashes
+
+    def get_current_hash(self):
+        return self._hashes[-1]
+
+    def get_halfmove_clock(self):
+        return self._halfmove_clock
+
+    # Hash of the current pawn structure (see pawn_hash). Kept up to date move by move with update_pawn_hash
+    def get_pawn_hash(self):
+        return self._pawn_hash
+
+    # Updates the pawn hash for a pawn moving from origin to destination. A destination of None means the pawn left
+    # the board (it was captured or promoted).
+    def update_pawn_hash(self, pawn, origin, destination):
+        self._pawn_hash ^= piece_key(pawn, origin)
+        if destination is not None:
+            self._pawn_hash ^= piece_key(pawn, destination)
+
+    # Records the position reached after a move. is_white_turn and move_count describe the move that comes next.
+    # irreversible should be True if the move was a capture or a pawn move.
+    def record_move(self, board, is_white_turn, move_count, irreversible):
+        if irreversible:
+            self._halfmove_clock = 0
+        else:
+            self._halfmove_clock += 1
+        self._is_white_turn = is_white_turn
+        self._move_count = move_count
+        self._hashes.append(position_hash(board, is_white_turn, move_count))
+        self._halfmove_clocks.append(self._halfmove_clock)
+
+    # Forgets the latest position, after its move was taken back. board is the board as it is now (after the takeback)
+    def take_back(self, board):
+        self._hashes.pop()
+        self._halfmove_clocks.pop()
+        self._halfmove_clock = self._halfmove_clocks[-1]
+        self._is_white_turn = not self._is_white_turn
+        self._move_count -= 1
+        self._pawn_hash = pawn_hash(board)
+
+    # Recalculates the hash of the latest position. Used when the board changes after the move was recorded
+    # (i.e. a pawn was promoted).
+    def update_current_position(self, board):
+        self._hashes[-1] = position_hash(board, self._is_white_turn, self._move_count)
+
+    # Counts how many times the current position has occurred. Only positions with the same side to move can match,
+    # so every other entry is skipped, and the search stops at the last capture or pawn move.
+    def count_repetitions(self):
+        current_hash = self._hashes[-1]
+        oldest_index = max(len(self._hashes) - 1 - self._halfmove_clock, 0)
+        repetitions = 0
+
+        for index in range(len(self._hashes) - 1, oldest_index - 1, -2):
+            if self._hashes[index] == current_hash:
+                repetitions += 1
+
+        return repetitions
+
+    def is_threefold_repetition(self):
+        return self.count_repetitions() >= 3
+
+    # Fifty moves by each player (100 halfmoves) without a capture or pawn move
+    def is_fifty_move_draw(self):
+        return self._halfmove_clock >= 100
+
+
+# Converts a square number from 0 to 63 back into a [rank, file] position
+def square_position(index):
+    return [index % MAX_RANK, index // MAX_RANK]
+
+
+# Packs a move into a 16-bit number: the origin square in the lowest 6 bits, the destination square in the next 6, and
+# the promotion piece type (its index in piece_types, or 0 if there is no promotion) in the top 4.
+def encode_move(origin, destination, promotion_type=None):
+    promotion_code = 0 if promotion_type is None else piece_types.index(promotion_type)
+    return square_index(origin) | square_index(destination) << 6 | promotion_code << 12
+
+
+# Unpacks a move packed by encode_move. Returns an (origin, destination, promotion_type) tuple.
+def decode_move(encoded_move):
+    promotion_code = encoded_move >> 12
+    return (square_position(encoded_move & 0x3f), square_position(encoded_move >> 6 & 0x3f),
+            piece_types[promotion_code] if promotion_code else None)
+
+
+# Records everything about the board that playing a move can change (which pieces are on it, and each piece's position,
+# captured status, has_moved flag and en passant turn), so a move can be taken back with restore_board_state.
+def save_board_state(board):
+    piece_states = []
+    for piece in board:
+        has_moved = piece.has_previously_moved() if isinstance(piece, (Pawn, Rook, King)) else None
+        en_passant_turn = piece.get_move_when_capturable_en_passant() if isinstance(piece, Pawn) else None
+        piece_states.append((piece, piece.get_position(), piece.is_captured(), has_moved, en_passant_turn))
+    return piece_states
+
+
+# Puts the board back exactly as it was when save_board_state was called
+def restore_board_state(board, piece_states):
+    board[:] = [piece_state[0] for piece_state in piece_states]
+    for piece, position, is_captured, has_moved, en_passant_turn in piece_states:
+        piece.set_position(position)
+        if is_captured:
+            piece.capture()
+        else:
+            piece.un_capture()
+        if has_moved is not None:
+            piece.set_has_moved(has_moved)
+        if en_passant_turn is not None:
+            piece.set_move_when_capturable_en_passant(en_passant_turn)
+
+
+# Letters used for each piece type in FEN (upper case for white, lower case for black)
+fen_letters = {Pawn: "p", Knight: "n", Bishop: "b", Rook: "r", Queen: "q", King: "k"}
+fen_piece_types = {letter: piece_type for piece_type, letter in fen_letters.items()}
+
+# FEN of the starting position
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+# Converts the side to move and FEN move number into a move_count (the number of the move about to be played,
+# counting both players' moves, starting from 1)
+def fen_move_count(is_white_turn, fullmove_number):
+    return 2 * (fullmove_number - 1) + (1 if is_white_turn else 2)
+
+
+# Sets up a board from a FEN string. Returns (board, is_white_turn, move_count, halfmove_clock).
+# Pawns away from their starting row are marked as moved, kings and rooks are only marked as unmoved if a castling right
+# needs them, and a pawn that can be captured en passant is marked as capturable on this move.
+def board_from_fen(fen):
+    fields = fen.split()
+    placement, side, castling = fields[0], fields[1], fields[2]
+    en_passant = fields[3] if len(fields) > 3 else "-"
+    halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+    fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+
+    is_white_turn = side == "w"
+    move_count = fen_move_count(is_white_turn, fullmove_number)
+    board = []
+
+    # Place the pieces. FEN lists the rows from the top (row 8) down, and each row from column a to h
+    for row_number, row in enumerate(placement.split("/")):
+        file = MAX_FILE - 1 - row_number
+        rank = 0
+        for letter in row:
+            if letter.isdigit():
+                rank += int(letter)
+                continue
+            board.append(fen_piece_types[letter.lower()](letter.isupper(), [rank, file]))
+            rank += 1
+
+    # Mark pieces as moved where the FEN says they must have
+    for piece in board:
+        position = piece.get_position()
+        if isinstance(piece, Pawn):
+            piece.set_has_moved(position[1] != (1 if piece.is_white() else MAX_FILE - 2))
+        elif isinstance(piece, Rook):
+            corner = rook_home_squares.index(position) if position in rook_home_squares else None
+            piece.set_has_moved(corner is None or "QKqk"[corner] not in castling)
+        elif isinstance(piece, King):
+            piece.set_has_moved(not any(letter in castling for letter in ("QK" if piece.is_white() else "qk")))
+
+    # The en passant square is the one behind the pawn that just moved two squares
+    if en_passant != "-":
+        target = [ord(en_passant[0]) - 97, ord(en_passant[1]) - 49]
+        pawn_position = [target[0], target[1] + (-1 if is_white_turn else 1)]
+        for piece in board:
+            if isinstance(piece, Pawn) and piece.get_position() == pawn_position:
+                piece.set_move_when_capturable_en_passant(move_count)
+
+    return board, is_white_turn, move_count, halfmove_clock
+
+
+# Describes the position as a FEN string
+def board_to_fen(board, is_white_turn, move_count, halfmove_clock=0):
+
+    # Piece placement, from row 8 down
+    squares = {}
+    for piece in board:
+        if not piece.is_captured():
+            letter = fen_letters[type(piece)]
+            squares[tuple(piece.get_position())] = letter.upper() if piece.is_white() else letter
+
+    rows = []
+    for file in range(MAX_FILE - 1, -1, -1):
+        row = ""
+        empty_squares = 0
+        for rank in range(MAX_RANK):
+            if (rank, file) in squares:
+                row += (str(empty_squares) if empty_squares else "") + squares[(rank, file)]
+                empty_squares = 0
+            else:
+                empty_squares += 1
+        rows.append(row + (str(empty_squares) if empty_squares else ""))
+
+    # Castling rights, in FEN order (white king side first)
+    castling = "".join(letter for corner, letter in [(1, "K"), (0, "Q"), (3, "k"), (2, "q")]
+                       if castling_right_remains(board, rook_home_squares[corner]))
+
+    # En passant square: the one behind a pawn that can be captured en passant on this move
+    en_passant = "-"
+    for piece in board:
+        if (isinstance(piece, Pawn) and not piece.is_captured()
+                and piece.get_move_when_capturable_en_passant() == move_count):
+            position = piece.get_position()
+            en_passant = chr(position[0] + 97) + chr(position[1] + (-1 if piece.is_white() else 1) + 49)
+
+    return (f"{'/'.join(rows)} {'w' if is_white_turn else 'b'} {castling or '-'} {en_passant} "
+            f"{halfmove_clock} {(move_count + 1) // 2}")
+
+
+# Converts a [rank, file] position to a square name (i.e. [4, 1] -> "e2")
+def square_name(position):
+    return chr(position[0] + 97) + chr(position[1] + 49)
+
+
+# Converts a square name (i.e. "e2") to a [rank, file] position
+def square_from_name(name):
+    return [ord(name[0]) - 97, ord(name[1]) - 49]
+
+
+# Writes an (origin, destination, promotion_type) move in coordinate notation, as used by UCI (i.e. "e2e4", "e7e8q")
+def move_to_text(move):
+    origin, destination, promotion_type = move
+    return square_name(origin) + square_name(destination) + (fen_letters[promotion_type] if promotion_type else "")
+
+
+# Reads a move written in coordinate notation. Returns an (origin, destination, promotion_type) tuple
+def move_from_text(text):
+    promotion_type = fen_piece_types[text[4].lower()] if len(text) > 4 else None
+    return square_from_name(text[0:2]), square_from_name(text[2:4]), promotion_type
+
+
+# Fixed-width binary encoding of a position, so positions can be stored side by side in a buffer (i.e. shared memory)
+# and read back without pickling. Each position takes POSITION_SIZE bytes: a header with the side to move (1 byte),
+# 3 reserved bytes and the move_count (4 bytes), followed by one byte per square. A square's byte is 0 if it is empty,
+# otherwise it holds the piece type (its index in piece_types, plus 1) in the lowest 3 bits, then bits for "is white",
+# "has moved" and "can be captured en passant on this move". Captured pieces are not stored.
+position_header_format = struct.Struct("<B3xI")
+POSITION_SIZE = position_header_format.size + MAX_RANK * MAX_FILE
+
+SQUARE_WHITE = 0x08
+SQUARE_HAS_MOVED = 0x10
+SQUARE_EN_PASSANT = 0x20
+
+
+# Writes the position into buffer (anything writable, like a bytearray or shared memory) starting at offset
+def pack_position(buffer, offset, board, is_white_turn, move_count):
+    position_header_format.pack_into(buffer, offset, 1 if is_white_turn else 0, move_count)
+    squares_offset = offset + position_header_format.size
+    buffer[squares_offset:squares_offset + MAX_RANK * MAX_FILE] = bytes(MAX_RANK * MAX_FILE)
+
+    for piece in board:
+        if piece.is_captured():
+            continue
+        square = piece_type_index(piece) + 1
+        if piece.is_white():
+            square |= SQUARE_WHITE
+        if isinstance(piece, (Pawn, Rook, King)) and piece.has_previously_moved():
+            square |= SQUARE_HAS_MOVED
+        if isinstance(piece, Pawn) and piece.get_move_when_capturable_en_passant() == move_count:
+            square |= SQUARE_EN_PASSANT
+        buffer[squares_offset + square_index(piece.get_position())] = square
+
+
+# Reads a position written by pack_position. Returns (board, is_white_turn, move_count)
+def unpack_position(buffer, offset):
+    side_to_move, move_count = position_header_format.unpack_from(buffer, offset)
+    squares_offset = offset + position_header_format.size
+    board = []
+
+    for index, square in enumerate(bytes(buffer[squares_offset:squares_offset + MAX_RANK * MAX_FILE])):
+        if not square:
+            continue
+        piece = piece_types[(square & 0x07) - 1](bool(square & SQUARE_WHITE), square_position(index))
+        if isinstance(piece, (Pawn, Rook, King)):
+            piece.set_has_moved(bool(square & SQUARE_HAS_MOVED))
+        if square & SQUARE_EN_PASSANT:
+            piece.set_move_when_capturable_en_passant(move_count)
+        board.append(piece)
+
+    return board, side_to_move == 1, move_count
@@ -0,0 +1,294 @@
+import argparse
+import time
+import tracemalloc
+from ChessGame import play_move
+from ChessPosition import position_hash, save_board_state, restore_board_state, board_from_fen, move_to_text
+from ChessEngine import get_search_moves, is_in_check
+
+# Proof and disproof numbers never go above this (it stands for "infinite", meaning proven impossible)
+INFINITY = 10 ** 9
+
+# Possible outcomes of solving a puzzle
+MATE_FOUND = "mate"
+NO_MATE = "no mate"
+UNKNOWN = "unknown"
+
+
+# Raised when the solver has searched as many positions as it is allowed to
+class NodeLimitReached(Exception):
+    pass
+
+
+# The result of solving one puzzle: whether a mate was found (or proven not to exist), the mating line if there is one,
+# how many positions were searched, and how long it took.
+class PuzzleResult:
+    def __init__(self, outcome, mating_line, nodes, elapsed, table_size):
+        self._outcome = outcome
+        self._mating_line = mating_line
+        self._nodes = nodes
+        self._elapsed = elapsed
+        self._table_size = table_size
+
+    def get_outcome(self):
+        return self._outcome
+
+    def get_mating_line(self):
+        return self._mating_line
+
+    def get_nodes(self):
+        return self._nodes
+
+    def get_elapsed(self):
+        return self._elapsed
+
+    # Number of positions stored in the solver's table
+    def get_table_size(self):
+        return self._table_size
+
+
+# Proves or refutes "the side to move can force mate in N moves" with depth-first proof-number search (df-pn).
+#
+# The search tree alternates between the attacker (who needs just one move that forces mate) and the defender (who
+# needs just one move that avoids it). Every position gets two numbers: the proof number is how many positions would at
+# least have to be solved to prove the mate, and the disproof number is the same for refuting it. The solver always
+# expands the most promising position, so it only spends time on the lines that decide the answer. Here, each position
+# stores phi and delta: its proof and disproof numbers as seen by the side to move (phi is the proof number at attacker
+# positions and the disproof number at defender positions). Mates are detected with the game's check logic
+# (piece_threatening_king): the defender is mated if they are in check and have no legal move.
+class MateSolver:
+    def __init__(self, max_nodes=None):
+        self._table = {}  # Maps (position hash, plies left) to (phi, delta)
+        self._max_nodes = max_nodes
+        self._nodes = 0
+
+    # Tries to prove that the side to move can force mate within mate_in moves. Returns a PuzzleResult.
+    def solve(self, board, is_white_turn, move_count, mate_in):
+        self._table = {}
+        self._nodes = 0
+        start_time = time.perf_counter()
+
+        plies = 2 * mate_in - 1  # The attacker's last move delivers mate, so the defender's last reply isn't needed
+        root_key = (position_hash(board, is_white_turn, move_count), plies)
+
+        try:
+            self._search(board, is_white_turn, move_count, root_key, plies, True, INFINITY, INFINITY)
+        except NodeLimitReached:
+            return PuzzleResult(UNKNOWN, [], self._nodes, time.perf_counter() - start_time, len(self._table))
+
+        phi, delta = self._table[root_key]
+        if phi == 0:
+            outcome = MATE_FOUND
+            mating_line = self._get_mating_line(board, is_white_turn, move_count, plies)
+        else:
+            outcome = NO_MATE
+            mating_line = []
+        return PuzzleResult(outcome, mating_line, self._nodes, time.perf_counter() - start_time, len(self._table))
+
+    # Looks up a position's (phi, delta). Positions that haven't been searched yet start at (1, 1)
+    def _lookup(self, key):
+        return self._table.get(key, (1, 1))
+
+    # Checks if a position is decided without searching it. Returns (phi, delta) if it is, or the legal moves if not.
+    def _evaluate_position(self, board, is_white_turn, move_count, plies_left, is_attacker):
+
+        # After the attacker's last move, the defender must be mated. Checking for check first avoids generating moves
+        if not is_attacker and plies_left == 0:
+            if not is_in_check(board, is_white_turn, move_count):
+                return (0, INFINITY), None
+            if get_search_moves(board, is_white_turn, move_count):
+                return (0, INFINITY), None
+            return (INFINITY, 0), None
+
+        moves = get_search_moves(board, is_white_turn, move_count)
+        if not moves:
+
+            # An attacker with no moves has failed. A defender with no moves is mated if in check, otherwise stalemated
+            if is_attacker or is_in_check(board, is_white_turn, move_count):
+                return (INFINITY, 0), None
+            return (0, INFINITY), None
+
+        return None, moves
+
+    # The df-pn search of one position. Keeps expanding its most promising child until the position's phi reaches
+    # phi_threshold or its delta reaches delta_threshold (meaning another part of the tree has become more promising).
+    def _search(self, board, is_white_turn, move_count, key, plies_left, is_attacker, phi_threshold, delta_threshold):
+        if self._max_nodes is not None and self._nodes >= self._max_nodes:
+            raise NodeLimitReached()
+        self._nodes += 1
+
+        # Nothing more to do if the position has already been proven or disproven
+        if self._lookup(key)[0] == 0 or self._lookup(key)[1] == 0:
+            return
+
+        # See if the position is decided without searching it
+        numbers, moves = self._evaluate_position(board, is_white_turn, move_count, plies_left, is_attacker)
+        if numbers is not None:
+            self._table[key] = numbers
+            return
+
+        # Find the key of every child position
+        children = []
+        for move in moves:
+            board_state = save_board_state(board)
+            play_move(board, move[0], move[1], move_count, move[2])
+            children.append((move, (position_hash(board, not is_white_turn, move_count + 1), plies_left - 1)))
+            restore_board_state(board, board_state)
+
+        while True:
+
+            # The side to move needs only one child that works for them (the smallest delta among the children), but
+            # the opponent has to refute every child (the sum of the children's phi)
+            phi = INFINITY
+            delta = 0
+            best_child = None
+            best_child_phi = 0
+            second_smallest_delta = INFINITY
+            for child in children:
+                child_phi, child_delta = self._lookup(child[1])
+                delta = min(delta + child_phi, INFINITY)
+                if child_delta < phi:
+                    second_smallest_delta = phi
+                    phi = child_delta
+                    best_child = child
+                    best_child_phi = child_phi
+                elif child_delta < second_smallest_delta:
+                    second_smallest_delta = child_delta
+
+            self._table[key] = (phi, delta)
+            if phi >= phi_threshold or delta >= delta_threshold:
+                return
+
+            # Search the most promising child, until it stops being the most promising one
+            child_phi_threshold = min(delta_threshold + best_child_phi - delta, INFINITY)
+            child_delta_threshold = min(phi_threshold, second_smallest_delta + 1)
+
+            board_state = save_board_state(board)
+            try:
+                play_move(board, best_child[0][0], best_child[0][1], move_count, best_child[0][2])
+                self._search(board, not is_white_turn, move_count + 1, best_child[1], plies_left - 1, not is_attacker,
+                             child_phi_threshold, child_delta_threshold)
+            finally:
+                restore_board_state(board, board_state)
+
+    # Follows the proof from the root to build a mating line: the attacker plays a move that was proven to mate, and the
+    # defender plays any move that was searched (all of them were proven to lose).
+    def _get_mating_line(self, board, is_white_turn, move_count, plies):
+        mating_line = []
+        board_state = save_board_state(board)
+        is_attacker = True
+
+        for plies_left in range(plies, 0, -1):
+            next_move = None
+            for move in get_search_moves(board, is_white_turn, move_count):
+                child_state = save_board_state(board)
+                play_move(board, move[0], move[1], move_count, move[2])
+                child_phi, child_delta = self._lookup((position_hash(board, not is_white_turn, move_count + 1),
+                                                       plies_left - 1))
+                restore_board_state(board, child_state)
+
+                # After a proven attacker move the defender is lost (delta 0), and after any defender move the attacker
+                # can still force mate (phi 0)
+                if (is_attacker and child_delta == 0) or (not is_attacker and child_phi == 0):
+                    next_move = move
+                    break
+
+            if next_move is None:
+                break
+            mating_line.append(next_move)
+            play_move(board, next_move[0], next_move[1], move_count, next_move[2])
+            is_white_turn = not is_white_turn
+            move_count += 1
+            is_attacker = not is_attacker
+
+        restore_board_state(board, board_state)
+        return mating_line
+
+
+# Reads a puzzle file. Each line holds a FEN, the number of moves to mate in, and optionally the expected first move
+# (or "-" if there should be no mate), separated by semicolons (i.e. "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1; 1; a1a8").
+# Blank lines and lines starting with "#" are skipped. Returns a list of (fen, mate_in, expected_move) tuples.
+def read_puzzle_file(path):
+    puzzles = []
+    with open(path, encoding="utf-8") as puzzle_file:
+        for line in puzzle_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in line.split(";")]
+            puzzles.append((fields[0], int(fields[1]), fields[2] if len(fields) > 2 and fields[2] else None))
+    return puzzles
+
+
+# Solves every puzzle again with memory tracing on, and returns the peak memory used in bytes. This is kept apart from
+# the timed solving in solve_puzzles, since tracing every allocation slows the search down.
+def measure_peak_memory(puzzles, max_nodes=None):
+    solver = MateSolver(max_nodes)
+    tracemalloc.start()
+    for fen, mate_in, expected_move in puzzles:
+        board, is_white_turn, move_count, halfmove_clock = board_from_fen(fen)
+        solver.solve(board, is_white_turn, move_count, mate_in)
+    current_memory, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak_memory
+
+
+# Solves every puzzle in the list, printing a line for each one and a summary with the positions searched per second
+# and (if measure_memory is True) the peak memory used, which takes a second, untimed pass over the puzzles. Returns the
+# number of puzzles whose answer didn't match what was expected.
+def solve_puzzles(puzzles, max_nodes=None, measure_memory=True):
+    solver = MateSolver(max_nodes)
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+
+    for number, (fen, mate_in, expected_move) in enumerate(puzzles, start=1):
+        board, is_white_turn, move_count, halfmove_clock = board_from_fen(fen)
+        result = solver.solve(board, is_white_turn, move_count, mate_in)
+        total_nodes += result.get_nodes()
+        total_time += result.get_elapsed()
+
+        # A puzzle fails if the outcome isn't the expected one, or the mate starts with a different move than expected
+        first_move = move_to_text(result.get_mating_line()[0]) if result.get_mating_line() else None
+        if expected_move == "-":
+            failed = result.get_outcome() != NO_MATE
+        else:
+            failed = result.get_outcome() != MATE_FOUND or (expected_move is not None and first_move != expected_move)
+        if failed:
+            failures += 1
+
+        line = " ".join(move_to_text(move) for move in result.get_mating_line())
+        print(f"{number}. {'FAIL' if failed else 'ok  '} mate in {mate_in}: {result.get_outcome()} {line} "
+              f"({result.get_nodes()} positions, {result.get_elapsed():.2f}s)")
+
+    positions_per_second = total_nodes / total_time if total_time > 0 else 0
+    summary = (f"\n{len(puzzles) - failures}/{len(puzzles)} solved, {total_nodes} positions in {total_time:.2f}s "
+               f"({positions_per_second:.0f} positions/s)")
+    if measure_memory:
+        summary += f", peak memory {measure_peak_memory(puzzles, max_nodes) / 1024 / 1024:.1f} MB"
+    print(summary)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prove or refute mate in N puzzles.")
+    parser.add_argument("puzzle_file", nargs="?", help="file with one \"FEN; N; expected move\" puzzle per line")
+    parser.add_argument("--fen", help="solve a single position instead of a file")
+    parser.add_argument("--mate-in", type=int, default=1, help="number of moves to mate in (with --fen)")
+    parser.add_argument("--max-nodes", type=int, help="give up on a puzzle after searching this many positions")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip measuring peak memory (a second pass over the puzzles)")
+    args = parser.parse_args()
+
+    if args.fen is not None:
+        puzzles = [(args.fen, args.mate_in, None)]
+    elif args.puzzle_file is not None:
+        puzzles = read_puzzle_file(args.puzzle_file)
+    else:
+        parser.error("give a puzzle file or --fen")
+
+    # Exit with an error code if any puzzle failed, so batch runs can be checked by scripts
+    raise SystemExit(1 if solve_puzzles(puzzles, args.max_nodes, not args.no_memory) else 0)
+
+
+if __name__ == "__main__":
+    main()
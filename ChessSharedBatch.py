@@ -0,0 +1,70 @@
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from ChessPosition import POSITION_SIZE, pack_position, unpack_position
+
+# Worker processes started by multiprocessing share the resource tracker of the process that started them, as long as
+# it was already running when they were started. Otherwise a worker starts a tracker of its own, which would free any
+# batch the worker attached to (with a warning) when the worker exits. Starting it here, before any workers can be
+# started, means only the creator of a batch ever frees it. Python 3.13 and later attach without tracking instead.
+if os.name == "posix" and sys.version_info < (3, 13):
+    resource_tracker.ensure_running()
+
+
+# A batch of positions stored in shared memory with the fixed-width encoding from pack_position. The process that
+# creates the batch fills it in and passes only its name (and the range of positions to work on) to worker processes,
+# which attach to the same memory and read or write positions in place. Nothing is pickled except the name.
+class SharedPositionBatch:
+    def __init__(self, capacity, name=None):
+        self._capacity = capacity
+        self._is_owner = name is None
+
+        # Create new shared memory, or attach to an existing batch by name
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=max(capacity * POSITION_SIZE, 1))
+        else:
+
+            # Before Python 3.13, attaching also registers the memory with the resource tracker. That is harmless as
+            # long as it is the creator's tracker (see the top of this file), where it is registered already. Later
+            # versions can attach without registering it at all
+            if sys.version_info >= (3, 13):
+                self._memory = shared_memory.SharedMemory(name=name, track=False)
+            else:
+                self._memory = shared_memory.SharedMemory(name=name)
+
+    # Attaches to a batch created by another process
+    @classmethod
+    def attach(cls, name, capacity):
+        return cls(capacity, name)
+
+    def get_name(self):
+        return self._memory.name
+
+    def get_capacity(self):
+        return self._capacity
+
+    # Returns the offset in the shared memory where position number index starts
+    def get_offset(self, index):
+        if not 0 <= index < self._capacity:
+            raise IndexError(f"Position {index} is outside a batch of {self._capacity} positions.")
+        return index * POSITION_SIZE
+
+    # Stores a position in slot number index
+    def write_position(self, index, board, is_white_turn, move_count):
+        pack_position(self._memory.buf, self.get_offset(index), board, is_white_turn, move_count)
+
+    # Reads the position in slot number index. Returns (board, is_white_turn, move_count)
+    def read_position(self, index):
+        return unpack_position(self._memory.buf, self.get_offset(index))
+
+    # Detaches from the shared memory. The process that created the batch also frees it
+    def close(self):
+        self._memory.close()
+        if self._is_owner:
+            self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,128 @@
+import mmap
+import os
+import struct
+import sys
+from binascii import crc32
+
+# Precomputed lookup tables, built once and stored in a binary cache file so later launches only have to map the file
+# into memory instead of building them again. Each table is a flat array of numbers (an array type code and items).
+
+# Change TABLE_VERSION whenever a table is added, removed or built differently, so that cache files written by an
+# older version are rebuilt instead of being read
+TABLE_MAGIC = b"CHTB"
+TABLE_VERSION = 1
+
+# The file starts with a header (magic, version, number of tables, CRC-32 of everything after the header), then one
+# directory entry per table (name, array type code, number of items, offset of its data from the start of the file),
+# then the data of every table, little-endian, each table starting on an 8-byte boundary
+table_header_format = struct.Struct("<4sHHI")
+table_entry_format = struct.Struct("<16sc3xII")
+
+# Where the cache is kept: next to the bytecode caches, which are rebuilt just as freely
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__", "chess_tables.bin")
+
+# The Zobrist keys: one per (color, piece type, square), then one per castling corner, one per en passant rank and one
+# for black to move (see ChessPosition). The seed must never change, since hashes are stored on disk.
+ZOBRIST_SEED = 0xC4E55
+ZOBRIST_KEY_COUNT = 2 * 6 * 64 + 4 + 8 + 1
+
+
+# Generates the Zobrist keys, in the order ChessPosition uses them
+def build_zobrist_keys():
+    import random  # Only needed when the tables are built, which is rare, so it isn't imported on every launch
+    from array import array
+    key_generator = random.Random(ZOBRIST_SEED)
+    return array("Q", [key_generator.getrandbits(64) for key in range(ZOBRIST_KEY_COUNT)])
+
+
+# Maps each table's name to the function that builds it
+table_builders = {
+    "zobrist_keys": build_zobrist_keys,
+}
+
+
+# Builds every table. Returns a dictionary mapping each table's name to its array.
+def build_tables():
+    return {name: builder() for name, builder in table_builders.items()}
+
+
+# Writes the tables to a cache file. The file is written under a temporary name and then renamed, so another process
+# starting at the same time never sees half a file.
+def write_tables(path, tables):
+    data_offset = table_header_format.size + table_entry_format.size * len(tables)
+    entries = bytearray()
+    data = bytearray()
+    for name, table in tables.items():
+        data += bytes(-(data_offset + len(data)) % 8)  # Padding up to an 8-byte boundary
+        entries += table_entry_format.pack(name.encode("ascii"), table.typecode.encode("ascii"), len(table),
+                                           data_offset + len(data))
+        if sys.byteorder != "little":
+            table = type(table)(table.typecode, table)
+            table.byteswap()
+        data += table.tobytes()
+
+    body = entries + data
+    header = table_header_format.pack(TABLE_MAGIC, TABLE_VERSION, len(tables), crc32(body))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as table_file:
+        table_file.write(header + body)
+    os.replace(temporary_path, path)
+
+
+# Maps a cache file into memory and returns a dictionary mapping each table's name to a read-only view of its items
+# (indexed like a list, without copying the data out of the file). Returns None if the file is missing, was written by
+# another version, is damaged, or doesn't hold exactly the tables in table_builders.
+def read_tables(path):
+    try:
+        with open(path, "rb") as table_file:
+            if os.fstat(table_file.fileno()).st_size <= table_header_format.size:
+                return None
+            file_map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError:
+        return None
+
+    view = memoryview(file_map)
+    magic, version, table_count, checksum = table_header_format.unpack_from(view, 0)
+    if magic != TABLE_MAGIC or version != TABLE_VERSION or checksum != crc32(view[table_header_format.size:]):
+        return None
+
+    tables = {}
+    for table_number in range(table_count):
+        entry_offset = table_header_format.size + table_number * table_entry_format.size
+        if entry_offset + table_entry_format.size > len(view):
+            return None
+        name, typecode, item_count, data_offset = table_entry_format.unpack_from(view, entry_offset)
+        name, typecode = name.rstrip(b"\0").decode("ascii"), typecode.decode("ascii")
+        data_size = item_count * struct.calcsize(typecode)
+        if data_offset + data_size > len(view):
+            return None
+
+        table = view[data_offset:data_offset + data_size]
+        if sys.byteorder == "little":
+            tables[name] = table.cast(typecode)
+        else:
+            from array import array  # Only needed on big-endian machines, which have to copy the tables to swap them
+            tables[name] = array(typecode, table.tobytes())
+            tables[name].byteswap()
+
+    if tables.keys() != table_builders.keys():
+        return None
+    return tables
+
+
+# Returns the lookup tables, reading them from the cache file if it is up to date. Otherwise they are built, and written
+# to the cache file for next time (if the file can't be written, i.e. the directory is read-only, they are just built
+# again on the next launch).
+def load_tables(path=CACHE_PATH):
+    tables = read_tables(path)
+    if tables is not None:
+        return tables
+
+    tables = build_tables()
+    try:
+        write_tables(path, tables)
+    except OSError:
+        pass
+    return tables
@@ -0,0 +1,179 @@
+from ChessPieces import Pawn, Bishop, Knight, Rook, Queen, King
+from ChessGame import move_is_invalid, get_path
+
+# Material value of each piece type, in hundredths of a pawn. The king is given a value much larger than everything
+# else combined so that an exchange never "wins" by giving it up.
+piece_values = {
+    Pawn: 100,
+    Knight: 320,
+    Bishop: 330,
+    Rook: 500,
+    Queen: 900,
+    King: 20000
+}
+
+
+# Returns the material value of the given piece
+def get_piece_value(piece):
+    return piece_values[type(piece)]
+
+
+# Returns the uncaptured piece standing on the given square, or None if the square is empty
+def get_piece_at(board, square):
+    for chess_piece in board:
+        if chess_piece.get_position() == square and not chess_piece.is_captured():
+            return chess_piece
+    return None
+
+
+# Determines if the piece attacks the given square, assuming only the squares in occupied are blocked. Unlike
+# move_is_invalid, this ignores pins and whose turn it is (which is what an exchange calculation needs), and pawns only
+# attack diagonally.
+def piece_attacks_square(piece, square, occupied):
+    position = piece.get_position()
+    delta_x = square[0] - position[0]
+    delta_y = square[1] - position[1]
+
+    # A piece doesn't attack the square it stands on
+    if delta_x == 0 and delta_y == 0:
+        return False
+
+    # Pawns attack one square diagonally forwards
+    if isinstance(piece, Pawn):
+        return abs(delta_x) == 1 and delta_y == (1 if piece.is_white() else -1)
+
+    # Kings attack the squares around them (castling is not an attack)
+    if isinstance(piece, King):
+        return abs(delta_x) <= 1 and abs(delta_y) <= 1
+
+    # Every other piece has to follow its movement rules
+    if not piece.is_legal_move(square):
+        return False
+
+    # Sliding pieces also need a clear path (knights have an empty path)
+    for path_square in get_path(piece, square):
+        if (path_square[0], path_square[1]) in occupied:
+            return False
+    return True
+
+
+# Finds the least valuable piece of the given color that attacks the square. Pieces in the used set have already taken
+# part in the exchange and are skipped. Returns None if there are no attackers left.
+def least_valuable_attacker(board, square, is_white, occupied, used):
+    attacker = None  # To hold the cheapest attacker found so far
+
+    for chess_piece in board:
+        if (chess_piece.is_captured() or chess_piece.is_white() != is_white or id(chess_piece) in used
+                or not piece_attacks_square(chess_piece, square, occupied)):
+            continue
+        if attacker is None or get_piece_value(chess_piece) < get_piece_value(attacker):
+            attacker = chess_piece
+
+    return attacker
+
+
+# Static exchange evaluation. Works out the material result of piece capturing on destination if both sides then keep
+# recapturing on that square, each always using their least valuable attacker. Pieces that move onto the square can
+# uncover attackers behind them (x-rays, i.e. a rook behind a rook). Either side may stop recapturing whenever continuing
+# would lose material. Returns the expected material gain for the side making the first capture (negative if the
+# capture loses material). Quiet moves are evaluated too, in which case the result is 0 or the loss of the moved piece.
+def static_exchange_evaluation(board, piece, destination):
+
+    origin = piece.get_position()
+    gains = []  # gains[n] holds the material won by the side making the nth capture, assuming the exchange ends there
+
+    # Every square with a piece on it. The moving piece leaves its square, which may uncover an attacker behind it
+    occupied = {(chess_piece.get_position()[0], chess_piece.get_position()[1])
+                for chess_piece in board if not chess_piece.is_captured()}
+    occupied.discard((origin[0], origin[1]))
+    used = {id(piece)}
+
+    # The first capture wins whatever was on the square. A pawn moving diagonally onto an empty square is capturing
+    # en passant, and wins a pawn
+    target = get_piece_at(board, destination)
+    if target is not None:
+        gains.append(get_piece_value(target))
+    elif isinstance(piece, Pawn) and origin[0] != destination[0]:
+        gains.append(piece_values[Pawn])
+    else:
+        gains.append(0)
+
+    value_on_square = get_piece_value(piece)  # The piece that can be captured next
+    is_white = not piece.is_white()          # Whose turn it is to recapture
+
+    # Play out the recaptures, cheapest attacker first
+    while True:
+        attacker = least_valuable_attacker(board, destination, is_white, occupied, used)
+        if attacker is None:
+            break
+
+        # Record what the recapturing side gets if the exchange ends here
+        gains.append(value_on_square - gains[-1])
+
+        # The attacker moves onto the square, revealing anything behind it
+        value_on_square = get_piece_value(attacker)
+        used.add(id(attacker))
+        occupied.discard((attacker.get_position()[0], attacker.get_position()[1]))
+        is_white = not is_white
+
+    # Work backwards through the exchange. At each step, the side to move only recaptures if it doesn't lose material
+    while len(gains) > 1:
+        last_gain = gains.pop()
+        gains[-1] = -max(-gains[-1], last_gain)
+
+    return gains[0]
+
+
+# Determines if the capture loses material according to the static exchange evaluation
+def is_losing_capture(board, piece, destination):
+    return static_exchange_evaluation(board, piece, destination) < 0
+
+
+# Most valuable victim, least valuable attacker. A quick score for ordering captures: capturing a bigger piece is tried
+# first, and among captures of the same piece, the one using the cheaper attacker is tried first.
+def mvv_lva_score(board, piece, destination):
+    target = get_piece_at(board, destination)
+
+    # A pawn capturing diagonally onto an empty square is capturing another pawn en passant
+    victim_value = get_piece_value(target) if target is not None else piece_values[Pawn]
+    return victim_value * 100 - get_piece_value(piece) // 100
+
+
+# Sorts a list of (piece, destination) captures so the most promising come first (see mvv_lva_score).
+# If prune_losing is True, captures that lose material according to the static exchange evaluation are left out.
+def order_captures(board, captures, prune_losing=False):
+    if prune_losing:
+        captures = [capture for capture in captures if not is_losing_capture(board, capture[0], capture[1])]
+    return sorted(captures, key=lambda capture: mvv_lva_score(board, capture[0], capture[1]), reverse=True)
+
+
+# Finds every legal capture for the player whose turn it is, as a list of (piece, destination) pairs.
+# En passant captures are included.
+def get_legal_captures(board, is_white_turn, move_count):
+    captures = []
+
+    # Squares holding an opposing piece
+    targets = [chess_piece.get_position() for chess_piece in board
+               if not chess_piece.is_captured() and chess_piece.is_white() != is_white_turn]
+
+    # Squares a pawn could capture en passant onto (behind a pawn that just moved two squares)
+    for chess_piece in board:
+        if (isinstance(chess_piece, Pawn) and not chess_piece.is_captured()
+                and chess_piece.is_white() != is_white_turn
+                and chess_piece.get_move_when_capturable_en_passant() == move_count):
+            position = chess_piece.get_position()
+            targets.append([position[0], position[1] + (1 if is_white_turn else -1)])
+
+    # Try every piece of the current player against every target
+    for chess_piece in board:
+        if chess_piece.is_captured() or chess_piece.is_white() != is_white_turn:
+            continue
+        for target in targets:
+
+            # Only pawns can capture onto an empty (en passant) square
+            if get_piece_at(board, target) is None and not isinstance(chess_piece, Pawn):
+                continue
+            if not move_is_invalid(board, chess_piece, target, is_white_turn, move_count):
+                captures.append((chess_piece, target))
+
+    return captures
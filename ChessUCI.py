@@ -0,0 +1,216 @@
+import queue
+import sys
+import threading
+import time
+from ChessGame import play_move, move_is_invalid
+from ChessPosition import START_FEN, board_from_fen, move_to_text, move_from_text
+from ChessEngine import Searcher, moves_to_mate
+
+ENGINE_NAME = "Chess"
+ENGINE_AUTHOR = "Andrew Dagger"
+
+# Time kept in reserve for communicating with the GUI, in seconds
+MOVE_OVERHEAD = 0.05
+
+# Number of moves to plan for when the GUI doesn't say how many are left until the next time control
+DEFAULT_MOVES_TO_GO = 30
+
+
+# Reads commands from the input stream and puts them in the queue, so that commands (like "stop") are picked up
+# immediately even while the engine is busy. Runs on its own thread.
+def read_commands(input_stream, commands):
+    for line in input_stream:
+        commands.put(line)
+
+    # The GUI closed the input, so the engine should exit
+    commands.put("quit")
+
+
+# Works out how long to think about a move, in seconds, from the limits given to the "go" command. Returns None if the
+# search has no time limit.
+def allocate_time(limits, is_white_turn):
+
+    # A fixed time per move
+    if "movetime" in limits:
+        return max(limits["movetime"] / 1000 - MOVE_OVERHEAD, 0.01)
+
+    # Otherwise split the time left on the clock between the remaining moves, and use most of the increment
+    time_left = limits.get("wtime" if is_white_turn else "btime")
+    if time_left is None:
+        return None
+    increment = limits.get("winc" if is_white_turn else "binc", 0)
+    moves_to_go = limits.get("movestogo", DEFAULT_MOVES_TO_GO)
+
+    budget = (time_left / max(moves_to_go, 1) + increment * 0.75) / 1000
+
+    # Never use more than half of what is left on the clock
+    return max(min(budget, time_left / 2000) - MOVE_OVERHEAD, 0.01)
+
+
+# Runs the engine using the UCI protocol. Searches run on their own thread, so the engine keeps reading commands while
+# it thinks. When pondering (thinking on the opponent's time), the search runs without a time limit until the GUI says
+# whether the opponent played the expected move ("ponderhit") or not ("stop"). Results found while pondering are kept
+# in the searcher's transposition table, so the search that follows finishes sooner.
+class UCIEngine:
+    def __init__(self, output=sys.stdout):
+        self._output = output
+        self._output_lock = threading.Lock()
+        self._searcher = Searcher()
+        self._board, self._is_white_turn, self._move_count, halfmove_clock = board_from_fen(START_FEN)
+
+        self._search_thread = None
+        self._stop_event = None     # Set to stop the running search
+        self._release_event = None  # Set once the best move may be sent (not while pondering or in an infinite search)
+        self._ponder_time = None    # Time to think for if a ponder search turns into a normal one (after "ponderhit")
+
+    # Sends a line to the GUI
+    def send(self, line):
+        with self._output_lock:
+            self._output.write(line + "\n")
+            self._output.flush()
+
+    # Carries out one command. Returns False if the engine should exit.
+    def handle_command(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+
+        match tokens[0]:
+            case "uci":
+                self.send(f"id name {ENGINE_NAME}")
+                self.send(f"id author {ENGINE_AUTHOR}")
+                self.send("option name Ponder type check default true")
+                self.send("uciok")
+            case "isready":
+                self.send("readyok")
+            case "ucinewgame":
+                self._stop_search()
+                self._searcher.clear()
+            case "position":
+                self._stop_search()
+                try:
+                    self._set_position(tokens[1:])
+                except ValueError as error:
+                    self.send(f"info string {error}")
+            case "go":
+                self._stop_search()
+                self._go(tokens[1:])
+            case "stop":
+                self._stop_search()
+            case "ponderhit":
+                self._ponderhit()
+            case "quit":
+                self._stop_search()
+                return False
+
+        # Any other command (i.e. "debug", "setoption") has no effect
+        return True
+
+    # Handles "position startpos moves ..." and "position fen <fen> moves ...". Every move is checked with the rules.
+    # Raises ValueError if the position can't be read (the position is left as it was) or at the first move that can't
+    # be read or isn't legal (the position is left after the moves before it).
+    def _set_position(self, tokens):
+        if not tokens or tokens[0] not in ["startpos", "fen"]:
+            raise ValueError("position must be followed by startpos or fen")
+        moves_index = tokens.index("moves") if "moves" in tokens else len(tokens)
+        fen = START_FEN if tokens[0] == "startpos" else " ".join(tokens[1:moves_index])
+        try:
+            position = board_from_fen(fen)
+        except (IndexError, KeyError, ValueError):
+            raise ValueError(f"invalid FEN {fen}")
+        self._board, self._is_white_turn, self._move_count, halfmove_clock = position
+
+        for move_text in tokens[moves_index + 1:]:
+            try:
+                origin, destination, promotion_type = move_from_text(move_text)
+            except (IndexError, KeyError):
+                raise ValueError(f"invalid move {move_text}")
+            piece = next((piece for piece in self._board if piece.get_position() == origin
+                          and not piece.is_captured()), None)
+            if piece is None or move_is_invalid(self._board, piece, destination, self._is_white_turn,
+                                                self._move_count):
+                raise ValueError(f"illegal move {move_text}")
+            play_move(self._board, origin, destination, self._move_count, promotion_type)
+            self._is_white_turn = not self._is_white_turn
+            self._move_count += 1
+
+    # Handles "go" with any of: depth, nodes, movetime, wtime, btime, winc, binc, movestogo, infinite and ponder
+    def _go(self, tokens):
+        limits = {}
+        for index, token in enumerate(tokens):
+            if token in ["depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo"]:
+                limits[token] = int(tokens[index + 1])
+        is_pondering = "ponder" in tokens
+        is_infinite = "infinite" in tokens
+
+        # While pondering the search has no time limit. The time it is allowed is only started on "ponderhit"
+        time_budget = None if is_infinite else allocate_time(limits, self._is_white_turn)
+        self._ponder_time = time_budget if is_pondering else None
+        deadline = time.monotonic() + time_budget if time_budget is not None and not is_pondering else None
+
+        self._stop_event = threading.Event()
+        self._release_event = threading.Event()
+        if not is_pondering and not is_infinite:
+            self._release_event.set()
+
+        self._search_thread = threading.Thread(target=self._run_search, args=(
+            limits.get("depth"), deadline, limits.get("nodes"), self._stop_event, self._release_event))
+        self._search_thread.start()
+
+    # The opponent played the move the engine was pondering on. The search becomes a normal one, with a time limit
+    def _ponderhit(self):
+        if self._ponder_time is not None:
+            self._searcher.set_deadline(time.monotonic() + self._ponder_time)
+            self._ponder_time = None
+        if self._release_event is not None:
+            self._release_event.set()
+
+    # Stops the running search (if any), and waits for it to send its best move
+    def _stop_search(self):
+        if self._search_thread is None:
+            return
+        self._stop_event.set()
+        self._release_event.set()
+        self._search_thread.join()
+        self._search_thread = None
+
+    # Runs on the search thread. Sends "info" lines as the search deepens, then the best move once it is allowed to
+    def _run_search(self, max_depth, deadline, max_nodes, stop_event, release_event):
+        result = self._searcher.search(self._board, self._is_white_turn, self._move_count, max_depth, deadline,
+                                       max_nodes, self._send_info, stop_event)
+
+        # A finished ponder or infinite search has to wait for "ponderhit" or "stop" before answering
+        release_event.wait()
+
+        principal_variation = result.get_principal_variation()
+        if not principal_variation:
+            self.send("bestmove 0000")
+        elif len(principal_variation) > 1:
+            self.send(f"bestmove {move_to_text(principal_variation[0])} ponder {move_to_text(principal_variation[1])}")
+        else:
+            self.send(f"bestmove {move_to_text(principal_variation[0])}")
+
+    # Sends an "info" line describing a completed search depth
+    def _send_info(self, result):
+        mate = moves_to_mate(result.get_score())
+        score = f"mate {mate}" if mate is not None else f"cp {result.get_score()}"
+        elapsed = result.get_elapsed()
+        nodes_per_second = int(result.get_nodes() / elapsed) if elapsed > 0 else 0
+        principal_variation = " ".join(move_to_text(move) for move in result.get_principal_variation())
+        self.send(f"info depth {result.get_depth()} score {score} nodes {result.get_nodes()} nps {nodes_per_second} "
+                  f"time {int(elapsed * 1000)} pv {principal_variation}")
+
+
+def main():
+    engine = UCIEngine()
+
+    # Read commands on a separate thread, so "stop" is seen while the engine is thinking
+    commands = queue.Queue()
+    threading.Thread(target=read_commands, args=(sys.stdin, commands), daemon=True).start()
+
+    while engine.handle_command(commands.get()):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from ChessGame import PositionMoves, position_moves_key, move_is_invalid
+from ChessPosition import POSITION_SIZE, pack_position, unpack_position
+
+
+# Finds the error code (see error_messages in ChessGame.py) of every (origin, destination) move in one position. The
+# position's moves are validated once (as a PositionMoves) and every move is answered from that. Moves it doesn't cover
+# (pieces of the wrong color, destinations off the board) are validated one at a time with move_is_invalid.
+def get_error_codes(board, is_white_turn, move_count, moves):
+    position_moves = PositionMoves(board, is_white_turn, move_count)
+    pieces = {tuple(piece.get_position()): piece for piece in board if not piece.is_captured()}
+    error_codes = []
+
+    for origin, destination in moves:
+        piece = pieces.get(tuple(origin))
+
+        # There is no piece on the origin square (which may be off the board)
+        if piece is None:
+            error_codes.append(2)
+            continue
+
+        error_code = position_moves.get_error_code(origin, destination)
+        if error_code is None:
+            error_code = move_is_invalid(board, piece, list(destination), is_white_turn, move_count)
+        error_codes.append(error_code)
+
+    return error_codes
+
+
+# Worker for validate_moves: validates the moves of one position, which is sent packed (see pack_position) so that
+# only a few bytes have to be pickled for it
+def validate_packed_group(task):
+    packed_position, moves = task
+    board, is_white_turn, move_count = unpack_position(packed_position, 0)
+    return get_error_codes(board, is_white_turn, move_count, moves)
+
+
+# Validates many moves at once, i.e. moves submitted to a server by many clients. Each request is a
+# (position, origin, destination) tuple, where position is (board, is_white_turn, move_count). Requests are grouped by
+# position (see position_moves_key), so each position's moves are only validated once however many requests share it.
+# If a multiprocessing pool is given, the groups are validated by its workers. Returns the error code of every request,
+# in the same order as the requests (0 for valid moves). The boards are not changed.
+def validate_moves(requests, pool=None):
+    groups = {}  # Maps each position's key to [(board, is_white_turn, move_count), moves, request numbers]
+    for request_number, (position, origin, destination) in enumerate(requests):
+        key = position_moves_key(*position)
+        if key not in groups:
+            groups[key] = [position, [], []]
+        groups[key][1].append((tuple(origin), tuple(destination)))
+        groups[key][2].append(request_number)
+
+    # Validate each group, here or on the pool's workers
+    if pool is None:
+        group_codes = [get_error_codes(*position, moves) for position, moves, request_numbers in groups.values()]
+    else:
+        tasks = []
+        for (board, is_white_turn, move_count), moves, request_numbers in groups.values():
+            packed_position = bytearray(POSITION_SIZE)
+            pack_position(packed_position, 0, board, is_white_turn, move_count)
+            tasks.append((bytes(packed_position), moves))
+        group_codes = pool.map(validate_packed_group, tasks)
+
+    # Put the error codes back in the order of the requests
+    error_codes = [0] * sum(len(request_numbers) for position, moves, request_numbers in groups.values())
+    for (position, moves, request_numbers), codes in zip(groups.values(), group_codes):
+        for request_number, error_code in zip(request_numbers, codes):
+            error_codes[request_number] = error_code
+    return error_codes
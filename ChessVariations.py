@@ -0,0 +1,201 @@
+from array import array
+from ChessGame import error_messages, play_move, move_is_invalid
+from ChessPosition import (POSITION_SIZE, pack_position, unpack_position, encode_move, decode_move, piece_types,
+                           square_index, square_position)
+
+# Marks a missing link (no parent, child or sibling)
+NO_NODE = -1
+
+
+# Packs the captured pieces of the board, which pack_position leaves out, into 2 bytes each: the piece type (its index
+# in piece_types, plus 8 for black) and the square it was captured on
+def pack_captured_pieces(board):
+    return bytes(byte for piece in board if piece.is_captured()
+                 for byte in [piece_types.index(type(piece)) + (0 if piece.is_white() else 8),
+                              square_index(piece.get_position())])
+
+
+# Recreates the pieces packed by pack_captured_pieces, marked as captured. Returns a list of the pieces.
+def unpack_captured_pieces(packed_pieces):
+    pieces = []
+    for offset in range(0, len(packed_pieces), 2):
+        piece = piece_types[packed_pieces[offset] % 8](packed_pieces[offset] < 8,
+                                                       square_position(packed_pieces[offset + 1]))
+        piece.capture()
+        pieces.append(piece)
+    return pieces
+
+
+# A game stored as a tree of variations, like an analysis board. Every node is a position reached by playing one move
+# from its parent, and the root is the starting position. Nodes don't keep a copy of the board: each one is just a
+# 16-bit move (see encode_move) and links to its parent, first child and next sibling, stored in flat arrays (16 bytes
+# per node in all). Every checkpoint_interval plies, the packed position (see pack_position) is stored as well, along
+# with the captured pieces (which it leaves out, but the board still shows), so any node's position is rebuilt by unpacking the nearest checkpoint above it and replaying at most checkpoint_interval - 1
+# moves. The tree keeps the board of the node it is currently on (the board it was given for the root), which changes
+# as moves are played or taken back.
+class VariationTree:
+    def __init__(self, board, is_white_turn=True, move_count=1, checkpoint_interval=8):
+        self._board = board
+        self._root_is_white_turn = is_white_turn
+        self._root_move_count = move_count
+        self._checkpoint_interval = checkpoint_interval
+
+        # One entry per node, the root being node 0 (its move is unused)
+        self._moves = array("H", [0])
+        self._depths = array("H", [0])
+        self._parents = array("i", [NO_NODE])
+        self._first_children = array("i", [NO_NODE])
+        self._next_siblings = array("i", [NO_NODE])
+
+        self._current = 0
+        self._checkpoints = {0: self._pack_board()}  # Maps node numbers to (packed position, packed captured pieces)
+
+    def get_board(self):
+        return self._board
+
+    def get_current_node(self):
+        return self._current
+
+    def get_node_count(self):
+        return len(self._moves)
+
+    # Whose turn it is in the position of the current node
+    def is_white_turn(self):
+        return self._root_is_white_turn == (self._depths[self._current] % 2 == 0)
+
+    # Number of the move about to be played in the position of the current node
+    def get_move_count(self):
+        return self._root_move_count + self._depths[self._current]
+
+    def get_parent(self, node):
+        return self._parents[node]
+
+    def get_depth(self, node):
+        return self._depths[node]
+
+    # Returns the move that leads to the node, as (origin, destination, promotion_type)
+    def get_move(self, node):
+        return decode_move(self._moves[node])
+
+    # Returns the nodes reached from the node, the first one being its main line
+    def get_children(self, node):
+        children = []
+        child = self._first_children[node]
+        while child != NO_NODE:
+            children.append(child)
+            child = self._next_siblings[child]
+        return children
+
+    # Returns the moves leading from the root to the node
+    def get_path(self, node):
+        moves = []
+        while node != 0:
+            moves.append(self.get_move(node))
+            node = self._parents[node]
+        moves.reverse()
+        return moves
+
+    # Returns the nodes of the main line from the node on (following the first child each time)
+    def get_main_line(self, node=0):
+        line = []
+        while self._first_children[node] != NO_NODE:
+            node = self._first_children[node]
+            line.append(node)
+        return line
+
+    # Approximate number of bytes used by the tree (the node arrays and the checkpoints)
+    def get_memory_usage(self):
+        node_bytes = sum(column.itemsize * len(column) for column in
+                         [self._moves, self._depths, self._parents, self._first_children, self._next_siblings])
+        return node_bytes + sum(POSITION_SIZE + len(captured_pieces)
+                                for packed_position, captured_pieces in self._checkpoints.values())
+
+    # Validates a move in the current position and plays it, raising ValueError (with the message from error_messages)
+    # if it is invalid. Pawns reaching the end of the board are promoted to promotion_type (a queen if not given).
+    # Returns the node reached.
+    def play(self, origin, destination, promotion_type=None):
+        origin, destination = list(origin), list(destination)
+        piece = next((piece for piece in self._board if piece.get_position() == list(origin)
+                      and not piece.is_captured()), None)
+        if piece is None:
+            raise ValueError(error_messages[2])
+        error_code = move_is_invalid(self._board, piece, destination, self.is_white_turn(), self.get_move_count())
+        if error_code:
+            raise ValueError(error_messages[error_code])
+
+        # Only record a promotion type if the pawn was actually promoted
+        moved_type = type(piece)
+        piece = play_move(self._board, origin, destination, self.get_move_count(), promotion_type)
+        return self.record_move(origin, destination, type(piece) if type(piece) is not moved_type else None)
+
+    # Records a move that has already been made on the tree's board (i.e. by the game loop, which executes moves
+    # itself). If the current node already has a child for the move, the tree moves to it, otherwise a new variation
+    # is started. Returns the node reached.
+    def record_move(self, origin, destination, promotion_type=None):
+        encoded_move = encode_move(origin, destination, promotion_type)
+
+        # Follow the existing child for this move, if there is one
+        for child in self.get_children(self._current):
+            if self._moves[child] == encoded_move:
+                self._current = child
+                return child
+
+        # Otherwise add a new node as the last child
+        node = len(self._moves)
+        self._moves.append(encoded_move)
+        self._depths.append(self._depths[self._current] + 1)
+        self._parents.append(self._current)
+        self._first_children.append(NO_NODE)
+        self._next_siblings.append(NO_NODE)
+
+        children = self.get_children(self._current)
+        if children:
+            self._next_siblings[children[-1]] = node
+        else:
+            self._first_children[self._current] = node
+
+        self._current = node
+        if self._depths[node] % self._checkpoint_interval == 0:
+            self._checkpoints[node] = self._pack_board()
+        return node
+
+    # Takes back the move that led to the current node. The variation is kept, so it can be played again or branched
+    # from. Returns the node reached, or raises ValueError at the root.
+    def undo(self):
+        if self._current == 0:
+            raise ValueError("There is no move to take back.")
+        return self.go_to(self._parents[self._current])
+
+    # Moves forward along one of the current node's variations (the main line by default)
+    def redo(self, variation=0):
+        children = self.get_children(self._current)
+        if variation >= len(children):
+            raise ValueError("There is no move to go forward to.")
+        return self.go_to(children[variation])
+
+    # Makes the node the current one, rebuilding its position from the nearest checkpoint above it. The board keeps
+    # its identity (its contents are replaced), so anyone holding it sees the new position. Returns the node.
+    def go_to(self, node):
+        replay = []
+        checkpoint = node
+        while checkpoint not in self._checkpoints:
+            replay.append(checkpoint)
+            checkpoint = self._parents[checkpoint]
+
+        packed_position, captured_pieces = self._checkpoints[checkpoint]
+        board, is_white_turn, move_count = unpack_position(packed_position, 0)
+        board = unpack_captured_pieces(captured_pieces) + board
+        for replayed_node in reversed(replay):
+            origin, destination, promotion_type = decode_move(self._moves[replayed_node])
+            play_move(board, origin, destination, move_count, promotion_type)
+            move_count += 1
+
+        self._board[:] = board
+        self._current = node
+        return node
+
+    # Packs the current board into a checkpoint. Returns (packed position, packed captured pieces).
+    def _pack_board(self):
+        packed_position = bytearray(POSITION_SIZE)
+        pack_position(packed_position, 0, self._board, self.is_white_turn(), self.get_move_count())
+        return bytes(packed_position), pack_captured_pieces(self._board)
@@ -0,0 +1,141 @@
+# Compares the binary game archive (ChessArchive.py) with PGN text: file size, time to read every game, and time to
+# read a single game from the end of the collection.
+# Run from the top of the repository with: python -m benchmarks.archive_benchmark
+import argparse
+import os
+import random
+import tempfile
+import time
+from ChessPieces import Bishop, Knight, Rook, Queen
+from ChessGame import play_random_game
+from ChessArchive import GameArchiveWriter, GameArchiveReader
+
+# Letters used for promotions in PGN move text
+promotion_letters = {Queen: "q", Rook: "r", Bishop: "b", Knight: "n"}
+promotion_types = {letter: piece_type for piece_type, letter in promotion_letters.items()}
+
+
+# Converts a [rank, file] position to a square name (i.e. [4, 1] -> "e2")
+def square_name(position):
+    return chr(position[0] + 97) + chr(position[1] + 49)
+
+
+# Writes the games as PGN text. Moves are written in coordinate notation (i.e. "e2e4", "e7e8q"), which is accepted by
+# most PGN tools and needs no move generation to read back.
+def write_pgn(path, games):
+    with open(path, "w", encoding="utf-8") as pgn_file:
+        for moves, result, metadata in games:
+            for key, value in metadata.items():
+                pgn_file.write(f"[{key} \"{value}\"]\n")
+            pgn_file.write(f"[Result \"{result}\"]\n\n")
+
+            move_text = []
+            for ply, (origin, destination, promotion_type) in enumerate(moves):
+                if ply % 2 == 0:
+                    move_text.append(f"{ply // 2 + 1}.")
+                move_text.append(square_name(origin) + square_name(destination)
+                                 + promotion_letters.get(promotion_type, ""))
+            move_text.append(result)
+            pgn_file.write(" ".join(move_text) + "\n\n")
+
+
+# Reads every game from a PGN file written by write_pgn
+def read_pgn(path):
+    games = []
+    metadata = {}
+    with open(path, encoding="utf-8") as pgn_file:
+        for line in pgn_file:
+            line = line.strip()
+            if not line:
+                continue
+
+            # Tag pairs
+            if line.startswith("["):
+                key, value = line[1:-1].split(" ", 1)
+                metadata[key] = value.strip("\"")
+                continue
+
+            # Move text
+            moves = []
+            for token in line.split()[:-1]:
+                if token.endswith("."):
+                    continue
+                moves.append(([ord(token[0]) - 97, ord(token[1]) - 49], [ord(token[2]) - 97, ord(token[3]) - 49],
+                              promotion_types.get(token[4:])))
+            result = metadata.pop("Result")
+            games.append((moves, result, metadata))
+            metadata = {}
+    return games
+
+
+# Returns the number of seconds taken to call function
+def time_call(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the binary game archive with PGN text.")
+    parser.add_argument("--games", type=int, default=10, help="number of distinct random games to play")
+    parser.add_argument("--copies", type=int, default=200, help="how many times each game is repeated in the files")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Playing games is slow, so a few are played and then repeated to make a bigger collection
+    rng = random.Random(args.seed)
+    distinct_games = []
+    for game_number in range(args.games):
+        moves, result = play_random_game(rng)
+        distinct_games.append((moves, result, {"Event": "Random game", "Round": str(game_number + 1)}))
+    games = distinct_games * args.copies
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive_path = os.path.join(directory, "games.chsa")
+        pgn_path = os.path.join(directory, "games.pgn")
+
+        # Write both formats
+        def write_archive():
+            with GameArchiveWriter(archive_path) as writer:
+                for moves, result, metadata in games:
+                    writer.write_game(moves, result, metadata)
+
+        archive_write_time = time_call(write_archive)
+        pgn_write_time = time_call(lambda: write_pgn(pgn_path, games))
+
+        # Read every game back
+        def read_archive():
+            with GameArchiveReader(archive_path) as reader:
+                return [game.get_moves() for game in reader]
+
+        archive_read_time = time_call(read_archive)
+        pgn_read_time = time_call(lambda: read_pgn(pgn_path))
+
+        # Read only the last game. The archive can jump straight to it, PGN has to be read from the start
+        def read_last_archive_game():
+            with GameArchiveReader(archive_path) as reader:
+                return reader.read_game(len(reader) - 1)
+
+        archive_seek_time = time_call(read_last_archive_game)
+        pgn_seek_time = time_call(lambda: read_pgn(pgn_path)[-1])
+
+        # Make sure nothing was lost along the way
+        with GameArchiveReader(archive_path) as reader:
+            assert [(game.get_moves(), game.get_result(), game.get_metadata()) for game in reader] == games
+
+        archive_size = os.path.getsize(archive_path)
+        pgn_size = os.path.getsize(pgn_path)
+
+    plies = sum(len(moves) for moves, result, metadata in games)
+    print(f"{len(games)} games, {plies} moves\n")
+    print(f"{'':16}{'archive':>12}{'PGN':>12}{'ratio':>8}")
+    print(f"{'size (bytes)':16}{archive_size:>12}{pgn_size:>12}{pgn_size / archive_size:>8.1f}")
+    print(f"{'bytes per move':16}{archive_size / plies:>12.2f}{pgn_size / plies:>12.2f}")
+    for label, archive_time, pgn_time in [("write (s)", archive_write_time, pgn_write_time),
+                                          ("read all (s)", archive_read_time, pgn_read_time),
+                                          ("read last (s)", archive_seek_time, pgn_seek_time)]:
+        print(f"{label:16}{archive_time:>12.4f}{pgn_time:>12.4f}{pgn_time / archive_time:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Measures how long a fresh Python process takes to import ChessGame (the cold start of the game, before the welcome
+# message is shown), and fails if it takes longer than a target. Every run is a new process, so nothing is shared
+# between runs except what is on disk (the bytecode caches and the table cache, see ChessTables), as on a real launch.
+# Only the standard library is needed. Run from the top of the repository with:
+#     python -m benchmarks.import_benchmark                      compare the median import time with the target
+#     python -m benchmarks.import_benchmark --no-table-cache     the same, rebuilding the table cache on every run
+#     python -m benchmarks.import_benchmark --modules            also list the modules that take longest to import
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import ChessTables
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Default limit for the median import time, in milliseconds
+TARGET_MS = 25.0
+
+# Run in the new process: times the import alone (leaving out the start of the interpreter) and prints it in seconds
+IMPORT_SCRIPT = "import time\nstart = time.perf_counter()\nimport {module}\nprint(time.perf_counter() - start)"
+
+
+# Returns the environment the imports run in. Bytecode is always written, since a normal launch reads it from the
+# bytecode caches rather than compiling every module again.
+def get_environment():
+    environment = dict(os.environ)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    environment["PYTHONPATH"] = REPOSITORY_PATH
+    return environment
+
+
+# Imports the module in a new process and returns how long the import took, in seconds
+def time_import(module):
+    result = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(module=module)], env=get_environment(),
+                            cwd=REPOSITORY_PATH, capture_output=True, text=True, check=True)
+    return float(result.stdout)
+
+
+# Runs a statement in a new process with -X importtime. Returns a dictionary mapping the name of every module imported
+# to its own import time (leaving out the modules it imports) in seconds.
+def get_import_times(statement):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], env=get_environment(),
+                            cwd=REPOSITORY_PATH, capture_output=True, text=True, check=True)
+    import_times = {}
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[0].split()[-1].isdigit():
+            import_times[fields[2].strip()] = int(fields[0].split()[-1]) / 1e6
+    return import_times
+
+
+# Returns (module name, own import time in seconds) for each module imported by the module but not by the interpreter
+# itself as it starts, slowest first
+def get_module_times(module):
+    startup_modules = get_import_times("pass")
+    import_times = get_import_times(f"import {module}")
+    return sorted([(name, seconds) for name, seconds in import_times.items() if name not in startup_modules],
+                  key=lambda module_time: module_time[1], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the cold start of the game and compare it with a target.")
+    parser.add_argument("--module", default="ChessGame", help="module to import")
+    parser.add_argument("--runs", type=int, default=20, help="number of fresh processes to time")
+    parser.add_argument("--target", type=float, default=TARGET_MS, help="limit for the median import time in ms")
+    parser.add_argument("--no-table-cache", action="store_true",
+                        help="delete the table cache before every run, as on the very first launch")
+    parser.add_argument("--modules", action="store_true", help="list the modules that take longest to import")
+    args = parser.parse_args()
+
+    time_import(args.module)  # Warm up, so the bytecode and table caches exist
+
+    timings = []
+    for run_number in range(args.runs):
+        if args.no_table_cache and os.path.exists(ChessTables.CACHE_PATH):
+            os.remove(ChessTables.CACHE_PATH)
+        timings.append(time_import(args.module))
+
+    median = statistics.median(timings)
+    print(f"import {args.module}: median {median * 1e3:.1f} ms, best {min(timings) * 1e3:.1f} ms, "
+          f"worst {max(timings) * 1e3:.1f} ms over {args.runs} run(s)")
+
+    if args.modules:
+        print(f"\n{'module':32}{'own time':>12}")
+        for module, seconds in get_module_times(args.module)[:15]:
+            print(f"{module:32}{seconds * 1e3:>9.2f} ms")
+        print()
+
+    if median * 1e3 > args.target:
+        print(f"Slower than the target of {args.target:.1f} ms.")
+        raise SystemExit(1)
+    print(f"Within the target of {args.target:.1f} ms.")
+
+
+if __name__ == "__main__":
+    main()
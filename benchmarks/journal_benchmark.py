@@ -0,0 +1,71 @@
+# Measures the move journal (see ChessJournal): how many moves per second can be recorded when one game or many games
+# record at the same time (so flushes to disk are shared between games), and how long recovery takes with and without
+# snapshots. The journal is written to a temporary directory, which should be on the disk being measured (set TMPDIR).
+# Only the standard library is needed. Run from the top of the repository with:
+#     python -m benchmarks.journal_benchmark
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from ChessGame import play_random_game
+from ChessJournal import RECORD_SIZE, MoveJournal, recover_games, journal_header_format
+
+
+# Records every game in a journal, each game on its own thread. Returns (seconds taken, records written, flushes).
+def record_games(path, games, snapshot_interval):
+    with MoveJournal(path, snapshot_interval) as journal:
+
+        def record_game(game_number, moves):
+            journal.start_game(game_number)
+            for move in moves:
+                journal.record_move(game_number, *move)
+
+        threads = [threading.Thread(target=record_game, args=(game_number, moves))
+                   for game_number, moves in enumerate(games)]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+        return elapsed, journal.get_record_count(), journal.get_flush_count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recording and recovery speed of the move journal.")
+    parser.add_argument("--games", type=int, nargs="+", default=[1, 4, 16, 64],
+                        help="numbers of games recording at the same time")
+    parser.add_argument("--plies", type=int, default=60, help="moves per game")
+    parser.add_argument("--snapshot-interval", type=int, default=1000, help="records between snapshots")
+    args = parser.parse_args()
+
+    # A few random games, reused for every game number, since generating them is slower than recording them
+    sample_games = [play_random_game(random.Random(seed), args.plies)[0] for seed in range(4)]
+
+    print(f"{'games':>6}{'records':>10}{'flushes':>10}{'per flush':>11}{'records/s':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for game_count in args.games:
+            path = os.path.join(directory, f"{game_count}.journal")
+            games = [sample_games[game_number % len(sample_games)] for game_number in range(game_count)]
+            elapsed, records, flushes = record_games(path, games, args.snapshot_interval)
+            print(f"{game_count:>6}{records:>10}{flushes:>10}{records / flushes:>11.1f}{records / elapsed:>12.0f}")
+
+        # Recovery replays every record since the last snapshot, so snapshots keep it short however long the games are
+        game_count = max(args.games)
+        games = [sample_games[game_number % len(sample_games)] for game_number in range(game_count)]
+        print(f"\nRecovering {game_count} unfinished games of {args.plies} moves:")
+        for snapshot_interval in [args.snapshot_interval, 10 ** 9]:
+            path = os.path.join(directory, f"recovery_{snapshot_interval}.journal")
+            record_games(path, games, snapshot_interval)
+            start_time = time.perf_counter()
+            recover_games(path)
+            elapsed = time.perf_counter() - start_time
+            records = (os.path.getsize(path) - journal_header_format.size) // RECORD_SIZE
+            label = "without snapshots" if snapshot_interval == 10 ** 9 else f"snapshot every {snapshot_interval}"
+            print(f"    {label:28}{records:>8} records replayed in {elapsed * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# Times the hot paths of the game (drawing the board, validating moves, looking for check, detecting the end of the
+# game, and whole games played through main) and compares them with baseline timings stored in a JSON file. Any
+# benchmark that got slower than the baseline by more than the threshold is reported, and the exit code is 1.
+# Only the standard library is needed. Run from the top of the repository with:
+#     python -m benchmarks.regression_benchmark             compare with the stored baselines
+#     python -m benchmarks.regression_benchmark --update    store new baselines (i.e. after an intended change)
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import time
+import ChessGame
+from ChessPieces import King
+from ChessPosition import MAX_RANK, MAX_FILE, board_from_fen
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Positions from the middle of a game, with most pieces still on the board
+TYPICAL_POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rn1qkbnr/1b1pp1p1/ppp2p2/7p/3P4/N1P5/PP1KPPPP/R1BQ1BNR w kq - 0 7",
+    "rnkq1bn1/1b2p1p1/ppp2p2/3p4/3P1P2/N1PK2p1/PPQ1P2r/R1B2BNR w - - 0 13",
+    "r1kq2n1/1b1n2p1/1pp1pp2/p2p4/2PP1P2/bQ5B/PP1KP1p1/1RB4R w - - 0 19",
+]
+
+# Positions where the side to move is in check (most of them checkmated), so every move has to be tested for leaving
+# the king in check, and detecting the end of the game does the most work
+MATE_POSITIONS = [
+    "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3",
+    "r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 0 4",
+    "3R2k1/5ppp/8/8/8/8/5PPP/6K1 b - - 0 1",
+    "6rk/5Npp/8/8/8/8/5PPP/6K1 b - - 0 1",
+    "rnbqkbnr/ppp2ppp/3p4/1B2p3/4P3/8/PPPP1PPP/RNBQK1NR b KQkq - 1 3",
+]
+
+# Games played through main, as the moves typed in by the players
+SCRIPTED_GAMES = {
+    "fools_mate": "f2f3 e7e5 g2g4 d8h4",
+    "scholars_mate": "e2e4 e7e5 f1c4 b8c6 d1h5 g8f6 h5f7",
+    "long_game": "d2d4 b7b6 b1a3 c7c6 c2c3 h7h5 d1b3 a7a6 e1d2 c8b7 b3d1 f7f6 d2e3 d7d5 g2g4 e8d7 e3d2 h5g4 f2f4 g4g3 "
+                 "d1c2 d7c8 d2d3 h8h2 c3c4 b8d7 g1h3 h2h3 a1b1 e7e6 f1h3 g3g2 d3d2 f8a3 c2b3 a6a5 b3b5 a8b8 b5d5 d7e5 "
+                 "h3g4 d8c7 d5c5 g7g6 h1h7 e5d3 b2b4 b6b5 c5h5 g8e7 h5h6 c8d7 g4h5 b8a8 h6g5 a8c8 e2d3 d7e8 h7h8 e8f7 "
+                 "g5g2 c8b8 h8e8 e7c8 g2f2 c7f4 d2e2 f4d4 e2f3 d4h4 e8g8 h4h5 f3e3 g6g5 g8h8 h5d1 e3d4 a3b4 b1b4 c8d6 "
+                 "h8d8 d1a4 f2f3 a5b4 f3e4 a4a8 d8c8 d6e4 c8f8 c6c5 c1g5 e4d2 c4b5 b8c8 d4c3 d2c4 c3b4 b7c6 d3c4 c6e4 "
+                 "g5e3 a8a3 b5b6 c8a8 b4b5 e4c6 b5a5 a3b4 e3g1 a8d8 g1h2 d8f8 a5a6 c6d5 a2a4 f8b8 a4a5 b8g8 a6a7 g8a8",
+}
+
+
+# Raised when a scripted game runs out of input
+class ScriptEnded(Exception):
+    pass
+
+
+# Loads a position from FEN. Returns (board, is_white_turn, move_count)
+def load_position(fen):
+    board, is_white_turn, move_count, halfmove_clock = board_from_fen(fen)
+    return board, is_white_turn, move_count
+
+
+# Returns every (piece, destination) pair for the side to move that follows the piece's movement rules, so each one
+# gets all the way through move_is_invalid's checks (or close to it)
+def get_candidate_moves(board, is_white_turn):
+    return [(piece, [rank, file]) for piece in board if not piece.is_captured() and piece.is_white() == is_white_turn
+            for rank in range(MAX_RANK) for file in range(MAX_FILE) if piece.is_legal_move([rank, file])]
+
+
+# Each benchmark below prepares its data and returns a function that runs the workload once, along with how many
+# operations the workload does, so results are reported as the time per operation
+
+def benchmark_print_board():
+    boards = [load_position(fen)[0] for fen in TYPICAL_POSITIONS]
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for board in boards:
+                ChessGame.print_board(board)
+    return run, len(boards)
+
+
+def validate_moves_benchmark(fens):
+    work = []
+    for fen in fens:
+        board, is_white_turn, move_count = load_position(fen)
+        work.append((board, is_white_turn, move_count, get_candidate_moves(board, is_white_turn)))
+
+    def run():
+        for board, is_white_turn, move_count, moves in work:
+            for piece, destination in moves:
+                ChessGame.move_is_invalid(board, piece, destination, is_white_turn, move_count)
+    return run, sum(len(moves) for board, is_white_turn, move_count, moves in work)
+
+
+def benchmark_move_is_invalid_typical():
+    return validate_moves_benchmark(TYPICAL_POSITIONS)
+
+
+def benchmark_move_is_invalid_mate():
+    return validate_moves_benchmark(MATE_POSITIONS)
+
+
+def benchmark_piece_threatening_king():
+    work = []
+    for fen in TYPICAL_POSITIONS + MATE_POSITIONS:
+        board, is_white_turn, move_count = load_position(fen)
+        work.extend((board, piece, move_count) for piece in board if isinstance(piece, King))
+
+    def run():
+        for board, king, move_count in work:
+            ChessGame.piece_threatening_king(board, king, move_count)
+    return run, len(work)
+
+
+def benchmark_is_game_over():
+    work = []
+    for fen in TYPICAL_POSITIONS + MATE_POSITIONS:
+        board, is_white_turn, move_count = load_position(fen)
+        king = next(piece for piece in board if isinstance(piece, King) and piece.is_white() == is_white_turn)
+        work.append((board, king, ChessGame.piece_threatening_king(board, king, move_count), move_count))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for board, king, threatening_piece, move_count in work:
+                ChessGame.is_game_over(board, king, threatening_piece, move_count)
+    return run, len(work)
+
+
+# Plays a game through main, typing in the moves of the script (and pressing Enter at the welcome message)
+def play_scripted_game(moves):
+    lines = iter([""] + [f"{move[0:2]} {move[2:4]}" for move in moves.split()])
+
+    def scripted_input(prompt=""):
+        line = next(lines, None)
+        if line is None:
+            raise ScriptEnded()
+        return line
+
+    original_input = builtins.input
+    builtins.input = scripted_input
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ChessGame.main()
+    except ScriptEnded:
+        pass
+    finally:
+        builtins.input = original_input
+
+
+def scripted_game_benchmark(moves):
+    return (lambda: play_scripted_game(moves)), 1
+
+
+BENCHMARKS = {
+    "print_board": benchmark_print_board,
+    "move_is_invalid_typical": benchmark_move_is_invalid_typical,
+    "move_is_invalid_mate": benchmark_move_is_invalid_mate,
+    "piece_threatening_king": benchmark_piece_threatening_king,
+    "is_game_over": benchmark_is_game_over,
+}
+for game_name, game_moves in SCRIPTED_GAMES.items():
+    BENCHMARKS[f"game_{game_name}"] = lambda game_moves=game_moves: scripted_game_benchmark(game_moves)
+
+
+# Runs a benchmark and returns the time per operation in seconds. The workload is repeated until it has run for at
+# least min_time, and this is done repeat times; the fastest round is used, since it is the least disturbed by anything
+# else running on the machine. CPU time of this process is measured rather than wall time, for the same reason.
+def time_benchmark(benchmark, repeat=5, min_time=0.2):
+    run, operations = benchmark()
+    run()  # Warm up
+
+    # Find how many times the workload has to run to take at least min_time
+    loops = 1
+    while True:
+        start = time.process_time()
+        for loop in range(loops):
+            run()
+        elapsed = time.process_time() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2
+
+    best = elapsed
+    for round_number in range(repeat - 1):
+        start = time.process_time()
+        for loop in range(loops):
+            run()
+        best = min(best, time.process_time() - start)
+    return best / (loops * operations)
+
+
+# Formats a time in seconds with a unit that suits it
+def format_time(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as baseline_file:
+        return json.load(baseline_file)["benchmarks"]
+
+
+def save_baselines(path, timings):
+    with open(path, "w", encoding="utf-8") as baseline_file:
+        json.dump({"python": platform.python_version(), "machine": platform.machine(), "benchmarks": timings},
+                  baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+
+
+# Prints each benchmark's time next to its baseline. Returns the names of the benchmarks that got
+# slower than their baseline by more than threshold (i.e. 0.2 for 20% slower).
+def compare_with_baselines(timings, baselines, threshold):
+    regressions = []
+    print(f"{'benchmark':28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, seconds in timings.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:28}{'-':>12}{format_time(seconds):>12}{'new':>10}")
+            continue
+        change = seconds / baseline - 1
+        status = ""
+        if change > threshold:
+            regressions.append(name)
+            status = "  SLOWER"
+        print(f"{name:28}{format_time(baseline):>12}{format_time(seconds):>12}{change:>+10.1%}{status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the hot paths of the game and compare them with baselines.")
+    parser.add_argument("--update", action="store_true", help="store the timings as the new baselines")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="how much slower than its baseline a benchmark may get (0.2 = 20%%)")
+    parser.add_argument("--baselines", default=BASELINE_PATH, help="JSON file with the baseline timings")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per benchmark (the fastest is used)")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run only these benchmarks")
+    args = parser.parse_args()
+
+    timings = {}
+    for name in args.only or BENCHMARKS:
+        timings[name] = time_benchmark(BENCHMARKS[name], args.repeat)
+
+    if args.update:
+        save_baselines(args.baselines, {**load_baselines(args.baselines), **timings})
+        for name, seconds in timings.items():
+            print(f"{name:28}{format_time(seconds):>12}")
+        print(f"\nBaselines saved to {args.baselines}")
+        return
+
+    regressions = compare_with_baselines(timings, load_baselines(args.baselines), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) got more than {args.threshold:.0%} slower: {', '.join(regressions)}")
+        raise SystemExit(1)
+    print(f"\nNo benchmark got more than {args.threshold:.0%} slower.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Compares two ways of getting positions to worker processes: pickling the board lists (what multiprocessing does by
+# default) and a SharedPositionBatch, where only the batch name and a range of positions are sent.
+# Each worker computes the hash of its positions, so the time is mostly spent moving positions around. The batch is
+# packed once and then worked through several times, as when the same positions are analysed in several passes.
+# Run from the top of the repository with: python -m benchmarks.shared_memory_benchmark
+import argparse
+import multiprocessing
+import pickle
+import random
+import time
+from ChessGame import create_board, play_move, play_random_game
+from ChessPosition import POSITION_SIZE, position_hash, pack_position, unpack_position
+from ChessSharedBatch import SharedPositionBatch
+
+
+# Worker for the pickling approach: receives the positions themselves
+def hash_pickled_positions(positions):
+    return [position_hash(board, is_white_turn, move_count) for board, is_white_turn, move_count in positions]
+
+
+# Worker for the shared memory approach: receives the batch name and the range of positions to read
+def hash_shared_positions(task):
+    name, capacity, start, end = task
+    batch = SharedPositionBatch.attach(name, capacity)
+    hashes = []
+    for index in range(start, end):
+        board, is_white_turn, move_count = batch.read_position(index)
+        hashes.append(position_hash(board, is_white_turn, move_count))
+    batch.close()
+    return hashes
+
+
+# Plays random games and collects (board, is_white_turn, move_count) for every position reached. Each position is
+# copied (through pack_position), since later moves change the pieces on the game's board
+def collect_positions(position_count, seed):
+    rng = random.Random(seed)
+    buffer = bytearray(POSITION_SIZE)
+    positions = []
+    while len(positions) < position_count:
+        moves, result = play_random_game(rng, 80)
+        board = create_board()
+        for move_count, (origin, destination, promotion_type) in enumerate(moves, start=1):
+            play_move(board, origin, destination, move_count, promotion_type)
+            pack_position(buffer, 0, board, move_count % 2 == 0, move_count + 1)
+            positions.append(unpack_position(buffer, 0))
+    return positions[:position_count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pickling positions with a shared memory batch.")
+    parser.add_argument("--positions", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5, help="how many times the workers go through the batch")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    positions = collect_positions(args.positions, args.seed)
+    chunk_size = (len(positions) + args.workers - 1) // args.workers
+    starts = range(0, len(positions), chunk_size)
+
+    with multiprocessing.Pool(args.workers) as pool:
+
+        # Pickling: every round, each position is pickled, sent to a worker and unpickled there
+        start = time.perf_counter()
+        chunks = [positions[index:index + chunk_size] for index in starts]
+        for round_number in range(args.rounds):
+            pickled_hashes = [key for hashes in pool.map(hash_pickled_positions, chunks) for key in hashes]
+        pickle_time = time.perf_counter() - start
+        pickled_bytes = sum(len(pickle.dumps(chunk)) for chunk in chunks)
+
+        # Shared memory: positions are packed once, and every round the workers only receive the batch name and offsets
+        start = time.perf_counter()
+        with SharedPositionBatch(len(positions)) as batch:
+            for index, (board, is_white_turn, move_count) in enumerate(positions):
+                batch.write_position(index, board, is_white_turn, move_count)
+            pack_time = time.perf_counter() - start
+            tasks = [(batch.get_name(), len(positions), index, min(index + chunk_size, len(positions)))
+                     for index in starts]
+            for round_number in range(args.rounds):
+                shared_hashes = [key for hashes in pool.map(hash_shared_positions, tasks) for key in hashes]
+            shared_bytes = sum(len(pickle.dumps(task)) for task in tasks)
+        shared_time = time.perf_counter() - start
+
+    if pickled_hashes != shared_hashes:
+        raise RuntimeError("The two approaches computed different hashes.")
+
+    print(f"{len(positions)} positions, {args.workers} workers, {args.rounds} rounds\n")
+    print(f"{'':26}{'pickle':>12}{'shared':>12}")
+    print(f"{'bytes sent per round':26}{pickled_bytes:>12}{shared_bytes:>12}")
+    print(f"{'total time (s)':26}{pickle_time:>12.3f}{shared_time:>12.3f}")
+    print(f"{'  of which packing (s)':26}{'':>12}{pack_time:>12.3f}")
+    print(f"{'positions/s':26}{len(positions) * args.rounds / pickle_time:>12.0f}"
+          f"{len(positions) * args.rounds / shared_time:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import ChessFuzz
+from ChessPosition import move_from_text
+
+
+# Returns a candidate (see load_candidate) that disagrees with the reference in every position about whether the game
+# is over
+def get_disagreeing_candidate():
+    functions = dict(ChessFuzz.REFERENCE_FUNCTIONS)
+    functions["is_game_over"] = lambda board, king, threatening_piece, move_count: "different"
+    return functions, None
+
+
+# A disagreement that shows up from the starting position is shrunk to no moves at all
+def test_shrink_moves_removes_move_pairs():
+    moves = [move_from_text(text) for text in "g2g3 a7a6".split()]
+    assert ChessFuzz.shrink_moves(get_disagreeing_candidate(), moves, ("is_game_over", True)) == []
+
+
+# Pairs of moves are removed from the middle of the list, not only from its end
+def test_shrink_moves_removes_runs_from_the_middle():
+    moves = [move_from_text(text) for text in "e2e4 e7e5 g1f3 b8c6 f1c4 g8f6 d2d3".split()]
+    probe = ("move_is_invalid", (3, 2), (3, 3))  # Only applies once the d-pawn has moved
+    candidate = ChessFuzz.REFERENCE_FUNCTIONS.copy()
+    candidate["move_is_invalid"] = lambda board, piece, destination, is_white_turn, move_count: -1
+    assert ChessFuzz.shrink_moves((candidate, None), moves, probe) == [move_from_text("d2d3")]
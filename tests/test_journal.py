@@ -0,0 +1,36 @@
+import os
+import threading
+import pytest
+from ChessJournal import MoveJournal, recover_games
+
+
+# A move that breaks the rules is refused before anything is written, so the journal can still be recovered
+def test_invalid_move_is_not_recorded(tmp_path):
+    path = os.path.join(tmp_path, "games.journal")
+    with MoveJournal(path) as journal:
+        journal.start_game(2)
+        with pytest.raises(ValueError):
+            journal.record_move(2, [4, 1], [4, 4])
+        journal.record_move(2, [4, 1], [4, 3])
+        assert journal.get_record_count() == 2
+
+    games = recover_games(path)[0]
+    assert games[2].get_moves() == [([4, 1], [4, 3], None)]
+    MoveJournal(path).close()
+
+
+# If the snapshot can't be written, the call waiting for its record is still woken up (its record was written before
+# the snapshot was started), and every later call fails
+def test_failed_snapshot_fails_journal(tmp_path):
+    path = os.path.join(tmp_path, "games.journal")
+    os.mkdir(f"{path}.snapshot.tmp")  # The snapshot is written under this name, which can't be opened as a file
+    journal = MoveJournal(path, snapshot_interval=1)
+
+    thread = threading.Thread(target=journal.start_game, args=(1,), daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    with pytest.raises(OSError):
+        journal.start_game(2)
+    journal.close()
+    assert list(recover_games(path)[0]) == [1]
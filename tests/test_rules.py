@@ -0,0 +1,102 @@
+from ChessGame import (create_board, move_is_invalid, pawn_captures_properly, execute_move, piece_threatening_king,
+                       is_game_over)
+from ChessPieces import Pawn, Knight, Rook, Queen, King
+
+
+# Returns a piece that has been captured on the given square. Captured pieces stay in the board list, and are put at
+# its start here so every search of the board meets them first.
+def captured(piece):
+    piece.capture()
+    return piece
+
+
+# Returns the first uncaptured piece of the type on the square
+def piece_at(board, piece_type, position):
+    return next(piece for piece in board if isinstance(piece, piece_type) and piece.get_position() == position
+                and not piece.is_captured())
+
+
+# A board with both kings and a black pawn on d5 that has just moved two squares (so white may capture it en passant
+# on move 3) next to a white pawn on e5
+def en_passant_board():
+    black_pawn = Pawn(False, [3, 4])
+    black_pawn.set_has_moved(True)
+    black_pawn.set_move_when_capturable_en_passant(3)
+    white_pawn = Pawn(True, [4, 4])
+    white_pawn.set_has_moved(True)
+    return [King(True, [4, 0]), King(False, [4, 7]), white_pawn, black_pawn]
+
+
+# path_unblocked: a captured piece left on a pawn's destination square doesn't block a straight pawn move
+def test_captured_piece_does_not_block_pawn():
+    board = [captured(Knight(False, [4, 2])), King(True, [4, 0]), King(False, [4, 7]), Pawn(True, [4, 1])]
+    pawn = piece_at(board, Pawn, [4, 1])
+    assert move_is_invalid(board, pawn, [4, 2], True, 1) == 0
+    assert move_is_invalid(board, pawn, [4, 3], True, 1) == 0
+
+
+# pawn_captures_properly: moving diagonally onto a square with only a captured piece on it isn't a capture
+def test_pawn_cannot_capture_captured_piece():
+    board = [captured(Knight(False, [3, 2])), King(True, [4, 0]), King(False, [4, 7]), Pawn(True, [4, 1])]
+    assert not pawn_captures_properly(board, piece_at(board, Pawn, [4, 1]), [3, 2], 1)
+
+
+# pawn_captures_properly: only an uncaptured pawn can be taken en passant
+def test_captured_pawn_cannot_be_taken_en_passant():
+    board = en_passant_board()
+    white_pawn = piece_at(board, Pawn, [4, 4])
+    assert pawn_captures_properly(board, white_pawn, [3, 5], 3)
+
+    piece_at(board, Pawn, [3, 4]).capture()
+    assert not pawn_captures_properly(board, white_pawn, [3, 5], 3)
+
+
+# execute_move: en passant captures the uncaptured pawn beside the moving pawn, not a captured piece on that square
+def test_en_passant_captures_uncaptured_pawn():
+    board = en_passant_board()
+    captured_knight = captured(Knight(True, [3, 4]))
+    board.insert(0, captured_knight)
+    black_pawn = piece_at(board, Pawn, [3, 4])
+
+    assert execute_move(board, piece_at(board, Pawn, [4, 4]), [3, 5], 3) is black_pawn
+    assert black_pawn.is_captured()
+    assert captured_knight.is_captured()
+
+
+# move_leaves_king_in_check: trying a two-square pawn move doesn't leave the pawn capturable en passant
+def test_trying_pawn_move_leaves_en_passant_flag_alone():
+    board = create_board()
+    pawn = piece_at(board, Pawn, [4, 1])
+    assert move_is_invalid(board, pawn, [4, 3], True, 1) == 0
+    assert pawn.get_move_when_capturable_en_passant() == 0
+    assert pawn.get_position() == [4, 1]
+
+
+# piece_threatening_king: a captured piece never gives check
+def test_captured_piece_does_not_give_check():
+    board = [captured(Rook(False, [4, 4])), King(True, [4, 0]), King(False, [0, 7])]
+    assert piece_threatening_king(board, piece_at(board, King, [4, 0]), 1) is None
+
+
+# A back rank mate: the white king on h1 is shut in by its own pawns and checked by the black rook on a1
+def back_rank_mate_board():
+    return [King(True, [7, 0]), Pawn(True, [6, 1]), Pawn(True, [7, 1]), Rook(False, [0, 0]), King(False, [4, 7])]
+
+
+# is_game_over: a captured piece can't capture the checking piece
+def test_captured_piece_cannot_capture_checking_piece():
+    board = [captured(Rook(True, [0, 1]))] + back_rank_mate_board()
+    assert is_game_over(board, piece_at(board, King, [7, 0]), piece_at(board, Rook, [0, 0]), 1)
+
+
+# is_game_over: a captured piece can't block the check
+def test_captured_piece_cannot_block_check():
+    board = [captured(Rook(True, [3, 3]))] + back_rank_mate_board()
+    assert is_game_over(board, piece_at(board, King, [7, 0]), piece_at(board, Rook, [0, 0]), 1)
+
+
+# is_game_over: only uncaptured pieces count when deciding whether the king is the last piece of its color, so a
+# king that can't move is stalemated even if pieces of its color were captured
+def test_stalemate_ignores_captured_pieces():
+    board = [captured(Pawn(True, [5, 5])), King(True, [0, 0]), Queen(False, [1, 2]), King(False, [7, 7])]
+    assert is_game_over(board, piece_at(board, King, [0, 0]), None, 1)
@@ -0,0 +1,34 @@
+import io
+import pytest
+from ChessUCI import UCIEngine
+
+
+# Sends the commands to a new engine. Returns its output.
+def run_commands(commands):
+    output = io.StringIO()
+    engine = UCIEngine(output)
+    for command in commands:
+        assert engine.handle_command(command)
+    engine.handle_command("quit")
+    return output.getvalue()
+
+
+# Moves that can't be read or aren't legal are reported instead of stopping the engine, and it keeps answering
+@pytest.mark.parametrize("command, message", [
+    ("position startpos moves e3e4", "info string illegal move e3e4"),
+    ("position startpos moves e2e4 e2e4", "info string illegal move e2e4"),
+    ("position startpos moves e2", "info string invalid move e2"),
+    ("position fen nonsense", "info string invalid FEN nonsense"),
+    ("position", "info string position must be followed by startpos or fen"),
+])
+def test_bad_position_is_reported(command, message):
+    assert run_commands([command, "isready"]).splitlines() == [message, "readyok"]
+
+
+# The moves before an illegal one are still played, so the engine searches the position reached by them
+def test_moves_before_illegal_move_are_played():
+    engine = UCIEngine(io.StringIO())
+    engine.handle_command("position startpos moves e2e4 e7e5 e1e3")
+    assert engine._is_white_turn
+    assert engine._move_count == 3
+    assert any(piece.get_position() == [4, 3] and piece.is_white() for piece in engine._board)
@@ -0,0 +1,45 @@
+from ChessGame import create_board
+from ChessPieces import Pawn
+from ChessPosition import move_from_text
+from ChessVariations import VariationTree
+
+
+# Returns the captured pieces of the board as (is_white, type, position) tuples, in a fixed order
+def captured_pieces(board):
+    return sorted((piece.is_white(), type(piece).__name__, piece.get_position()) for piece in board
+                  if piece.is_captured())
+
+
+# Plays the moves (in coordinate notation) on the tree
+def play_moves(tree, moves):
+    for text in moves.split():
+        tree.play(*move_from_text(text))
+
+
+# Undoing to a node whose position is rebuilt from a checkpoint after a capture keeps the captured pieces
+def test_undo_past_capture_keeps_captured_pieces():
+    tree = VariationTree(create_board(), checkpoint_interval=8)
+    play_moves(tree, "e2e4 d7d5 e4d5 g8f6 g1f3 f6d5 b1c3 b8c6 a2a3 a7a6")
+    captured = captured_pieces(tree.get_board())
+    assert captured == [(False, "Pawn", [3, 4]), (True, "Pawn", [3, 4])]
+
+    tree.undo()
+    assert captured_pieces(tree.get_board()) == captured
+    tree.redo()
+    assert captured_pieces(tree.get_board()) == captured
+
+
+# Going back before a capture brings the piece back, and going forward past it captures it again
+def test_go_to_before_and_after_capture():
+    tree = VariationTree(create_board(), checkpoint_interval=2)
+    play_moves(tree, "e2e4 d7d5 e4d5 g8f6")
+    after_capture = tree.get_current_node()
+    board = tree.get_board()
+
+    tree.go_to(tree.get_parent(tree.get_parent(after_capture)))
+    assert captured_pieces(board) == []
+    assert any(isinstance(piece, Pawn) and piece.get_position() == [3, 4] and not piece.is_white()
+               for piece in board if not piece.is_captured())
+
+    tree.go_to(after_capture)
+    assert captured_pieces(board) == [(False, "Pawn", [3, 4])]